@@ -6,13 +6,19 @@ import json
 import calendar
 import concurrent.futures
 from datetime import datetime
-import requests
 from google.cloud import bigquery
+from binanceclient import BinanceClient
+from klinestaging import load_klines
+from klinestore import KlineStore
 
 parameters = json.load(open("parameters.json"))
 project = parameters["project"]
 coin_list = parameters["coin_list"]
 bq_client = bigquery.Client()
+binance_client = BinanceClient(pool_size=len(coin_list))
+kline_store = None
+if parameters["kline_store"]:
+    kline_store = KlineStore(parameters["kline_store"])
 
 
 def get_previous_day(coin: str):
@@ -21,57 +27,36 @@ def get_previous_day(coin: str):
     end_time = calendar.timegm(today.timetuple()) * 1000
     symbol = coin + "USDT"
     url = (
-        "https://api.binance.com/api/v3/klines?interval=1m&limit=500"
+        "/api/v3/klines?interval=1m&limit=500"
         f"&symbol={symbol}"
         f"&endTime={end_time}"
     )
-    response = requests.get(url, headers={}, data={})
+    response = binance_client.get(url)
     first_batch = json.loads(response.content)
-    insert_data(coin, first_batch)
     url = (
-        "https://api.binance.com/api/v3/klines?interval=1m&limit=500"
+        "/api/v3/klines?interval=1m&limit=500"
         f"&symbol={symbol}"
         f"&endTime={min(x[0] for x in first_batch)-60000}"
     )
-    response = requests.get(url, headers={}, data={})
+    response = binance_client.get(url)
     second_batch = json.loads(response.content)
-    insert_data(coin, second_batch)
     url = (
-        "https://api.binance.com/api/v3/klines?interval=1m&limit=440"
+        "/api/v3/klines?interval=1m&limit=440"
         f"&symbol={symbol}"
         f"&endTime={min(x[0] for x in second_batch)-60000}"
     )
-    response = requests.get(url, headers={}, data={})
-    insert_data(coin, json.loads(response.content))
+    response = binance_client.get(url)
+    insert_data(coin, first_batch + second_batch + json.loads(response.content))
 
 
 def insert_data(coin, data):
-    """Insert the provided data lines in bigquery"""
-    insertion = [
-        "(TIMESTAMP_MILLIS("
-        + str(element[0])
-        + "),"
-        + ", ".join(map(str, element[:-1]))
-        + ")"
-        for element in data
-    ]
-
-    bq_client.query(
-        f"INSERT INTO `{project}.binance_data.minute_" + coin.lower() + "`"
-        "(minute_timestamp,"
-        " open_time,"
-        " open,"
-        " high,"
-        " low,"
-        " close,"
-        " volume,"
-        " close_time,"
-        " quote_asset_volume,"
-        " number_of_trades,"
-        " taker_buy_base_asset_volume,"
-        " taker_buy_quote_asset_volume)"
-        "VALUES" + ",".join(insertion) + ";"
-    )
+    """
+    Insert the provided data lines in bigquery with a single load job, and in
+    the kline store when one is configured
+    """
+    load_klines(bq_client, f"{project}.binance_data.minute_{coin.lower()}", data)
+    if kline_store is not None:
+        kline_store.write(coin + "USDT", data)
 
 
 def main(event, context):
@@ -1,16 +1,51 @@
 """
 BinanceBot Class module
 """
+import asyncio
+import io
 import json
-import hashlib
 import time
-import hmac
 import concurrent.futures
-from collections import deque
+import functools
+import threading
+from datetime import datetime, timezone
 
-import requests
+import numpy as np
 from google.cloud import bigquery
 from google.cloud import secretmanager
+from google.cloud import storage
+
+from binanceclient import BinanceClient
+from brackets import (
+    CANCELED,
+    FILLED,
+    OPEN,
+    bracket_legs,
+    bracket_outcome,
+    bracket_params,
+    match_bracket,
+)
+from coinvalues import CoinValues
+from execution import OrderExecution, order_fill
+from klinestore import KlineStore
+from ledger import TradeLedger
+from pricehistory import HISTORY_LENGTH, PriceHistory
+from signer import RequestSigner
+from strategy import portfolio_decision
+from timing import Timeline
+from treemodel import TreeModel
+from weightbudget import NORMAL, weight_limit
+
+SNAPSHOT_BLOB = "state/binancebot.npz"
+THRESHOLDS_BLOB = "thresholds.json"
+SUMMARY_TICKS = 60
+# Largest number of klines returned by a request
+KLINES_LIMIT = 1000
+# Longest time span of a request of the order lists of the account, in ms
+ORDER_LISTS_SPAN_MS = 24 * 3600 * 1000
+# Attempts of a flush of the ledger, and delay before the first retry
+FLUSH_ATTEMPTS = 3
+FLUSH_RETRY_SECONDS = 0.5
 
 
 class BinanceBot:
@@ -20,34 +55,104 @@ class BinanceBot:
     parameter file.
     """
 
-    def __init__(self, parameter_file):
+    def __init__(self, parameter_file, binance_client=None):
         self.load_parameters(parameter_file)
-        self.get_asset_settings()
+        self.max_workers = len(self.coin_list) + 6
+        self.binance_client = binance_client or BinanceClient(
+            pool_size=self.max_workers, timeout=self.call_timeout_seconds
+        )
+        self.signer = RequestSigner(self.binance_client, self.recv_window_ms)
+        # Kept across warm invocations, so that a tick does not start threads
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
         self.bq_client = bigquery.Client(project=self.project)
         self.sm_client = secretmanager.SecretManagerServiceClient()
-        self.data_hist = {coin: deque(maxlen=1441) for coin in self.coin_list}
+        self.gcs_client = storage.Client(project=self.project)
+        self.ledger = TradeLedger(self.ledger_path)
+        self.timeline = Timeline()
+        # An exit and an entry per position at most in a decision
+        self.order_execution = OrderExecution(
+            2 * self.max_open_positions, self.timeline
+        )
+        # Taken for every change of the asset quantities and the open trades,
+        # which the orders of a decision change concurrently
+        self.quantities_lock = threading.Lock()
+        self.kline_store = (
+            KlineStore(self.kline_store_path) if self.kline_store_path else None
+        )
+        self.data_hist = {
+            coin: PriceHistory(HISTORY_LENGTH, self.indexes) for coin in self.coin_list
+        }
+        # Time of the last tick which updated the history of each coin
+        self.last_ticks = {coin: 0 for coin in self.coin_list}
+        self.coin_index = {coin: index for index, coin in enumerate(self.coin_list)}
         self.thresholds = {}
+        self.file_thresholds = {}
+        self.thresholds_generation = None
         self.secret = {}
         self.estimations = {}
+        self.models = {}
+        self.model_generations = {}
         self.asset_quantities = {}
-        self.current_open_trade = None
+        self.open_trades = []
+        self.open_brackets = {}
+        self.flush_failed = False
+        self.flush_task = None
+        if not self.load_snapshot():
+            self.get_asset_settings()
+
+    @property
+    def thresholds(self):
+        """Thresholds of the coins, aligned with the coin list"""
+        return self.coin_thresholds
+
+    @thresholds.setter
+    def thresholds(self, values):
+        self.coin_thresholds = CoinValues(self.coin_list, values)
+
+    @property
+    def estimations(self):
+        """Estimations of the coins, aligned with the coin list"""
+        return self.coin_estimations
+
+    @estimations.setter
+    def estimations(self, values):
+        self.coin_estimations = CoinValues(self.coin_list, values)
+
+    @property
+    def current_open_trade(self):
+        """The oldest open trade, or None"""
+        return self.open_trades[0] if self.open_trades else None
+
+    @current_open_trade.setter
+    def current_open_trade(self, trade):
+        with self.quantities_lock:
+            self.open_trades = [trade] if trade else []
 
     def get_asset_settings(self):
         """Load the settings of the binance API for the traded assets"""
         self.asset_params = {}
         for coin in self.coin_list:
             symbol = coin + "USDT"
-            response = requests.get(
-                f"https://api.binance.com/api/v3/exchangeInfo?symbol={symbol}"
+            response = self.binance_client.get(
+                f"/api/v3/exchangeInfo?symbol={symbol}"
             )
+            limit = weight_limit(response.json().get("rateLimits", []))
+            if limit is not None:
+                self.binance_client.budget.set_limit(limit)
+            self.asset_params[symbol] = {}
             for binance_filter in response.json()["symbols"][0]["filters"]:
                 if binance_filter["filterType"] == "LOT_SIZE":
-                    self.asset_params[symbol] = {
-                        "minQty": float(binance_filter["minQty"]),
-                        "maxQty": float(binance_filter["maxQty"]),
-                        "stepSize": float(binance_filter["stepSize"]),
-                    }
-                    break
+                    self.asset_params[symbol].update(
+                        minQty=float(binance_filter["minQty"]),
+                        maxQty=float(binance_filter["maxQty"]),
+                        stepSize=float(binance_filter["stepSize"]),
+                    )
+                elif binance_filter["filterType"] == "PRICE_FILTER":
+                    self.asset_params[symbol]["tickSize"] = float(
+                        binance_filter["tickSize"]
+                    )
 
     def load_parameters(self, parameter_file):
         """Load the parameter file"""
@@ -61,31 +166,31 @@ class BinanceBot:
         self.max_trade_duration_seconds = data["max_trade_duration_seconds"]
         self.thresholds_validity_seconds = data["thresholds_validity_seconds"]
         self.secrets_validity_seconds = data["secrets_validity_seconds"]
+        self.models_validity_seconds = data["models_validity_seconds"]
+        self.bucket = data["bucket"]
+        self.kline_store_path = data["kline_store"]
+        self.call_timeout_seconds = data["call_timeout_seconds"]
+        self.ledger_path = data["ledger"]
+        self.max_open_positions = data["max_open_positions"]
+        self.trace_file = data["trace_file"]
+        self.order_mode = data["order_mode"]
+        self.recv_window_ms = data["recv_window_ms"]
 
     def create_buy_order(self, symbol, usd_amount):
         """Create a Binance buy order at the current market price"""
         usd_amount = int(usd_amount)
         print(usd_amount, symbol)
-        params = {
-            "symbol": symbol,
-            "quoteOrderQty": usd_amount,
-            "type": "MARKET",
-            "side": "BUY",
-            "timestamp": round(time.time() * 1000),
-        }
-        query_str = "&".join(f"{key}={value}" for key, value in params.items())
-        signature = hmac.new(
-            self.secret["api_private_key"].encode("utf-8"),
-            query_str.encode("utf-8"),
-            hashlib.sha256,
-        )
-        params["signature"] = signature.hexdigest()
-        response = requests.post(
-            "https://api.binance.com/api/v3/order",
-            headers={"X-MBX-APIKEY": self.secret["api_key"]},
-            params=params,
+        return self._signed_request(
+            "post",
+            "/api/v3/order",
+            {
+                "symbol": symbol,
+                "quoteOrderQty": usd_amount,
+                "type": "MARKET",
+                "side": "BUY",
+                "newOrderRespType": "FULL",
+            },
         )
-        return response
 
     def create_sell_order(self, symbol, coin_amount):
         """Create a Binance sell order at the current market price"""
@@ -94,262 +199,1065 @@ class BinanceBot:
         ) * self.asset_params[symbol]["stepSize"]
         coin_amount = max(self.asset_params[symbol]["minQty"], coin_amount)
         coin_amount = min(self.asset_params[symbol]["maxQty"], coin_amount)
-        params = {
-            "symbol": symbol,
-            "quantity": format(coin_amount, "f"),
-            "type": "MARKET",
-            "side": "SELL",
-            "timestamp": round(time.time() * 1000),
-        }
-        query_str = "&".join(f"{key}={value}" for key, value in params.items())
-        signature = hmac.new(
-            self.secret["api_private_key"].encode("utf-8"),
-            query_str.encode("utf-8"),
-            hashlib.sha256,
+        return self._signed_request(
+            "post",
+            "/api/v3/order",
+            {
+                "symbol": symbol,
+                "quantity": format(coin_amount, "f"),
+                "type": "MARKET",
+                "side": "SELL",
+                "newOrderRespType": "FULL",
+            },
         )
-        params["signature"] = signature.hexdigest()
-        response = requests.post(
-            "https://api.binance.com/api/v3/order",
-            headers={"X-MBX-APIKEY": self.secret["api_key"]},
-            params=params,
+
+    def create_bracket_order(self, symbol, coin_amount, target, stop_loss):
+        """
+        Create a Binance OCO sell order of a coin amount, with a limit order
+        at the target price and a stop-limit order at the stop loss price
+        """
+        return self._signed_request(
+            "post",
+            "/api/v3/order/oco",
+            bracket_params(
+                symbol, coin_amount, target, stop_loss, self.asset_params[symbol]
+            ),
         )
-        return response
 
-    def update_asset_quantities(self):
-        """Get current available liquidity in the Binance account"""
-        timestamp = round(time.time() * 1000)
-        query_str = f"timestamp={timestamp}"
-        signature = hmac.new(
-            self.secret["api_private_key"].encode("utf-8"),
-            query_str.encode("utf-8"),
-            hashlib.sha256,
+    def cancel_bracket_order(self, symbol, order_list_id):
+        """Cancel both orders of a Binance OCO order"""
+        return self._signed_request(
+            "delete",
+            "/api/v3/orderList",
+            {"symbol": symbol, "orderListId": order_list_id},
         )
-        response = requests.get(
-            "https://api.binance.com/api/v3/account",
-            headers={"X-MBX-APIKEY": self.secret["api_key"]},
-            params={"timestamp": timestamp, "signature": signature.hexdigest()},
+
+    def get_open_order_lists(self):
+        """Get the OCO orders of the account still executing"""
+        return self._signed_request("get", "/api/v3/openOrderList")
+
+    def get_order_lists(self, start_time, end_time):
+        """Get the OCO orders of the account placed between two times, in ms"""
+        return self._signed_request(
+            "get",
+            "/api/v3/allOrderList",
+            {"startTime": start_time, "endTime": end_time},
         )
-        if response.status_code == 200:
-            for bal in response.json()["balances"]:
-                self.asset_quantities[bal["asset"]] = float(bal["free"])
 
-    def update_open_trade(self):
-        """Get the open trade if it exists"""
-        query_job = self.bq_client.query(
-            "SELECT"
-            "  * "
-            "FROM"
-            f"  `{self.project}.trades.trades` "
-            "WHERE"
-            "  still_open "
-            "LIMIT 1"
+    def get_order(self, symbol, order_id):
+        """Get the status and execution of a Binance order"""
+        return self._signed_request(
+            "get", "/api/v3/order", {"symbol": symbol, "orderId": order_id}
         )
-        rows = query_job.result()
-        for row in rows:
-            self.current_open_trade = row
-            return
-        self.current_open_trade = None
-
-    def open_trade(self, symbol, current_price, target, stop_loss):
-        """Open a trade and log the information in BigQuery"""
-        response = self.create_buy_order(symbol, self.asset_quantities["USDT"])
-        quantity = self.asset_quantities["USDT"] / current_price
-        if response.status_code == 200:
-            self.bq_client.query(
-                f"INSERT INTO `{self.project}.trades.trades` VALUES "
-                "(CURRENT_TIMESTAMP(),"
-                f" '{symbol}',"
-                f" {current_price},"
-                f" {target},"
-                f" {stop_loss},"
-                " NULL,"
-                f" {quantity},"
-                " TRUE,"
-                " NULL,"
-                " NULL,"
-                " NULL)"
+
+    def _signed_request(self, method: str, path: str, params=None):
+        """
+        Send a request to the provided path of the API, signed with the
+        current keys of the account
+        """
+        self.signer.set_keys(self.secret["api_key"], self.secret["api_private_key"])
+        return self.signer.request(method, path, params)
+
+    def update_asset_quantities(self):
+        """Get current available liquidity in the Binance account"""
+        self.apply_asset_quantities(self.fetch_asset_quantities())
+
+    def fetch_asset_quantities(self):
+        """Get the free quantities of the assets of the Binance account"""
+        response = self._signed_request("get", "/api/v3/account")
+        if response.status_code != 200:
+            raise Exception(f"Error while reading the balances {response.content}")
+        return {bal["asset"]: float(bal["free"]) for bal in response.json()["balances"]}
+
+    def apply_asset_quantities(self, balances):
+        """Replace the free quantities of the assets with the read balances"""
+        # The fills of the orders of a decision are applied concurrently
+        with self.quantities_lock:
+            self.asset_quantities.update(balances)
+
+    def apply_fill(self, coin: str, fill, side: str):
+        """
+        Update the free quantities of the coin, USDT and the commission assets
+        with the fill of an order, without a call to the account endpoint
+        """
+        sign = 1 if side == "BUY" else -1
+        with self.quantities_lock:
+            quantities = self.asset_quantities
+            quantities[coin] = quantities.get(coin, 0.0) + sign * fill["quantity"]
+            quantities["USDT"] = (
+                quantities.get("USDT", 0.0) - sign * fill["quote_quantity"]
             )
+            for asset, commission in fill["commissions"].items():
+                quantities[asset] = quantities.get(asset, 0.0) - commission
+
+    def update_open_trade(self):
+        """
+        Get the open trades, from the trade ledger. On a cold start, the open
+        trades of BigQuery are loaded in the ledger first.
+        """
+        self.apply_open_trades(self.fetch_open_trades())
+
+    def fetch_open_trades(self):
+        """
+        Read the changes of the open trades, without writing them: on a cold
+        start, the open trades of BigQuery, with the brackets recovered for
+        them in the bracket mode, and the outcomes of the open brackets which
+        ended on the exchange. Returns (rows, recovered, outcomes), rows being
+        None once the open trades are in the ledger.
+        """
+        rows, recovered, brackets = None, {}, {}
+        if self.ledger.bootstrapped:
+            trades = self.ledger.open_trades()
+            if self.order_mode == "bracket":
+                brackets = self.ledger.open_brackets()
         else:
+            query_job = self.bq_client.query(
+                "SELECT"
+                "  * "
+                "FROM"
+                f"  `{self.project}.trades.trades` "
+                "WHERE"
+                "  still_open "
+            )
+            rows = trades = list(query_job.result())
+            if self.order_mode == "bracket":
+                recovered = brackets = self.recover_brackets(rows)
+        outcomes = self.bracket_outcomes(trades, brackets) if brackets else []
+        return rows, recovered, outcomes
+
+    def apply_open_trades(self, changes):
+        """
+        Write in the ledger the changes read by fetch_open_trades, and take
+        the open trades and brackets from it
+        """
+        rows, recovered, outcomes = changes
+        if rows is not None:
+            self.ledger.bootstrap(rows)
+            for bracket in recovered.values():
+                self.ledger.add_bracket(
+                    bracket["order_list_id"],
+                    bracket["trade_time"],
+                    bracket["pair"],
+                    bracket["limit_order_id"],
+                    bracket["stop_order_id"],
+                )
+        for bracket, status, sale in outcomes:
+            if sale is not None:
+                print(f"Bracket of {bracket['pair']} filled; result: {sale[1]}")
+                self.ledger.close_trade(bracket["trade_time"], *sale)
+            self.ledger.set_bracket_status(bracket["order_list_id"], status)
+        self.open_brackets = self.ledger.open_brackets()
+        open_trades = self.ledger.open_trades()
+        with self.quantities_lock:
+            self.open_trades = open_trades
+
+    def recover_brackets(self, trades):
+        """
+        Find on the exchange the bracket orders of the open trades loaded on
+        a cold start, the ledger holding their state being lost. The OCO
+        orders placed since the oldest trade are matched to the trades on
+        their symbol and quantity, and returned as open brackets, by time of
+        their trade: those which ended meanwhile are then settled like the
+        brackets ending between two ticks.
+        """
+        if not trades:
+            return {}
+        start_time = min(
+            int(trade["ingestion_time"].timestamp() * 1000) for trade in trades
+        )
+        now = int(time.time() * 1000)
+        order_lists = []
+        while start_time <= now:
+            end_time = min(start_time + ORDER_LISTS_SPAN_MS - 1, now)
+            response = self.get_order_lists(start_time, end_time)
+            if response.status_code != 200:
+                raise Exception(f"Error while recovering the brackets {response.content}")
+            order_lists.extend(response.json())
+            start_time = end_time + 1
+        symbols = {trade["pair"] for trade in trades}
+        brackets = {}
+        for order_list in sorted(order_lists, key=lambda x: x["transactionTime"]):
+            symbol = order_list["symbol"]
+            if symbol not in symbols:
+                continue
+            orders = [
+                self.get_order(symbol, order["orderId"]).json()
+                for order in order_list["orders"]
+            ]
+            trade = match_bracket(
+                [trade for trade in trades if trade["ingestion_time"] not in brackets],
+                orders,
+                datetime.fromtimestamp(
+                    order_list["transactionTime"] / 1000, timezone.utc
+                ),
+                self.asset_params[symbol],
+            )
+            if trade is None:
+                continue
+            limit_order_id, stop_order_id = bracket_legs(orders)
+            brackets[trade["ingestion_time"]] = {
+                "order_list_id": order_list["orderListId"],
+                "trade_time": trade["ingestion_time"],
+                "pair": symbol,
+                "limit_order_id": limit_order_id,
+                "stop_order_id": stop_order_id,
+                "status": OPEN,
+            }
+            print(f"Bracket of {symbol} recovered, trade of {trade['ingestion_time']}")
+        return brackets
+
+    def bracket_outcomes(self, trades, brackets):
+        """
+        Outcomes of the open brackets of the trades which ended on the
+        exchange, as (bracket, status, sale) tuples, sale being the sale price
+        and the profit of the trade of a filled bracket, or None. The open
+        brackets are checked with a single call, and only the legs of those
+        which ended are queried.
+        """
+        response = self.get_open_order_lists()
+        if response.status_code != 200:
+            raise Exception(f"Error while checking the brackets {response.content}")
+        executing = {order_list["orderListId"] for order_list in response.json()}
+        trades = {trade["ingestion_time"]: trade for trade in trades}
+        outcomes = []
+        for trade_time, bracket in brackets.items():
+            if bracket["order_list_id"] in executing:
+                continue
+            orders = [
+                self.get_order(bracket["pair"], order_id).json()
+                for order_id in (bracket["limit_order_id"], bracket["stop_order_id"])
+            ]
+            status, order = bracket_outcome(orders)
+            if status == OPEN:
+                continue
+            sale = None
+            if status == FILLED and trade_time in trades:
+                quantity = float(order["executedQty"])
+                price = float(order["cummulativeQuoteQty"]) / quantity
+                purchase_price = float(trades[trade_time]["purchase_price"])
+                sale = (price, (price - purchase_price) * quantity)
+            outcomes.append((bracket, status, sale))
+        return outcomes
+
+    def open_trade(self, symbol, current_price, target, stop_loss, usd_amount=None):
+        """
+        Open a trade for the provided amount (all the available USDT by
+        default) and log the information in the trade ledger, to be flushed
+        to BigQuery. The purchase price and quantity are those of the fill of
+        the order when its response has one, the limits being moved with the
+        price.
+        """
+        if usd_amount is None:
+            usd_amount = self.asset_quantities["USDT"]
+        response = self.timeline.timed(
+            "create_buy_order", self.create_buy_order, symbol, usd_amount
+        )
+        if response.status_code != 200:
             raise Exception(f"Error while opening a trade in Binance {response.content}")
+        quantity = usd_amount / current_price
+        fill = order_fill(response)
+        if fill is not None:
+            coin = symbol[:-4]
+            self.apply_fill(coin, fill, "BUY")
+            quantity = fill["quantity"] - fill["commissions"].get(coin, 0.0)
+            scale = fill["price"] / current_price
+            current_price, target, stop_loss = (
+                fill["price"],
+                target * scale,
+                stop_loss * scale,
+            )
+        ingestion_time = self.ledger.open_trade(
+            symbol, current_price, target, stop_loss, quantity
+        )
+        trade = next(
+            trade
+            for trade in self.ledger.open_trades()
+            if trade["ingestion_time"] == ingestion_time
+        )
+        with self.quantities_lock:
+            self.open_trades.append(trade)
+        if self.order_mode == "bracket":
+            self.place_bracket(symbol, ingestion_time, quantity, target, stop_loss)
+
+    def place_bracket(self, symbol, trade_time, quantity, target, stop_loss):
+        """
+        Place the bracket order of a trade. Without it, the trade is closed by
+        the decisions of the bot, as in the market order mode.
+        """
+        response = self.timeline.timed(
+            "create_bracket_order",
+            self.create_bracket_order,
+            symbol,
+            quantity,
+            target,
+            stop_loss,
+        )
+        if response.status_code != 200:
+            print(f"Bracket of {symbol} not placed {response.content}")
+            return
+        order_list = response.json()
+        self.ledger.add_bracket(
+            order_list["orderListId"],
+            trade_time,
+            symbol,
+            *bracket_legs(order_list["orderReports"]),
+        )
+        # The brackets of a decision are placed concurrently, in the executor
+        # of the orders: they are added to the open brackets, never replaced
+        self.open_brackets[trade_time] = self.ledger.open_brackets()[trade_time]
 
     def close_trade(self, coin, trade_timestamp, sale_price, profit):
-        """Close a trade and log the information in BigQuery"""
-        response = self.create_sell_order(coin + "USDT", self.asset_quantities[coin])
-        if response.status_code == 200:
-            self.bq_client.query(
-                f"UPDATE `{self.project}.trades.trades` "
-                " SET "
-                "  still_open = false,"
-                f"  sale_price = {sale_price},"
-                "  close_time = CURRENT_TIMESTAMP(),"
-                f"  profit = {profit} "
-                "WHERE"
-                f"  ingestion_time = '{trade_timestamp}'"
+        """
+        Close a trade and log the information in the trade ledger, to be
+        flushed to BigQuery. The sale price and profit are corrected with the
+        fill of the order when its response has one. The bracket order of the
+        trade, if any, is canceled first, releasing the coins it holds.
+        """
+        bracket = self.open_brackets.get(trade_timestamp)
+        if bracket is not None:
+            response = self.timeline.timed(
+                "cancel_bracket_order",
+                self.cancel_bracket_order,
+                bracket["pair"],
+                bracket["order_list_id"],
             )
-        else:
+            if response.status_code != 200:
+                raise Exception(
+                    f"Error while canceling a bracket in Binance {response.content}"
+                )
+            self.ledger.set_bracket_status(bracket["order_list_id"], CANCELED)
+            self.open_brackets.pop(trade_timestamp, None)
+            self.update_asset_quantities()
+        with self.quantities_lock:
+            quantity = self.asset_quantities[coin]
+        response = self.timeline.timed(
+            "create_sell_order", self.create_sell_order, coin + "USDT", quantity
+        )
+        if response.status_code != 200:
             raise Exception(f"Error while closing a trade in Binance {response.content}")
+        fill = order_fill(response)
+        if fill is not None:
+            self.apply_fill(coin, fill, "SELL")
+            profit += (fill["price"] - sale_price) * fill["quantity"]
+            sale_price = fill["price"]
+        self.ledger.close_trade(trade_timestamp, sale_price, profit)
+
+    def flush_ledger(self):
+        """
+        Write the trades changed since the last flush in BigQuery. The ledger
+        does not outlive the instance, so a failure is raised, and no trade
+        is opened until a flush succeeds.
+        """
+        try:
+            count = self.ledger.flush(self.bq_client, f"{self.project}.trades.trades")
+        except Exception as error:
+            self.flush_failed = True
+            print(f"Flush of the ledger failed: {error!r}")
+            raise
+        self.flush_failed = False
+        if count:
+            print(f"Flushed {count} trades to BigQuery")
+
+    async def flush_pending(self):
+        """
+        Flush the changed trades of the ledger in the executor, trying again
+        with a doubling delay which does not block the event loop. The trades
+        of a flush failing FLUSH_ATTEMPTS times stay pending for the next one.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(FLUSH_ATTEMPTS):
+            if not self.ledger.pending():
+                return
+            if attempt:
+                await asyncio.sleep(FLUSH_RETRY_SECONDS * 2 ** (attempt - 1))
+            try:
+                await loop.run_in_executor(
+                    None, self.timeline.timed, "flush_ledger", self.flush_ledger
+                )
+                return
+            except Exception:  # pylint: disable=broad-except
+                # Printed by flush_ledger
+                continue
+
+    def schedule_flush(self):
+        """
+        Start a task flushing the ledger on the event loop of the bot, unless
+        the last one is still running, and return it. The decisions do not
+        wait for it, their orders being sent first.
+        """
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = self.loop.create_task(self.flush_pending())
+        return self.flush_task
 
     def update_full_history(self, coin: str):
+        """Replace the history of the specified coin with its last day"""
+        self.data_hist[coin].reset(self.fetch_full_history(coin))
+
+    def fetch_full_history(self, coin: str):
         """
-        Get the close price of the last 1440 minutes (one day) for the
-        specified coin
+        Get the close prices of the last 1440 minutes (one day) for the
+        specified coin. When the kline store already holds them up to a recent
+        minute, only the minutes since then are requested, and the stored
+        day is used unless it has a gap, which would shift the features.
         """
         symbol = coin + "USDT"
-        url = (
-            "https://api.binance.com/api/v3/klines?interval=1m&limit=720"
-            f"&symbol={symbol}"
-        )
-        first_batch = requests.get(url, headers={}, data={}).json()
-        url = (
-            "https://api.binance.com/api/v3/klines?interval=1m&limit=721"
-            f"&endTime={min(x[0] for x in first_batch)}"
+        if self.kline_store is not None:
+            open_time = self.kline_store.read(symbol)["open_time"]
+            if (
+                open_time.size >= HISTORY_LENGTH
+                and time.time() * 1000 - open_time[-1] < 1000 * 60000
+            ):
+                self.kline_store.write(
+                    symbol,
+                    self.binance_client.get(
+                        "/api/v3/klines?interval=1m&limit=1000"
+                        f"&startTime={open_time[-1]}"
+                        f"&symbol={symbol}"
+                    ).json(),
+                )
+                stored = self.kline_store.read(symbol)
+                open_time = stored["open_time"]
+                if (
+                    open_time[-HISTORY_LENGTH]
+                    == open_time[-1] - (HISTORY_LENGTH - 1) * 60000
+                ):
+                    return stored["close"][-HISTORY_LENGTH:]
+                print(f"Gap in the stored klines of {symbol}, last day fetched again")
+        first_batch = self.binance_client.get(
+            f"/api/v3/klines?interval=1m&limit=720&symbol={symbol}"
+        ).json()
+        second_batch = self.binance_client.get(
+            "/api/v3/klines?interval=1m&limit=721"
+            f"&endTime={min(x[0] for x in first_batch) - 60000}"
             f"&symbol={symbol}"
-        )
-        second_batch = requests.get(url, headers={}, data={}).json()
-        self.data_hist[coin] = [float(x[4]) for x in second_batch + first_batch]
-        self.update_estimation(coin)
+        ).json()
+        klines = second_batch + first_batch
+        if self.kline_store is not None:
+            self.kline_store.write(symbol, klines)
+        return [float(x[4]) for x in klines]
+
+    def update_missing_history(self, coin: str, start_time: int):
+        """Append the minutes elapsed since start_time to the history of a coin"""
+        self.append_klines(coin, self.fetch_missing_history(coin, start_time))
+
+    def fetch_missing_history(self, coin: str, start_time: int):
+        """
+        Get the klines of the minutes elapsed since start_time for the
+        specified coin, with as many requests of KLINES_LIMIT minutes as
+        needed. These requests have the priority of the ticker ones, not of
+        the backfill of full histories.
+        """
+        symbol = coin + "USDT"
+        klines = []
+        while True:
+            batch = self.binance_client.get(
+                f"/api/v3/klines?interval=1m&limit={KLINES_LIMIT}"
+                f"&startTime={start_time}"
+                f"&symbol={symbol}",
+                priority=NORMAL,
+            ).json()
+            klines += batch
+            if len(batch) < KLINES_LIMIT:
+                break
+            start_time = batch[-1][0] + 60000
+        if self.kline_store is not None:
+            self.kline_store.write(symbol, klines)
+        return klines
+
+    def append_klines(self, coin: str, klines):
+        """Append the close prices of klines to a coin history"""
+        for kline in klines:
+            self.data_hist[coin].append(float(kline[4]))
 
-    def update_latest_price(self, coin: str):
+    def update_latest_prices(self, coins):
+        """Append the latest prices of the specified coins to their histories"""
+        self.append_prices(self.fetch_latest_prices(coins))
+
+    def fetch_latest_prices(self, coins):
         """
-        Get the latest price from the Binance ticker and updates the history
+        Get the latest prices of the specified coins from the Binance ticker,
+        in a single request whatever the number of coins, by coin
         """
         try:
-            symbol = coin + "USDT"
-            url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
-            data = requests.get(url, headers={}, data={}).json()
-            self.data_hist[coin].append(float(data["price"]))
-            self.update_estimation(coin)
+            symbols = [coin + "USDT" for coin in coins]
+            data = self.binance_client.get(
+                "/api/v3/ticker/price",
+                params={"symbols": json.dumps(symbols, separators=(",", ":"))},
+            ).json()
+            prices = {row["symbol"]: float(row["price"]) for row in data}
+            return {coin: prices[symbol] for coin, symbol in zip(coins, symbols)}
         except Exception as exception:
             raise SystemExit(exception) from exception
 
+    def append_prices(self, prices):
+        """Append a price by coin to the histories"""
+        for coin, price in prices.items():
+            self.data_hist[coin].append(price)
+
     def update_estimation(self, coin: str):
+        """Update the prediction for the specified coin"""
+        self.update_estimations([coin])
+
+    def update_estimations(self, coins=None):
+        """Update the predictions for the specified coins (all by default)"""
+        self.estimations.update(self.estimate(self.feature_rows(coins)))
+
+    def feature_rows(self, coins=None):
+        """
+        Features of the specified coins (all by default) whose history is
+        complete, by coin
+        """
+        rows = {}
+        for coin in self.coin_list if coins is None else coins:
+            if len(self.data_hist[coin]) < HISTORY_LENGTH:
+                print(f"Incomplete history for {coin}, no estimation")
+            else:
+                rows[coin] = self.feature_row(coin)
+        return rows
+
+    def estimate(self, rows):
+        """
+        Predictions for the feature rows of the coins, locally for the coins
+        whose model exported from BigQuery is available, and with a single
+        ML.PREDICT job for all the others
+        """
+        estimations = {}
+        remote_rows = {}
+        for coin, features in rows.items():
+            if coin in self.models:
+                estimations[coin] = float(self.models[coin].predict(features)[0])
+                print(f"{coin} , {estimations[coin]}")
+            else:
+                remote_rows[coin] = features
+        if remote_rows:
+            estimations.update(self.remote_estimations(remote_rows))
+        return estimations
+
+    def feature_names(self, coin: str):
         """
-        Update the prediction for the specified coin using the model managed
-        on BiqQuery
+        Names of the features of a coin: the prices of the history at the
+        indexes, the columns of the features table the models are trained on
         """
         lc_coin = coin.lower()
-        averaged = [x * 1441 / sum(self.data_hist[coin]) for x in self.data_hist[coin]]
-        query = (
-            "SELECT predicted_win_in_hour_probs[OFFSET(0)].prob AS prob "
-            "FROM "
-            "ML.PREDICT("
-            f"MODEL `{self.project}.models.bt_{lc_coin}`,"
-            "(SELECT "
-            + ",".join(
-                [
-                    f"{averaged[index]} AS value_{lc_coin}_{index}"
-                    for index in self.indexes
-                ]
+        return [f"value_{lc_coin}_{index}" for index in self.indexes]
+
+    def feature_row(self, coin: str):
+        """Features of a coin for the latest minute, as named by feature_names"""
+        return self.data_hist[coin].features()
+
+    def remote_estimations(self, rows):
+        """
+        Score the models managed on BigQuery for the feature rows of the
+        coins, in a single job. When that job fails, as when the model of a
+        coin is missing, each coin is scored by its own job, all of them
+        started at once, and only the coins whose job fails get no estimation.
+        """
+        try:
+            return self._job_estimations(self._prediction_job(rows))
+        except Exception as error:  # pylint: disable=broad-except
+            if len(rows) == 1:
+                raise
+            print(f"ML.PREDICT failed for {', '.join(rows)}: {error!r}")
+        jobs = {}
+        for coin, features in rows.items():
+            try:
+                jobs[coin] = self._prediction_job({coin: features})
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"ML.PREDICT failed for {coin}: {error!r}")
+        estimations = {}
+        for coin, job in jobs.items():
+            try:
+                estimations.update(self._job_estimations(job))
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"ML.PREDICT failed for {coin}: {error!r}")
+        return estimations
+
+    def _prediction_job(self, rows):
+        """
+        Start the ML.PREDICT job of the feature rows of the coins. The
+        features are sent as one array parameter per coin, so that the text
+        of the query only depends on the list of coins.
+        """
+        selects = []
+        parameters = []
+        for coin, features in rows.items():
+            lc_coin = coin.lower()
+            columns = ",".join(
+                f"features[OFFSET({position})] AS {name}"
+                for position, name in enumerate(self.feature_names(coin))
+            )
+            selects.append(
+                f"SELECT '{coin}' AS coin,"
+                " predicted_win_in_hour_probs[OFFSET(0)].prob AS prob "
+                "FROM "
+                "ML.PREDICT("
+                f"MODEL `{self.project}.models.bt_{lc_coin}`,"
+                f"(SELECT {columns} FROM (SELECT @features_{lc_coin} AS features))"
+                ")"
             )
-            + ")"
-            ")"
+            parameters.append(
+                bigquery.ArrayQueryParameter(
+                    f"features_{lc_coin}",
+                    "FLOAT64",
+                    [float(value) for value in features],
+                )
+            )
+        return self.bq_client.query(
+            " UNION ALL ".join(selects),
+            job_config=bigquery.QueryJobConfig(query_parameters=parameters),
         )
-        query_job = self.bq_client.query(query)
+
+    def _job_estimations(self, query_job):
+        """Estimations by coin of a finished ML.PREDICT job"""
+        estimations = {}
         for row in query_job.result():
-            self.estimations[coin] = float(row["prob"])
-            print(f'{coin} , {float(row["prob"])}')
+            estimations[row["coin"]] = float(row["prob"])
+            print(f'{row["coin"]} , {float(row["prob"])}')
+        return estimations
+
+    def update_models(self):
+        """Update the models exported from BigQuery"""
+        self.apply_models(self.fetch_models())
+
+    def fetch_models(self):
+        """
+        Download the models exported by the update_model procedures when
+        their version in the bucket differs from the one held in memory, and
+        return them by coin, with their version
+        """
+        print("Updating models")
+        bucket = self.gcs_client.bucket(self.bucket)
+        models = {}
+        for coin in self.coin_list:
+            lc_coin = coin.lower()
+            blob = bucket.get_blob(f"models/bt_{lc_coin}/model.bst")
+            if blob is None or self.model_generations.get(coin) == blob.generation:
+                continue
+            feature_names = None
+            metadata = bucket.get_blob(
+                f"models/bt_{lc_coin}/assets/model_metadata.json"
+            )
+            if metadata is not None:
+                feature_names = json.loads(metadata.download_as_bytes()).get(
+                    "feature_names"
+                )
+            model = TreeModel.from_bytes(blob.download_as_bytes(), feature_names)
+            model.bind_features(self.feature_names(coin))
+            models[coin] = (model, blob.generation)
+        return models
+
+    def apply_models(self, models):
+        """Use the downloaded models, with their version"""
+        for coin, (model, generation) in models.items():
+            self.models[coin] = model
+            self.model_generations[coin] = generation
+        self.models["timestamp"] = time.time()
 
     def update_thresholds(self):
         """Update the thresholds used by the bot"""
+        self.apply_thresholds(self.fetch_thresholds())
+
+    def fetch_thresholds(self):
+        """
+        Get the thresholds of the coins, from the file written in the bucket
+        by tools/optimize_thresholds.py when there is one, downloaded again
+        only when its version changes. The thresholds of the coins it does
+        not cover are read from the thresholds table. Returns the thresholds
+        of the file, its version, and the thresholds of all the coins.
+        """
         print("Updating thresholds")
-        query_job = self.bq_client.query(
-            f"SELECT * FROM `{self.project}.models.thresholds` "
-            f"ORDER BY ingestion_timestamp DESC LIMIT {len(self.coin_list)}"
-        )
-        rows = query_job.result()
+        file_thresholds = self.file_thresholds
+        generation = self.thresholds_generation
+        blob = self.gcs_client.bucket(self.bucket).get_blob(THRESHOLDS_BLOB)
+        if blob is None:
+            file_thresholds, generation = {}, None
+        elif blob.generation != generation:
+            file_thresholds = {
+                coin.upper(): float(threshold)
+                for coin, threshold in json.loads(blob.download_as_bytes()).items()
+            }
+            generation = blob.generation
+        thresholds = dict(file_thresholds)
+        if any(coin not in file_thresholds for coin in self.coin_list):
+            query_job = self.bq_client.query(
+                f"SELECT * FROM `{self.project}.models.thresholds` "
+                f"ORDER BY ingestion_timestamp DESC LIMIT {len(self.coin_list)}"
+            )
+            for row in query_job.result():
+                if row["coin"].upper() not in file_thresholds:
+                    thresholds[row["coin"].upper()] = float(row["threshold"])
+        return file_thresholds, generation, thresholds
+
+    def apply_thresholds(self, update):
+        """Use the thresholds read by fetch_thresholds"""
+        self.file_thresholds, self.thresholds_generation, thresholds = update
+        self.thresholds.update(thresholds)
         self.thresholds["timestamp"] = time.time()
-        for row in rows:
-            self.thresholds[row["coin"].upper()] = float(row["threshold"])
         print(self.thresholds)
 
     def update_secrets(self):
         """Update the secrets used by the bot"""
+        self.apply_secrets(self.fetch_secrets())
+
+    def fetch_secrets(self):
+        """Get the keys of the Binance API from the secret manager"""
         print("Updating secrets")
+        secret = {}
         response = self.sm_client.access_secret_version(
             {"name": f"projects/{self.project}/secrets/secret-binance/versions/latest"}
         )
-        self.secret["api_key"] = response.payload.data.decode("UTF-8")
+        secret["api_key"] = response.payload.data.decode("UTF-8")
         response = self.sm_client.access_secret_version(
             {
                 "name": f"projects/{self.project}/secrets/secret-binance-private/versions/latest"
             }
         )
-        self.secret["api_private_key"] = response.payload.data.decode("UTF-8")
-        self.secret["timestamp"] = time.time()
+        secret["api_private_key"] = response.payload.data.decode("UTF-8")
+        return secret
 
-    def update_information(self):
+    def apply_secrets(self, secret):
+        """Use the keys read by fetch_secrets"""
+        self.secret = dict(secret, timestamp=time.time())
+
+    async def call(self, function, *args):
         """
-        Parallelize the requests to the different APIs providing information
-        needed to make a decision.
+        Run a blocking call in the executor of the bot, giving up on it after
+        call_timeout_seconds, and return its result. Errors are printed and
+        give None, the other calls of the tick going on without the
+        information of this one. The call is timed in a span named after the
+        function, and the coin it is made for.
+
+        A call given up on keeps running in its thread: the calls gathering
+        information only read it and return it, and their results are
+        applied to the bot on the event loop, only for the calls which
+        finished in time.
+        """
+        loop = asyncio.get_running_loop()
+        name = getattr(function, "__name__", repr(function))
+        if args and isinstance(args[0], str):
+            name = f"{name} {args[0]}"
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(None, self.timeline.timed, name, function, *args),
+                self.call_timeout_seconds,
+            )
+        except asyncio.TimeoutError:
+            print(f"{name} timed out after {self.call_timeout_seconds}s")
+        except (Exception, SystemExit) as error:  # pylint: disable=broad-except
+            print(f"{name} failed: {error!r}")
+        return None
+
+    async def gather_information(self, prices: bool = True):
+        """
+        Run concurrently the requests to the different APIs providing
+        information needed to make a decision. Without prices, the price
+        histories are left to the caller, as in the streaming mode. Returns
+        whether the open trades and the asset quantities were refreshed, the
+        decision only opening trades on them.
         """
-        res = []
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            res.append(executor.submit(self.update_open_trade))
+        calls = []
+        tick = time.time()
+        positions = asyncio.gather(
+            self.refresh(self.fetch_open_trades, self.apply_open_trades),
+            self.refresh(self.fetch_asset_quantities, self.apply_asset_quantities),
+        )
+        calls.append(positions)
+        if (
+            not self.thresholds
+            or time.time() - self.thresholds["timestamp"]
+            > self.thresholds_validity_seconds
+        ):
+            calls.append(self.refresh(self.fetch_thresholds, self.apply_thresholds))
+        if (
+            not self.secret
+            or time.time() - self.secret["timestamp"] > self.secrets_validity_seconds
+        ):
+            calls.append(self.refresh(self.fetch_secrets, self.apply_secrets))
+        if (
+            "timestamp" not in self.models
+            or time.time() - self.models["timestamp"] > self.models_validity_seconds
+        ):
+            calls.append(self.refresh(self.fetch_models, self.apply_models))
+        if not prices:
+            await asyncio.gather(*calls)
+            return all(positions.result())
+        price_calls = []
+        up_to_date_coins = []
+        for coin in self.coin_list:
+            last_tick = self.last_ticks[coin]
+            missed_minutes = int(tick // 60 - last_tick // 60)
             if (
-                not self.thresholds
-                or time.time() - self.thresholds["timestamp"]
-                > self.thresholds_validity_seconds
+                len(self.data_hist[coin]) < HISTORY_LENGTH
+                or missed_minutes >= HISTORY_LENGTH
             ):
-                res.append(executor.submit(self.update_thresholds))
-            if (
-                not self.secret
-                or time.time() - self.secret["timestamp"]
-                > self.secrets_validity_seconds
+                price_calls.append(self.refresh_full_history(coin, tick))
+            elif missed_minutes > 1:
+                price_calls.append(
+                    self.refresh_missing_history(
+                        coin, (last_tick // 60 + 1) * 60000, tick
+                    )
+                )
+            else:
+                up_to_date_coins.append(coin)
+        if up_to_date_coins:
+            price_calls.append(self.refresh_latest_prices(up_to_date_coins, tick))
+        calls.append(self.estimate_after(price_calls))
+        await asyncio.gather(*calls)
+        return all(positions.result())
+
+    async def refresh(self, fetch, apply):
+        """
+        Make a call reading some information, and apply its result to the bot
+        on the event loop if the call finished in time. Returns whether the
+        information was refreshed.
+        """
+        result = await self.call(fetch)
+        if result is None:
+            return False
+        try:
+            apply(result)
+        except Exception as error:  # pylint: disable=broad-except
+            print(f"{apply.__name__} failed: {error!r}")
+            return False
+        return True
+
+    # The last tick of a coin only moves once its history is updated, so that
+    # the minutes of a failed or timed out call are fetched on the next tick
+
+    async def refresh_full_history(self, coin: str, tick: float):
+        """Replace the history of a coin, if its last day could be fetched"""
+        prices = await self.call(self.fetch_full_history, coin)
+        if prices is not None:
+            self.data_hist[coin].reset(prices)
+            self.last_ticks[coin] = tick
+
+    async def refresh_missing_history(self, coin: str, start_time: int, tick: float):
+        """Append the minutes since start_time to a coin history, if fetched"""
+        klines = await self.call(self.fetch_missing_history, coin, start_time)
+        if klines is not None:
+            self.append_klines(coin, klines)
+            self.last_ticks[coin] = tick
+
+    async def refresh_latest_prices(self, coins, tick: float):
+        """Append the latest prices of the coins to their histories, if fetched"""
+        prices = await self.call(self.fetch_latest_prices, coins)
+        if prices is not None:
+            self.append_prices(prices)
+            self.last_ticks.update((coin, tick) for coin in prices)
+
+    async def refresh_estimations(self, coins=None):
+        """
+        Update the predictions for the specified coins (all by default). The
+        features are read on the event loop, and only the predictions are
+        made in the executor.
+        """
+        estimations = await self.call(self.estimate, self.feature_rows(coins))
+        if estimations is not None:
+            self.estimations.update(estimations)
+
+    async def estimate_after(self, price_calls):
+        """
+        Update the estimations of all coins once their prices are updated,
+        without waiting for the other calls of the tick
+        """
+        await asyncio.gather(*price_calls)
+        await self.refresh_estimations()
+
+    async def run_tick(self):
+        """
+        Gather the information, then decide as soon as it arrived, saving the
+        snapshot at the same time. Unless the open trades and the asset
+        quantities were refreshed, the decision only closes trades. The
+        trades changed by its orders are flushed once they are sent, in a
+        task of their own.
+        """
+        self.timeline.begin()
+        refreshed = await self.gather_information()
+        if not refreshed:
+            print("Open trades or balances not refreshed, no trade opened")
+        loop = asyncio.get_running_loop()
+        snapshot = loop.run_in_executor(
+            None, self.timeline.timed, "save_snapshot", self.save_snapshot
+        )
+        try:
+            await loop.run_in_executor(
+                None, self.timeline.timed, "decide", self.decide, refreshed
+            )
+        finally:
+            await asyncio.gather(snapshot, self.schedule_flush())
+        self.report_timing()
+
+    def report_timing(self):
+        """
+        Print the timing record of the tick as a structured log, with the
+        percentiles of each call every SUMMARY_TICKS ticks, and export the
+        trace of the last ticks when a trace file is set
+        """
+        print(json.dumps({"timeline": self.timeline.end()}))
+        if self.timeline.count % SUMMARY_TICKS == 0:
+            print(json.dumps({"timing_summary": self.timeline.summary()}))
+        if self.trace_file:
+            self.timeline.export(self.trace_file)
+
+    def update_information(self):
+        """
+        Parallelize the requests to the different APIs providing information
+        needed to make a decision, and return whether the open trades and
+        the asset quantities were refreshed.
+        """
+        return self.loop.run_until_complete(self.gather_information())
+
+    def tick(self):
+        """Run a whole tick of the bot on its event loop"""
+        self.loop.run_until_complete(self.run_tick())
+
+    def save_snapshot(self):
+        """
+        Save the price histories, asset settings, thresholds and the time of
+        the last tick of each coin in the bucket, so that a cold start can
+        resume from them
+        """
+        state = json.dumps(
+            {
+                "last_ticks": self.last_ticks,
+                "asset_params": self.asset_params,
+                "thresholds": dict(self.thresholds),
+            }
+        )
+        buffer = io.BytesIO()
+        prices = {
+            f"prices_{coin}": self.data_hist[coin].window() for coin in self.coin_list
+        }
+        np.savez_compressed(
+            buffer,
+            state=np.frombuffer(state.encode("utf-8"), dtype=np.uint8),
+            **prices,
+        )
+        self.gcs_client.bucket(self.bucket).blob(SNAPSHOT_BLOB).upload_from_string(
+            buffer.getvalue()
+        )
+
+    def load_snapshot(self):
+        """
+        Restore the state saved by save_snapshot. The minutes elapsed since
+        then are fetched on the next tick. Returns False if there is no
+        snapshot covering all the coins of the parameter file.
+        """
+        blob = self.gcs_client.bucket(self.bucket).get_blob(SNAPSHOT_BLOB)
+        if blob is None:
+            return False
+        with np.load(io.BytesIO(blob.download_as_bytes())) as snapshot:
+            state = json.loads(snapshot["state"].tobytes())
+            symbols = [coin + "USDT" for coin in self.coin_list]
+            # Snapshots older than the tickSize setting are not used
+            if any(
+                "tickSize" not in state["asset_params"].get(symbol, {})
+                for symbol in symbols
             ):
-                res.append(executor.submit(self.update_secrets))
-            res.append(executor.submit(self.update_asset_quantities))
+                return False
             for coin in self.coin_list:
-                if len(self.data_hist[coin]) < 1441:
-                    res.append(executor.submit(self.update_full_history, coin))
-                else:
-                    res.append(executor.submit(self.update_latest_price, coin))
-            concurrent.futures.wait(res)
+                if f"prices_{coin}" in snapshot.files:
+                    self.data_hist[coin].reset(snapshot[f"prices_{coin}"])
+        self.asset_params = state["asset_params"]
+        self.thresholds = state["thresholds"]
+        # Snapshots older than the last tick of each coin have a single one
+        last_ticks = state.get("last_ticks") or dict.fromkeys(
+            self.coin_list, state["last_tick"]
+        )
+        self.last_ticks = {coin: last_ticks.get(coin, 0) for coin in self.coin_list}
+        print(f"Snapshot loaded, last tick at {max(self.last_ticks.values())}")
+        return True
 
-    def decide(self):
+    def decide(self, entries: bool = True):
         """
-        Once all information is loaded, choose wether to sell the current
-        position, keep it, or open one if none already is.
+        Once all information is loaded, close the open trades reaching their
+        exit, and open trades on the best signals while fewer than
+        max_open_positions are open, splitting the available USDT between the
+        free slots. The decisions are taken in one pass over the arrays of
+        the estimations and thresholds of all coins, and their orders are
+        sent at once, the quantities of the assets being updated from their
+        fills. The trades with a bracket order only leave on their time
+        limit, their limits being handled by the exchange. While the last
+        flush of the ledger failed, only the exits are made, as without
+        entries.
         """
-        if self.current_open_trade:
-            print("Trade already open", self.current_open_trade)
-            coin = self.current_open_trade["pair"][:-4]
-            if (
-                self.data_hist[coin][-1]
-                >= float(self.current_open_trade["target_price"])
-                or self.data_hist[coin][-1]
-                <= float(self.current_open_trade["stop_loss_price"])
-                or self.current_open_trade["ingestion_time"].timestamp()
-                < time.time() - self.max_trade_duration_seconds
-            ):
-                trade_result = (
-                    self.data_hist[coin][-1]
-                    - float(self.current_open_trade["purchase_price"])
-                ) * float(self.current_open_trade["quantity"])
-                print("Closing trade; restult: ", trade_result)
-                self.close_trade(
-                    coin,
-                    self.current_open_trade["ingestion_time"],
-                    self.data_hist[coin][-1],
-                    trade_result,
+        can_open = entries
+        if self.flush_failed and can_open:
+            print("Trade ledger not flushed, no trade opened")
+            can_open = False
+        trades = self.open_trades
+        if trades:
+            print("Trades already open", trades)
+        positions = [self.coin_index[trade["pair"][:-4]] for trade in trades]
+        bracketed = [trade["ingestion_time"] in self.open_brackets for trade in trades]
+        now = time.time()
+        exits, entries = portfolio_decision(
+            [self.data_hist[self.coin_list[index]][-1] for index in positions],
+            [
+                np.inf if bracket else float(trade["target_price"])
+                for trade, bracket in zip(trades, bracketed)
+            ],
+            [
+                0.0 if bracket else float(trade["stop_loss_price"])
+                for trade, bracket in zip(trades, bracketed)
+            ],
+            [now - trade["ingestion_time"].timestamp() for trade in trades],
+            self.max_trade_duration_seconds,
+            positions,
+            self.estimations.array,
+            self.thresholds.array,
+            self.max_open_positions,
+        )
+        orders = []
+        for trade, index, closed in zip(trades, positions, exits):
+            if not closed:
+                continue
+            coin = self.coin_list[index]
+            price = self.data_hist[coin][-1]
+            trade_result = (price - float(trade["purchase_price"])) * float(
+                trade["quantity"]
+            )
+            print("Closing trade; restult: ", trade_result)
+            orders.append(
+                (
+                    f"close_order {coin}",
+                    functools.partial(
+                        self.close_trade,
+                        coin,
+                        trade["ingestion_time"],
+                        price,
+                        trade_result,
+                    ),
                 )
-                self.update_asset_quantities()
-        else:
-            coin_signals = [
-                (coin, self.estimations[coin] - self.thresholds[coin])
-                for coin in self.coin_list
-                if self.estimations[coin] >= self.thresholds[coin]
+            )
+        # The trades opened by the orders are appended to the remaining ones
+        with self.quantities_lock:
+            self.open_trades = [
+                trade for trade, closed in zip(trades, exits) if not closed
             ]
-            if coin_signals:
-                coin = max(coin_signals, key=lambda x: x[1])[0]
+        if entries.size and can_open:
+            usd_amount = self.asset_quantities["USDT"] / (
+                self.max_open_positions - len(trades)
+            )
+            for index in entries:
+                coin = self.coin_list[index]
                 print(f"Coin Signal for  {coin}")
-                if self.asset_quantities["USDT"] > 10:
-                    self.open_trade(
-                        symbol=coin+"USDT",
-                        current_price=self.data_hist[coin][-1],
-                        target=self.data_hist[coin][-1] * self.take_profit,
-                        stop_loss=self.data_hist[coin][-1] * self.stop_loss,
-                    )
-                    self.update_asset_quantities()
-                else:
+                if usd_amount <= 10:
                     print("Not enought funds in the Binance account")
-
+                    break
+                price = self.data_hist[coin][-1]
+                orders.append(
+                    (
+                        f"open_order {coin}",
+                        functools.partial(
+                            self.open_trade,
+                            symbol=coin + "USDT",
+                            current_price=price,
+                            target=price * self.take_profit,
+                            stop_loss=price * self.stop_loss,
+                            usd_amount=usd_amount,
+                        ),
+                    )
+                )
+        if orders:
+            self.order_execution.run(orders)
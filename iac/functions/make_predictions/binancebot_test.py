@@ -6,9 +6,16 @@ import hmac
 import hashlib
 import time
 import datetime
+import tempfile
+import threading
 import requests
 
+import numpy as np
+
 from binancebot import BinanceBot
+from klinestore import KlineStore
+from ledger import TradeLedger
+from treemodel import TreeModel
 
 
 class MockBiqueryQuery:
@@ -18,11 +25,31 @@ class MockBiqueryQuery:
     def result(self):
         return self.rows
 
+class MockBucket:
+    def __init__(self) -> None:
+        self.blobs = {}
+
+    def blob(self, name):
+        bucket = self
+
+        class Blob:
+            def upload_from_string(self, data):
+                bucket.blobs[name] = data
+
+        return Blob()
+
+    def get_blob(self, name):
+        if name not in self.blobs:
+            return None
+        return mock.Mock(download_as_bytes=mock.Mock(return_value=self.blobs[name]))
+
+
 class MockResponse:
     def __init__(self, file_name, status_code):
         with open(file_name, "r") as file:
             self.json_data = json.load(file)
         self.status_code = status_code
+        self.headers = {}
         self.content = self.json_data
 
     def json(self):
@@ -31,6 +58,8 @@ class MockResponse:
 
 def mocked_binance_public(*args, **kwargs):
     if args[0][:38] == "https://api.binance.com/api/v3/ticker/":
+        if "symbols" in kwargs.get("params", {}):
+            return MockResponse("test_data/tickers.json", 200)
         return MockResponse("test_data/ticker.json", 200)
     if args[0][:37] == "https://api.binance.com/api/v3/klines":
         return MockResponse("test_data/full_history.json", 200)
@@ -67,16 +96,19 @@ class TestCases(unittest.TestCase):
         super().__init__(methodName)
         self.reset_bot()
 
-    @mock.patch("requests.get", side_effect=mocked_binance_public)
-    def reset_bot(self, mock_get):
+    @mock.patch("binancebot.BinanceBot.load_snapshot", return_value=False)
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def reset_bot(self, mock_get, mock_load_snapshot):
         self.bot = BinanceBot("parameters.json")
+        self.bot.kline_store = None
+        self.bot.ledger = TradeLedger(":memory:")
 
-    @mock.patch("requests.get", side_effect=mocked_binance_public)
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
     def test_get_asset_settings(self, mock_get):
         self.bot.get_asset_settings()
         self.assertEqual(
             self.bot.asset_params["BTCUSDT"],
-            {"minQty": 1e-5, "maxQty": 9e3, "stepSize": 1e-5},
+            {"minQty": 1e-5, "maxQty": 9e3, "stepSize": 1e-5, "tickSize": 0.01},
         )
 
     def test_load_parameters(self):
@@ -97,8 +129,16 @@ class TestCases(unittest.TestCase):
         self.assertEqual(
             self.bot.secrets_validity_seconds, data["secrets_validity_seconds"]
         )
+        self.assertEqual(
+            self.bot.models_validity_seconds, data["models_validity_seconds"]
+        )
+        self.assertEqual(self.bot.bucket, data["bucket"])
+        self.assertEqual(self.bot.kline_store_path, data["kline_store"])
+        self.assertEqual(self.bot.call_timeout_seconds, data["call_timeout_seconds"])
+        self.assertEqual(self.bot.ledger_path, data["ledger"])
+        self.assertEqual(self.bot.trace_file, data["trace_file"])
 
-    @mock.patch("requests.post", side_effect=mocked_binance_signed)
+    @mock.patch("requests.Session.post", side_effect=mocked_binance_signed)
     def test_create_buy_order(self, mock_post):
         self.bot.secret = {
             "api_private_key": "tralala",
@@ -119,7 +159,7 @@ class TestCases(unittest.TestCase):
         response = self.bot.create_buy_order("BTCUSDT", 10)
         self.assertEqual(response.status_code, 401)
 
-    @mock.patch("requests.post", side_effect=mocked_binance_signed)
+    @mock.patch("requests.Session.post", side_effect=mocked_binance_signed)
     def test_create_sell_order(self, mock_post):
         self.bot.secret = {
             "api_private_key": "tralala",
@@ -128,98 +168,611 @@ class TestCases(unittest.TestCase):
         response = self.bot.create_sell_order("BTCUSDT", 10)
         self.assertEqual(response.status_code, 200)
 
-    @mock.patch("requests.get", side_effect=mocked_binance_signed)
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_signed)
     def test_update_asset_quantities(self, mock_get):
         self.bot.secret = {
             "api_private_key": "tralala",
             "api_key": "trululu",
         }
         self.bot.update_asset_quantities()
-        self.assertEqual(200, 200)
+        self.assertAlmostEqual(self.bot.asset_quantities["BTC"], 0.00000423)
+
+        # The balances wait for the fills applied by the orders
+        self.bot.asset_quantities = {}
+        with self.bot.quantities_lock:
+            thread = threading.Thread(target=self.bot.update_asset_quantities)
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(self.bot.asset_quantities, {})
+        thread.join()
+        self.assertAlmostEqual(self.bot.asset_quantities["BTC"], 0.00000423)
+
+    def test_open_trades_lock(self):
+        # The open trades read from the ledger wait for the orders
+        self.bot.ledger.open_trade("BTCUSDT", 10, 11, 9, 1)
+        with self.bot.quantities_lock:
+            thread = threading.Thread(
+                target=self.bot.apply_open_trades, args=((None, {}, []),)
+            )
+            thread.start()
+            thread.join(0.2)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(self.bot.open_trades, [])
+        thread.join()
+        self.assertEqual(len(self.bot.open_trades), 1)
 
     def test_update_open_trade(self):
         self.bot.bq_client.query = mock.Mock(return_value=MockBiqueryQuery([]))
         self.bot.update_open_trade()
         self.assertEqual(self.bot.current_open_trade, None)
-        open_trade_dict =  {
+
+        # On a cold start, the open trades are read from BigQuery once
+        self.bot.ledger = TradeLedger(":memory:")
+        open_trade_dict = {
+            "ingestion_time": datetime.datetime.now(datetime.timezone.utc),
             "pair": "BTCUSDT",
+            "purchase_price": 1000,
             "target_price": 1010,
             "stop_loss_price": 980,
-            "ingestion_time": datetime.datetime.now(),
-            "purchase_price": 1000,
-            "quantity": 1
-            }
-        self.bot.bq_client.query = mock.Mock(return_value=MockBiqueryQuery([
-            open_trade_dict
-        ]))
+            "sale_price": None,
+            "quantity": 1,
+            "still_open": True,
+            "profit": None,
+            "paid_commissions": None,
+            "close_time": None,
+        }
+        self.bot.bq_client.query = mock.Mock(
+            return_value=MockBiqueryQuery([open_trade_dict])
+        )
         self.bot.update_open_trade()
+        self.bot.update_open_trade()
+        self.bot.bq_client.query.assert_called_once()
         self.assertEqual(self.bot.current_open_trade, open_trade_dict)
+        self.assertEqual(self.bot.ledger.pending(), [])
 
     def test_open_trade(self):
         self.bot.asset_quantities["USDT"] = 100
         self.bot.create_buy_order = mock.Mock(
             return_value=MockResponse("test_data/success_order.json", 200)
         )
-        self.bot.bq_client.query = mock.Mock(return_value=MockBiqueryQuery([]))
+        self.bot.bq_client.query = mock.Mock()
         self.bot.open_trade("BTCUSDT", 10, 11, 9)
 
-        self.bot.bq_client.query.assert_called_once()
+        self.bot.bq_client.query.assert_not_called()
+        self.assertEqual(self.bot.current_open_trade["pair"], "BTCUSDT")
+        self.assertEqual(self.bot.current_open_trade["quantity"], 10)
+        self.assertEqual(len(self.bot.ledger.pending()), 1)
 
         self.bot.create_buy_order = mock.Mock(
             return_value=MockResponse("test_data/signature_error.json", 401)
         )
-        self.bot.bq_client.query = mock.Mock()
-        self.bot.open_trade("BTCUSDT", 10, 11, 9)
-        self.bot.bq_client.query.assert_not_called()
+        with self.assertRaises(Exception):
+            self.bot.open_trade("ETHUSDT", 10, 11, 9)
+        self.assertEqual(len(self.bot.ledger.open_trades()), 1)
+
+    def test_open_trade_fill(self):
+        self.bot.asset_quantities = {"USDT": 200, "BTC": 0}
+        self.bot.create_buy_order = mock.Mock(
+            return_value=MockResponse("test_data/full_order.json", 200)
+        )
+        self.bot.open_trade("BTCUSDT", 10, 11, 9, usd_amount=100)
+
+        trade = self.bot.current_open_trade
+        self.assertAlmostEqual(trade["purchase_price"], 10.2)
+        self.assertAlmostEqual(trade["quantity"], 9.99)
+        self.assertAlmostEqual(trade["target_price"], 11.22)
+        self.assertAlmostEqual(trade["stop_loss_price"], 9.18)
+        self.assertAlmostEqual(self.bot.asset_quantities["USDT"], 98)
+        self.assertAlmostEqual(self.bot.asset_quantities["BTC"], 9.99)
+
+    def test_bracket_order(self):
+        self.reset_bot()
+        self.bot.order_mode = "bracket"
+        self.bot.asset_params["BTCUSDT"]["tickSize"] = 0.01
+        self.bot.bq_client.query = mock.Mock(return_value=MockBiqueryQuery([]))
+        self.bot.asset_quantities = {"USDT": 200, "BTC": 0}
+        self.bot.create_buy_order = mock.Mock(
+            return_value=MockResponse("test_data/full_order.json", 200)
+        )
+        self.bot.create_bracket_order = mock.Mock(
+            return_value=MockResponse("test_data/oco_order.json", 200)
+        )
+        brackets = self.bot.open_brackets
+        self.bot.open_trade("BTCUSDT", 10, 11, 9, usd_amount=100)
+
+        # The bracket is added to the open brackets, not replacing them
+        self.assertIs(self.bot.open_brackets, brackets)
+        trade = self.bot.current_open_trade
+        symbol, quantity, target, stop_loss = self.bot.create_bracket_order.call_args[0]
+        self.assertEqual(symbol, "BTCUSDT")
+        self.assertAlmostEqual(quantity, 9.99)
+        self.assertAlmostEqual(target, 11.22)
+        self.assertAlmostEqual(stop_loss, 9.18)
+        bracket = self.bot.open_brackets[trade["ingestion_time"]]
+        self.assertEqual(
+            (bracket["limit_order_id"], bracket["stop_order_id"]), (3, 2)
+        )
+
+        # Above its target, the trade is left to the exchange
+        self.bot.close_trade = mock.Mock()
+        self.bot.data_hist["BTC"] = [12]
+        self.bot.decide()
+        self.bot.close_trade.assert_not_called()
+        del self.bot.close_trade
+
+        # Still executing
+        self.bot.get_open_order_lists = mock.Mock(
+            return_value=mock.Mock(status_code=200, json=lambda: [{"orderListId": 0}])
+        )
+        self.bot.get_order = mock.Mock()
+        self.bot.update_open_trade()
+        self.bot.get_order.assert_not_called()
+        self.assertEqual(len(self.bot.open_trades), 1)
+
+        # The take profit leg filled
+        self.bot.get_open_order_lists.return_value = mock.Mock(
+            status_code=200, json=lambda: []
+        )
+        orders = {
+            3: {
+                "status": "FILLED",
+                "executedQty": "9.99",
+                "cummulativeQuoteQty": "112",
+            },
+            2: {"status": "EXPIRED"},
+        }
+        self.bot.get_order = lambda symbol, order_id: mock.Mock(
+            json=lambda: orders[order_id]
+        )
+        self.bot.update_open_trade()
+        self.assertEqual(self.bot.open_trades, [])
+        self.assertEqual(self.bot.open_brackets, {})
+        trade = self.bot.ledger.pending()[0]
+        self.assertAlmostEqual(trade["sale_price"], 112 / 9.99)
+        self.assertAlmostEqual(trade["profit"], 112 - 10.2 * 9.99)
+
+        # A trade closed on its time limit cancels its bracket first
+        response = MockResponse("test_data/oco_order.json", 200)
+        response.json_data["orderListId"] = 1
+        self.bot.create_bracket_order.return_value = response
+        self.bot.open_trade("BTCUSDT", 10, 11, 9, usd_amount=100)
+        trade = self.bot.current_open_trade
+        self.bot.cancel_bracket_order = mock.Mock(
+            return_value=mock.Mock(status_code=200)
+        )
+        self.bot.update_asset_quantities = mock.Mock()
+        self.bot.create_sell_order = mock.Mock(
+            return_value=MockResponse("test_data/success_order.json", 200)
+        )
+        self.bot.close_trade("BTC", trade["ingestion_time"], 10, 0)
+        self.bot.cancel_bracket_order.assert_called_once_with("BTCUSDT", 1)
+        self.bot.update_asset_quantities.assert_called_once()
+        self.assertEqual(self.bot.ledger.open_brackets(), {})
+        self.assertEqual(self.bot.ledger.open_trades(), [])
+
+    def test_bracket_cold_start(self):
+        # The brackets of the open trades are recovered from the exchange
+        self.reset_bot()
+        self.bot.order_mode = "bracket"
+        now = datetime.datetime.now(datetime.timezone.utc)
+        btc_time = now - datetime.timedelta(hours=2)
+        eth_time = now - datetime.timedelta(hours=30)
+        rows = [
+            {
+                "ingestion_time": trade_time,
+                "pair": pair,
+                "purchase_price": price,
+                "target_price": price * 1.1,
+                "stop_loss_price": price * 0.9,
+                "sale_price": None,
+                "quantity": quantity,
+                "still_open": True,
+                "profit": None,
+                "paid_commissions": None,
+                "close_time": None,
+            }
+            for trade_time, pair, price, quantity in [
+                (eth_time, "ETHUSDT", 2000, 0.5),
+                (btc_time, "BTCUSDT", 10.2, 9.99),
+            ]
+        ]
+        self.bot.bq_client.query = mock.Mock(return_value=MockBiqueryQuery(rows))
+
+        def order_list(order_list_id, symbol, placed_at):
+            return {
+                "orderListId": order_list_id,
+                "symbol": symbol,
+                "transactionTime": int(placed_at.timestamp() * 1000),
+                "orders": [
+                    {"symbol": symbol, "orderId": 10 * order_list_id + leg}
+                    for leg in (1, 2)
+                ],
+            }
+
+        order_lists = [
+            # Placed before the trade of its symbol, of a closed trade
+            order_list(6, "BTCUSDT", btc_time - datetime.timedelta(hours=1)),
+            order_list(7, "BTCUSDT", btc_time + datetime.timedelta(seconds=1)),
+            order_list(8, "ETHUSDT", eth_time + datetime.timedelta(seconds=1)),
+        ]
 
+        def get_order_lists(start_time, end_time):
+            self.assertLessEqual(end_time - start_time, 24 * 3600 * 1000)
+            response = mock.Mock(status_code=200)
+            response.json.return_value = [
+                x
+                for x in order_lists
+                if start_time <= x["transactionTime"] <= end_time
+            ]
+            return response
+
+        orders = {}
+        for symbol, order_list_id, quantity in [
+            ("BTCUSDT", 6, "1.00000000"),
+            ("BTCUSDT", 7, "9.99000000"),
+            ("ETHUSDT", 8, "0.50000000"),
+        ]:
+            for leg, order_type in [(1, "LIMIT_MAKER"), (2, "STOP_LOSS_LIMIT")]:
+                orders[10 * order_list_id + leg] = {
+                    "symbol": symbol,
+                    "orderId": 10 * order_list_id + leg,
+                    "type": order_type,
+                    "origQty": quantity,
+                    "status": "NEW",
+                }
+        # The take profit of the ETH trade filled while the bot was stopped
+        orders[81].update(status="FILLED", executedQty="0.5", cummulativeQuoteQty="1100")
+        orders[82]["status"] = "EXPIRED"
+        self.bot.get_order_lists = mock.Mock(side_effect=get_order_lists)
+        self.bot.get_order = lambda symbol, order_id: mock.Mock(
+            json=lambda: orders[order_id]
+        )
+        self.bot.get_open_order_lists = mock.Mock(
+            return_value=mock.Mock(status_code=200, json=lambda: [{"orderListId": 7}])
+        )
+        self.bot.update_open_trade()
+
+        self.assertEqual(self.bot.get_order_lists.call_count, 2)
+        self.assertEqual([x["pair"] for x in self.bot.open_trades], ["BTCUSDT"])
+        bracket = self.bot.open_brackets[btc_time]
+        self.assertEqual(bracket["order_list_id"], 7)
+        self.assertEqual(
+            (bracket["limit_order_id"], bracket["stop_order_id"]), (71, 72)
+        )
+        trade = self.bot.ledger.pending()[0]
+        self.assertEqual(trade["pair"], "ETHUSDT")
+        self.assertAlmostEqual(trade["sale_price"], 2200)
+        self.assertAlmostEqual(trade["profit"], 100)
+
+        # A trade leaving on its time limit cancels its recovered bracket
+        self.bot.cancel_bracket_order = mock.Mock(
+            return_value=mock.Mock(status_code=200)
+        )
+        self.bot.update_asset_quantities = mock.Mock()
+        self.bot.create_sell_order = mock.Mock(
+            return_value=MockResponse("test_data/success_order.json", 200)
+        )
+        self.bot.asset_quantities = {"BTC": 9.99}
+        self.bot.close_trade("BTC", btc_time, 10, 0)
+        self.bot.cancel_bracket_order.assert_called_once_with("BTCUSDT", 7)
 
     def test_close_trade(self):
+        ingestion_time = self.bot.ledger.open_trade("BTCUSDT", 10, 11, 9, 1)
         self.bot.asset_quantities["BTC"] = 1
+        self.bot.create_sell_order = mock.Mock(
+            return_value=MockResponse("test_data/signature_error.json", 401)
+        )
+        with self.assertRaises(Exception):
+            self.bot.close_trade("BTC", ingestion_time, 12, 1)
+        self.assertEqual(len(self.bot.ledger.open_trades()), 1)
+
         self.bot.create_sell_order = mock.Mock(
             return_value=MockResponse("test_data/success_order.json", 200)
         )
-        self.bot.bq_client.query = mock.Mock(return_value=MockBiqueryQuery([]))
-        self.bot.close_trade("BTC", 123, 12, 1)
-        self.bot.bq_client.query.assert_called_once()
+        self.bot.bq_client.query = mock.Mock()
+        self.bot.close_trade("BTC", ingestion_time, 12, 1)
+        self.bot.bq_client.query.assert_not_called()
+        self.assertEqual(self.bot.ledger.open_trades(), [])
+        self.assertEqual(self.bot.ledger.pending()[0]["sale_price"], 12)
 
+        # With the fill of a FULL response, sold at 10.2 instead of 12
+        ingestion_time = self.bot.ledger.open_trade("BTCUSDT", 10, 11, 9, 10)
+        self.bot.asset_quantities = {"USDT": 0, "BTC": 10}
         self.bot.create_sell_order = mock.Mock(
-            return_value=MockResponse("test_data/signature_error.json", 401)
+            return_value=MockResponse("test_data/full_sell_order.json", 200)
         )
+        self.bot.close_trade("BTC", ingestion_time, 12, 20)
+        trade = next(
+            trade
+            for trade in self.bot.ledger.pending()
+            if trade["ingestion_time"] == ingestion_time
+        )
+        self.assertAlmostEqual(trade["sale_price"], 10.2)
+        self.assertAlmostEqual(trade["profit"], 2)
+        self.bot.create_sell_order.assert_called_once_with("BTCUSDT", 10)
+        # The commissions of a sale are paid in USDT
+        self.assertAlmostEqual(self.bot.asset_quantities["USDT"], 101.898)
+        self.assertAlmostEqual(self.bot.asset_quantities["BTC"], 0)
+
+    def test_flush_ledger(self):
+        self.bot.ledger.open_trade("BTCUSDT", 10, 11, 9, 1)
         self.bot.bq_client.query = mock.Mock()
-        self.bot.close_trade("BTC", 123, 12, 1)
+        self.bot.flush_ledger()
+        self.bot.bq_client.query.assert_called_once()
+        self.assertEqual(self.bot.ledger.pending(), [])
+        self.bot.flush_ledger()
+        self.bot.bq_client.query.assert_called_once()
+
+    @mock.patch("asyncio.sleep", new_callable=mock.AsyncMock)
+    def test_flush_ledger_error(self, mock_sleep):
+        # A trade opened by a decision is flushed afterwards, in a task
+        self.reset_decision_bot()
+        self.bot.open_trade = lambda **kwargs: self.bot.ledger.open_trade(
+            kwargs["symbol"], 100, 101, 98, 10
+        )
+        self.bot.current_open_trade = None
+        self.bot.estimations["SOL"] = 0.8
+        self.bot.thresholds["SOL"] = 0.6
+        self.bot.data_hist["SOL"] = [100]
+        self.bot.bq_client.query = mock.Mock(side_effect=Exception("BigQuery error"))
+        self.bot.decide()
         self.bot.bq_client.query.assert_not_called()
+        self.bot.loop.run_until_complete(self.bot.schedule_flush())
+        self.assertEqual(self.bot.bq_client.query.call_count, 3)
+        self.assertEqual(mock_sleep.await_count, 2)
+        self.assertTrue(self.bot.flush_failed)
+        self.assertEqual(len(self.bot.ledger.pending()), 1)
 
-    @mock.patch("requests.get", side_effect=mocked_binance_public)
+        # No trade opened while the ledger is not flushed, only exits
+        self.bot.open_trade = mock.Mock()
+        self.bot.open_trades = []
+        self.bot.decide()
+        self.bot.open_trade.assert_not_called()
+
+        # Entries again once a flush succeeds
+        self.bot.bq_client.query = mock.Mock()
+        self.bot.loop.run_until_complete(self.bot.schedule_flush())
+        self.bot.bq_client.query.assert_called_once()
+        self.assertFalse(self.bot.flush_failed)
+        self.assertEqual(self.bot.ledger.pending(), [])
+        self.bot.decide()
+        self.bot.open_trade.assert_called_once()
+
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
     def test_update_full_history(self, mock_get):
         coin = "BTC"
         self.bot.update_estimation = mock.Mock()
         self.bot.update_full_history(coin)
         self.assertEqual(self.bot.data_hist[coin][-1], 44057.45)
 
-    @mock.patch("requests.get", side_effect=mocked_binance_public)
-    def test_update_latest_price(self, mock_get):
-        coin = "BTC"
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def test_update_full_history_store(self, mock_get):
+        with open("test_data/full_history.json", "r") as file:
+            klines = json.load(file)
+        self.bot.update_estimation = mock.Mock()
+        with tempfile.TemporaryDirectory() as directory:
+            self.bot.kline_store = KlineStore(directory)
+            # One day of minutes stored before the ones returned by the API
+            self.bot.kline_store.write(
+                "BTCUSDT",
+                [
+                    [klines[0][0] - (1441 - i) * 60000] + klines[0][1:]
+                    for i in range(1441)
+                ],
+            )
+            with mock.patch("time.time", return_value=klines[-1][0] / 1000 + 30):
+                self.bot.update_full_history("BTC")
+            mock_get.assert_called_once()
+            self.assertIn(
+                f"startTime={klines[0][0] - 60000}", mock_get.call_args[0][0]
+            )
+            self.assertEqual(self.bot.kline_store.length("BTCUSDT"), 1441 + 720)
+            self.assertEqual(len(self.bot.data_hist["BTC"]), 1441)
+            self.assertEqual(self.bot.data_hist["BTC"][-1], 44057.45)
+            self.assertEqual(self.bot.data_hist["BTC"][-720], 43969.91)
+
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def test_update_full_history_store_gap(self, mock_get):
+        with open("test_data/full_history.json", "r") as file:
+            klines = json.load(file)
+        self.bot.update_estimation = mock.Mock()
+        with tempfile.TemporaryDirectory() as directory:
+            self.bot.kline_store = KlineStore(directory)
+            # A minute of the last stored day is missing
+            self.bot.kline_store.write(
+                "BTCUSDT",
+                [
+                    [klines[0][0] - (1442 - i) * 60000] + klines[0][1:]
+                    for i in range(1442)
+                    if i != 1000
+                ],
+            )
+            with mock.patch("time.time", return_value=klines[-1][0] / 1000 + 30):
+                self.bot.update_full_history("BTC")
+            # The day is fetched again from the API
+            self.assertEqual(mock_get.call_count, 3)
+            self.assertIn("limit=720", mock_get.call_args_list[1][0][0])
+            self.assertEqual(self.bot.data_hist["BTC"][-1], 44057.45)
+
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def test_update_latest_prices(self, mock_get):
         self.bot.update_estimation = mock.Mock()
-        self.bot.update_latest_price(coin)
-        self.assertEqual(self.bot.data_hist[coin][-1], 42069)
+        self.bot.update_latest_prices(["BTC", "ETH", "SOL"])
+        mock_get.assert_called_once()
+        self.assertEqual(self.bot.data_hist["BTC"][-1], 42069)
+        self.assertEqual(self.bot.data_hist["ETH"][-1], 3120.5)
+        self.assertEqual(self.bot.data_hist["SOL"][-1], 98.76)
 
-    @mock.patch("requests.get", side_effect=requests.exceptions.ConnectionError())
-    def test_update_latest_price_error(self, mock_get):
+    @mock.patch("requests.Session.get", side_effect=requests.exceptions.ConnectionError())
+    def test_update_latest_prices_error(self, mock_get):
         self.bot.update_estimation = mock.Mock()
         with self.assertRaises(SystemExit):
-            self.bot.update_latest_price("BTC")
+            self.bot.update_latest_prices(["BTC"])
 
     def test_update_estimation(self):
         self.reset_bot()
         self.bot.bq_client.query = mock.Mock(
-            return_value=MockBiqueryQuery([{"prob": 0.8}])
+            return_value=MockBiqueryQuery([{"coin": "BTC", "prob": 0.8}])
         )
-        self.bot.data_hist["BTC"] = range(1441)
+        self.bot.data_hist["BTC"].reset(range(1441))
         self.bot.update_estimation("BTC")
         self.assertEqual(self.bot.estimations["BTC"], 0.8)
 
+    def test_update_estimations(self):
+        self.reset_bot()
+        with open("test_data/bt_btc.json", "rb") as file:
+            self.bot.models["BTC"] = TreeModel.from_bytes(file.read())
+        self.bot.bq_client.query = mock.Mock(
+            return_value=MockBiqueryQuery(
+                [{"coin": "ETH", "prob": 0.6}, {"coin": "SOL", "prob": 0.7}]
+            )
+        )
+        for coin in ["BTC", "ETH", "SOL"]:
+            self.bot.data_hist[coin].reset(range(1, 1442))
+        self.bot.update_estimations()
+        # A single job for the coins without exported model
+        self.bot.bq_client.query.assert_called_once()
+        query = self.bot.bq_client.query.call_args[0][0]
+        self.assertEqual(query.count("ML.PREDICT"), 2)
+        self.assertIn("@features_eth", query)
+        self.assertNotIn("bt_btc", query)
+        parameters = self.bot.bq_client.query.call_args[1][
+            "job_config"
+        ].query_parameters
+        self.assertEqual([p.name for p in parameters], ["features_eth", "features_sol"])
+        self.assertEqual(parameters[0].values, self.bot.feature_row("ETH").tolist())
+        self.assertIn("features[OFFSET(69)] AS value_eth_1440", query)
+        self.assertNotIn("OFFSET(70)", query)
+        self.assertEqual(self.bot.estimations["ETH"], 0.6)
+        self.assertEqual(self.bot.estimations["SOL"], 0.7)
+        self.assertIn("BTC", self.bot.estimations)
+
+    def test_update_estimations_missing_model(self):
+        # The batched job fails on the missing model of a coin
+        self.reset_bot()
+
+        class MockFailingQuery:
+            def result(self):
+                raise Exception("Not found: Model bt_sol")
+
+        def query(text, job_config):
+            if "bt_sol" in text:
+                return MockFailingQuery()
+            return MockBiqueryQuery(
+                [{"coin": coin, "prob": 0.6} for coin in ["BTC", "ETH"] if coin in text]
+            )
+
+        self.bot.bq_client.query = mock.Mock(side_effect=query)
+        for coin in ["BTC", "ETH", "SOL"]:
+            self.bot.data_hist[coin].reset(range(1, 1442))
+        self.bot.update_estimations()
+        # Then one job per coin
+        self.assertEqual(self.bot.bq_client.query.call_count, 4)
+        queries = [call[0][0] for call in self.bot.bq_client.query.call_args_list]
+        self.assertEqual([query.count("ML.PREDICT") for query in queries], [3, 1, 1, 1])
+        self.assertEqual(self.bot.estimations["BTC"], 0.6)
+        self.assertEqual(self.bot.estimations["ETH"], 0.6)
+        self.assertNotIn("SOL", self.bot.estimations)
+
+    def test_update_estimation_local(self):
+        self.reset_bot()
+        with open("test_data/bt_btc.json", "rb") as file:
+            self.bot.models["BTC"] = TreeModel.from_bytes(file.read())
+        with open("test_data/bt_btc_predictions.json", "r") as file:
+            row = json.load(file)[0]
+        self.bot.bq_client.query = mock.Mock()
+        history = [0.0] * 1441
+        for index, value in zip(self.bot.indexes, row["features"]):
+            history[1440 - index] = value
+        history[61] = 1441 - sum(history)
+        self.bot.data_hist["BTC"].reset(history)
+        self.bot.update_estimation("BTC")
+        self.bot.bq_client.query.assert_not_called()
+        self.assertAlmostEqual(self.bot.estimations["BTC"], row["prob"], places=6)
+
+    def test_update_models(self):
+        self.reset_bot()
+        with open("test_data/bt_btc.json", "rb") as file:
+            model = file.read()
+        blob = mock.Mock(generation=1)
+        blob.download_as_bytes = mock.Mock(return_value=model)
+        bucket = mock.Mock()
+        bucket.get_blob = mock.Mock(
+            side_effect=lambda name: blob if name == "models/bt_btc/model.bst" else None
+        )
+        self.bot.gcs_client.bucket = mock.Mock(return_value=bucket)
+        self.bot.update_models()
+        self.assertIn("BTC", self.bot.models)
+        self.assertNotIn("ETH", self.bot.models)
+        self.assertIn("timestamp", self.bot.models)
+        self.bot.update_models()
+        blob.download_as_bytes.assert_called_once()
+
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def test_update_missing_history(self, mock_get):
+        self.bot.update_estimation = mock.Mock()
+        self.bot.data_hist["BTC"].reset(range(1441))
+        self.bot.update_missing_history("BTC", 1644914220000)
+        self.assertEqual(len(self.bot.data_hist["BTC"]), 1441)
+        self.assertEqual(self.bot.data_hist["BTC"][-1], 44057.45)
+
+    def test_update_missing_history_pages(self):
+        now = 1644914220000
+        start_time = now - 1200 * 60000
+
+        def klines(*args, **kwargs):
+            start = int(args[0].split("startTime=")[1].split("&")[0])
+            open_times = range(start, min(start + 1000 * 60000, now + 60000), 60000)
+            response = mock.Mock(status_code=200, headers={})
+            response.json.return_value = [
+                [open_time, "0", "0", "0", str(open_time), "1"]
+                for open_time in open_times
+            ]
+            return response
+
+        self.bot.data_hist["BTC"].reset(range(1441))
+        with mock.patch("requests.Session.get", side_effect=klines) as mock_get:
+            self.bot.update_missing_history("BTC", start_time)
+        # The 1201 minutes of the gap, up to the current one, in two requests
+        self.assertEqual(mock_get.call_count, 2)
+        history = list(self.bot.data_hist["BTC"])
+        self.assertEqual(history[-1], now)
+        self.assertEqual(history[-1201], start_time)
+        steps = np.diff(history[-1201:])
+        self.assertTrue(np.all(steps == 60000))
+
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def test_snapshot(self, mock_get):
+        self.reset_bot()
+        bucket = MockBucket()
+        self.bot.gcs_client.bucket = mock.Mock(return_value=bucket)
+        self.bot.get_asset_settings()
+        self.bot.thresholds = {"BTC": 0.7, "timestamp": 12}
+        self.bot.last_ticks = {"BTC": 1644914220, "ETH": 1644914160, "SOL": 0}
+        self.bot.data_hist["BTC"].reset(range(2000))
+        self.bot.save_snapshot()
+
+        self.reset_bot()
+        self.bot.gcs_client.bucket = mock.Mock(return_value=bucket)
+        self.assertTrue(self.bot.load_snapshot())
+        self.assertEqual(self.bot.thresholds, {"BTC": 0.7, "timestamp": 12})
+        self.assertEqual(
+            self.bot.last_ticks, {"BTC": 1644914220, "ETH": 1644914160, "SOL": 0}
+        )
+        self.assertEqual(
+            self.bot.asset_params["BTCUSDT"],
+            {"minQty": 1e-5, "maxQty": 9e3, "stepSize": 1e-5, "tickSize": 0.01},
+        )
+        self.assertEqual(list(self.bot.data_hist["BTC"]), list(range(559, 2000)))
+        self.assertEqual(len(self.bot.data_hist["ETH"]), 0)
+
+        self.bot.gcs_client.bucket = mock.Mock(return_value=MockBucket())
+        self.assertFalse(self.bot.load_snapshot())
+
     def test_update_thresholds(self):
         self.reset_bot()
+        self.bot.gcs_client.bucket = mock.Mock(return_value=MockBucket())
         self.bot.bq_client.query = mock.Mock(
             return_value=MockBiqueryQuery(
                 [
@@ -232,6 +785,39 @@ class TestCases(unittest.TestCase):
         self.assertEqual(self.bot.thresholds["BTC"], 0.9)
         self.assertEqual(self.bot.thresholds["ETH"], 0.8)
 
+    def test_update_thresholds_file(self):
+        self.reset_bot()
+        blob = mock.Mock(generation=1)
+        blob.download_as_bytes = mock.Mock(
+            return_value=json.dumps({"BTC": 0.65, "ETH": 0.7}).encode("utf-8")
+        )
+        bucket = mock.Mock()
+        bucket.get_blob = mock.Mock(return_value=blob)
+        self.bot.gcs_client.bucket = mock.Mock(return_value=bucket)
+        self.bot.bq_client.query = mock.Mock(
+            return_value=MockBiqueryQuery(
+                [
+                    {"coin": "SOL", "threshold": "0.9"},
+                    {"coin": "ETH", "threshold": "0.8"},
+                ]
+            )
+        )
+        self.bot.update_thresholds()
+        self.assertEqual(self.bot.thresholds["BTC"], 0.65)
+        self.assertEqual(self.bot.thresholds["ETH"], 0.7)
+        self.assertEqual(self.bot.thresholds["SOL"], 0.9)
+        # The file is only downloaded again when it changes
+        self.bot.update_thresholds()
+        blob.download_as_bytes.assert_called_once()
+        blob.download_as_bytes.return_value = json.dumps(
+            {"BTC": 0.6, "ETH": 0.6, "SOL": 0.6}
+        ).encode("utf-8")
+        blob.generation = 2
+        self.bot.update_thresholds()
+        self.assertEqual(self.bot.thresholds["SOL"], 0.6)
+        # The table is only queried while the file misses a coin
+        self.assertEqual(self.bot.bq_client.query.call_count, 2)
+
     def test_update_secrets(self):
         self.reset_bot()
         returner = mock.MagicMock()
@@ -241,60 +827,211 @@ class TestCases(unittest.TestCase):
         self.assertEqual(self.bot.secret["api_private_key"], "ha")
         self.assertEqual(self.bot.secret["api_key"], "ha")
 
+    def mock_information(self):
+        self.bot.fetch_open_trades = mock.Mock(return_value=(None, {}, []))
+        self.bot.fetch_asset_quantities = mock.Mock(return_value={"USDT": 1000})
+        self.bot.fetch_thresholds = mock.Mock(return_value=({}, None, {}))
+        self.bot.fetch_secrets = mock.Mock(return_value={})
+        self.bot.fetch_models = mock.Mock(return_value={})
+
     def test_update_information(self):
         # Without history
         self.reset_bot()
 
-        self.bot.update_open_trade = mock.Mock()
-        self.bot.update_thresholds = mock.Mock()
-        self.bot.update_secrets = mock.Mock()
-        self.bot.update_asset_quantities = mock.Mock()
-        self.bot.update_full_history = mock.Mock()
+        self.mock_information()
+        self.bot.fetch_full_history = mock.Mock(return_value=range(1441))
+        self.bot.estimate = mock.Mock(return_value={"BTC": 0.6})
 
-        self.bot.update_information()
+        self.assertTrue(self.bot.update_information())
 
-        self.bot.update_open_trade.assert_called_once()
-        self.bot.update_thresholds.assert_called_once()
-        self.bot.update_secrets.assert_called_once()
-        self.bot.update_asset_quantities.assert_called_once()
-        self.bot.update_full_history.assert_any_call("BTC")
-        self.bot.update_full_history.assert_any_call("ETH")
-        self.bot.update_full_history.assert_any_call("SOL")
+        self.bot.fetch_open_trades.assert_called_once()
+        self.bot.fetch_thresholds.assert_called_once()
+        self.bot.fetch_secrets.assert_called_once()
+        self.bot.fetch_models.assert_called_once()
+        self.bot.fetch_asset_quantities.assert_called_once()
+        self.assertEqual(self.bot.asset_quantities["USDT"], 1000)
+        self.bot.fetch_full_history.assert_any_call("BTC")
+        self.bot.fetch_full_history.assert_any_call("ETH")
+        self.bot.fetch_full_history.assert_any_call("SOL")
+        self.assertEqual(len(self.bot.data_hist["SOL"]), 1441)
+        self.bot.estimate.assert_called_once()
+        self.assertEqual(len(self.bot.estimate.call_args[0][0]), 3)
+        self.assertEqual(self.bot.estimations["BTC"], 0.6)
 
         # With existing history, secrets and thresholds
         self.reset_bot()
 
-        self.bot.update_open_trade = mock.Mock()
-        self.bot.update_asset_quantities = mock.Mock()
-        self.bot.update_latest_price = mock.Mock()
+        self.mock_information()
+        self.bot.fetch_latest_prices = mock.Mock(
+            return_value={"BTC": 1.0, "ETH": 2.0, "SOL": 3.0}
+        )
+        self.bot.estimate = mock.Mock(return_value={})
         self.bot.secret = {"timestamp": time.time()}
         self.bot.thresholds = {"timestamp": time.time()}
+        self.bot.models = {"timestamp": time.time()}
+        self.bot.last_ticks = dict.fromkeys(["BTC", "ETH", "SOL"], time.time() - 60)
         for coin in ["BTC", "ETH", "SOL"]:
-            self.bot.data_hist[coin] = range(1441)
+            self.bot.data_hist[coin].reset(range(1441))
 
         self.bot.update_information()
 
-        self.bot.update_open_trade.assert_called_once()
-        self.bot.update_asset_quantities.assert_called_once()
-        self.bot.update_latest_price.assert_any_call("BTC")
-        self.bot.update_latest_price.assert_any_call("ETH")
-        self.bot.update_latest_price.assert_any_call("SOL")
+        self.bot.fetch_open_trades.assert_called_once()
+        self.bot.fetch_asset_quantities.assert_called_once()
+        self.bot.fetch_thresholds.assert_not_called()
+        self.bot.fetch_latest_prices.assert_called_once_with(["BTC", "ETH", "SOL"])
+        self.assertEqual(self.bot.data_hist["SOL"][-1], 3.0)
+
+        # With existing history, after some missed ticks
+        self.bot.fetch_latest_prices = mock.Mock()
+        self.bot.fetch_missing_history = mock.Mock(return_value=[])
+        self.bot.last_ticks = dict.fromkeys(
+            ["BTC", "ETH", "SOL"], (time.time() // 60 - 10) * 60
+        )
+
+        self.bot.update_information()
+
+        self.bot.fetch_latest_prices.assert_not_called()
+        self.bot.fetch_missing_history.assert_any_call(
+            "BTC", (time.time() // 60 - 9) * 60000
+        )
+        self.assertEqual(self.bot.fetch_missing_history.call_count, 3)
+
+    def test_update_information_failed_history(self):
+        # The missed minutes of a coin whose fetch failed are fetched again
+        self.reset_bot()
+        self.mock_information()
+        for coin in ["BTC", "ETH", "SOL"]:
+            self.bot.data_hist[coin].reset(range(1441))
+        last_tick = (time.time() // 60 - 10) * 60
+        self.bot.last_ticks = dict.fromkeys(["BTC", "ETH", "SOL"], last_tick)
+
+        def missing_history(coin, start_time):
+            if coin == "BTC":
+                raise SystemExit("Timeout")
+            return []
+
+        self.bot.fetch_missing_history = mock.Mock(side_effect=missing_history)
+        self.bot.estimate = mock.Mock(return_value={})
+        self.bot.update_information()
+        self.assertEqual(self.bot.last_ticks["BTC"], last_tick)
+        self.assertGreater(self.bot.last_ticks["ETH"], last_tick)
+
+        self.bot.fetch_missing_history = mock.Mock(return_value=[])
+        self.bot.fetch_latest_prices = mock.Mock(return_value={})
+        self.bot.update_information()
+        self.bot.fetch_missing_history.assert_called_once_with(
+            "BTC", (last_tick // 60 + 1) * 60000
+        )
+        self.assertGreater(self.bot.last_ticks["BTC"], last_tick)
+
+    def test_update_information_deadline(self):
+        self.reset_bot()
+        self.bot.call_timeout_seconds = 0.2
+        self.mock_information()
+        self.bot.fetch_open_trades = mock.Mock(side_effect=lambda: time.sleep(2))
+        self.bot.fetch_thresholds = mock.Mock(side_effect=ValueError())
+        self.bot.fetch_full_history = mock.Mock(return_value=range(1441))
+        self.bot.estimate = mock.Mock(return_value={})
+        start = time.time()
+        # Without the open trades, the decision only closes trades
+        self.assertFalse(self.bot.update_information())
+        self.assertLess(time.time() - start, 1)
+        self.bot.fetch_secrets.assert_called_once()
+        self.assertEqual(self.bot.fetch_full_history.call_count, 3)
+
+    def test_update_information_late_results(self):
+        # The prices of a call given up on are not written after the tick
+        self.reset_bot()
+        self.bot.call_timeout_seconds = 0.2
+        self.mock_information()
+        for coin in ["BTC", "ETH", "SOL"]:
+            self.bot.data_hist[coin].reset(range(1441))
+        last_tick = time.time() - 60
+        self.bot.last_ticks = dict.fromkeys(["BTC", "ETH", "SOL"], last_tick)
+
+        def late_prices(coins):
+            time.sleep(0.5)
+            return {coin: -1.0 for coin in coins}
+
+        def late_open_trades():
+            time.sleep(0.5)
+            return [], {}, []
+
+        def late_balances():
+            time.sleep(0.5)
+            return {"USDT": 5.0}
+
+        self.bot.fetch_latest_prices = mock.Mock(side_effect=late_prices)
+        self.bot.fetch_open_trades = mock.Mock(side_effect=late_open_trades)
+        self.bot.fetch_asset_quantities = mock.Mock(side_effect=late_balances)
+        self.bot.estimate = mock.Mock(return_value={})
+        self.assertFalse(self.bot.update_information())
+        time.sleep(0.5)
+        self.bot.fetch_latest_prices.assert_called_once()
+        self.assertEqual(len(self.bot.data_hist["BTC"]), 1441)
+        self.assertEqual(self.bot.data_hist["BTC"][-1], 1440)
+        self.assertEqual(self.bot.last_ticks["BTC"], last_tick)
+        # Nor the open trades and the balances
+        self.assertFalse(self.bot.ledger.bootstrapped)
+        self.assertEqual(self.bot.asset_quantities, {})
+
+    def test_tick(self):
+        self.reset_bot()
+        self.bot.gather_information = mock.AsyncMock(return_value=True)
+        self.bot.decide = mock.Mock()
+        self.bot.save_snapshot = mock.Mock()
+        self.bot.tick()
+        self.bot.gather_information.assert_awaited_once()
+        self.bot.decide.assert_called_once_with(True)
+        self.bot.save_snapshot.assert_called_once()
+        # The loop and its threads are kept for the next tick
+        with tempfile.TemporaryDirectory() as directory:
+            self.bot.trace_file = f"{directory}/trace.json"
+            self.bot.tick()
+            with open(self.bot.trace_file, "r") as file:
+                trace = json.load(file)
+        self.assertEqual(self.bot.decide.call_count, 2)
+        self.assertEqual(self.bot.timeline.count, 2)
+        self.assertEqual(self.bot.timeline.summary()["decide"]["count"], 2)
+        names = [event["name"] for event in trace["traceEvents"]]
+        self.assertEqual(names.count("tick"), 2)
+        self.assertIn("save_snapshot", names)
+        # Only exits when the open trades or the balances were not refreshed
+        self.bot.trace_file = None
+        self.bot.gather_information.return_value = False
+        self.bot.tick()
+        self.bot.decide.assert_called_with(False)
+        # The trades changed by the decision are flushed before the tick ends
+        self.bot.decide.side_effect = lambda entries: self.bot.ledger.open_trade(
+            "BTCUSDT", 10, 11, 9, 1
+        )
+        self.bot.bq_client.query = mock.Mock()
+        self.bot.tick()
+        self.bot.bq_client.query.assert_called_once()
+        self.assertEqual(self.bot.ledger.pending(), [])
+
+    def reset_decision_bot(self):
+        self.reset_bot()
+        self.bot.asset_quantities = {"USDT": 1000}
+        self.bot.update_asset_quantities = mock.Mock()
+        self.bot.open_trade = mock.Mock()
+        self.bot.close_trade = mock.Mock()
 
     def test_decision_function(self):
         # No open trade, no signal
-        self.reset_bot()
+        self.reset_decision_bot()
         self.bot.current_open_trade = None
         for coin in ["BTC", "ETH", "SOL"]:
             self.bot.estimations[coin] = 0.5
             self.bot.thresholds[coin] = 0.6
-        self.bot.open_trade = mock.Mock()
 
         self.bot.decide()
 
         self.bot.open_trade.assert_not_called()
+        self.bot.update_asset_quantities.assert_not_called()
 
         # No open trade, one signal
-        self.reset_bot()
+        self.reset_decision_bot()
         self.bot.current_open_trade = None
         for coin in ["BTC", "ETH"]:
             self.bot.estimations[coin] = 0.5
@@ -302,16 +1039,20 @@ class TestCases(unittest.TestCase):
         self.bot.estimations["SOL"] = 0.8
         self.bot.thresholds["SOL"] = 0.6
         self.bot.data_hist["SOL"] = [100]
-        self.bot.open_trade = mock.Mock()
 
         self.bot.decide()
 
         self.bot.open_trade.assert_called_once_with(
-            symbol="SOLUSDT", current_price=100, target=101.0, stop_loss=98.0
+            symbol="SOLUSDT",
+            current_price=100,
+            target=101.0,
+            stop_loss=98.0,
+            usd_amount=1000,
         )
+        self.bot.update_asset_quantities.assert_not_called()
 
         # No open trade, two signals
-        self.reset_bot()
+        self.reset_decision_bot()
         self.bot.current_open_trade = None
         for coin in ["BTC"]:
             self.bot.estimations[coin] = 0.5
@@ -321,16 +1062,30 @@ class TestCases(unittest.TestCase):
         self.bot.data_hist["SOL"] = [100]
         self.bot.estimations["ETH"] = 0.7
         self.bot.thresholds["ETH"] = 0.6
-        self.bot.open_trade = mock.Mock()
 
         self.bot.decide()
 
         self.bot.open_trade.assert_called_once_with(
-            symbol="SOLUSDT", current_price=100, target=101.0, stop_loss=98.0
+            symbol="SOLUSDT",
+            current_price=100,
+            target=101.0,
+            stop_loss=98.0,
+            usd_amount=1000,
         )
 
+        # No open trade, not enough funds
+        self.reset_decision_bot()
+        self.bot.asset_quantities["USDT"] = 5
+        self.bot.estimations["SOL"] = 0.8
+        self.bot.thresholds["SOL"] = 0.6
+        self.bot.data_hist["SOL"] = [100]
+
+        self.bot.decide()
+
+        self.bot.open_trade.assert_not_called()
+
         # An open trade, nothing to do
-        self.reset_bot()
+        self.reset_decision_bot()
         self.bot.current_open_trade = {
             "pair": "BTCUSDT",
             "target_price": 1010,
@@ -340,15 +1095,18 @@ class TestCases(unittest.TestCase):
             "quantity": 1,
         }
         self.bot.data_hist["BTC"] = [1000]
-        self.bot.close_trade = mock.Mock()
+        # A signal does not open a second trade
+        self.bot.estimations["SOL"] = 0.8
+        self.bot.thresholds["SOL"] = 0.6
 
         self.bot.decide()
 
         self.bot.close_trade.assert_not_called()
+        self.bot.open_trade.assert_not_called()
 
         # An open trade, reaching target
-        self.reset_bot()
-        self.bot.current_open_trade = {
+        self.reset_decision_bot()
+        trade = {
             "pair": "BTCUSDT",
             "target_price": 1010,
             "stop_loss_price": 980,
@@ -356,51 +1114,137 @@ class TestCases(unittest.TestCase):
             "purchase_price": 1000,
             "quantity": 1,
         }
+        self.bot.current_open_trade = trade
         self.bot.data_hist["BTC"] = [1020]
-        self.bot.close_trade = mock.Mock()
+        # No new trade on the tick where the previous one is closed
+        self.bot.estimations["SOL"] = 0.8
+        self.bot.thresholds["SOL"] = 0.6
 
         self.bot.decide()
 
         self.bot.close_trade.assert_called_once_with(
-            "BTC", self.bot.current_open_trade["ingestion_time"], 1020, 20.0
+            "BTC", trade["ingestion_time"], 1020, 20.0
         )
+        self.bot.open_trade.assert_not_called()
+        self.assertIsNone(self.bot.current_open_trade)
+        self.bot.update_asset_quantities.assert_not_called()
 
         # An open trade, reaching stop loss
-        self.reset_bot()
-        self.bot.current_open_trade = {
-            "pair": "BTCUSDT",
-            "target_price": 1010,
-            "stop_loss_price": 980,
-            "ingestion_time": datetime.datetime.now(),
-            "purchase_price": 1000,
-            "quantity": 1,
-        }
+        self.reset_decision_bot()
+        trade = dict(trade)
+        self.bot.current_open_trade = trade
         self.bot.data_hist["BTC"] = [970]
-        self.bot.close_trade = mock.Mock()
 
         self.bot.decide()
 
         self.bot.close_trade.assert_called_once_with(
-            "BTC", self.bot.current_open_trade["ingestion_time"], 970, -30.0
+            "BTC", trade["ingestion_time"], 970, -30.0
         )
 
         # An open trade, reaching the time limit
-        self.reset_bot()
-        self.bot.current_open_trade = {
+        self.reset_decision_bot()
+        trade = dict(
+            trade,
+            ingestion_time=datetime.datetime.now() - datetime.timedelta(hours=1),
+        )
+        self.bot.current_open_trade = trade
+        self.bot.data_hist["BTC"] = [1000]
+
+        self.bot.decide()
+
+        self.bot.close_trade.assert_called_once_with(
+            "BTC", trade["ingestion_time"], 1000, 0.0
+        )
+
+    def test_decision_without_entries(self):
+        # Without fresh open trades and balances, only the exits are made
+        self.reset_decision_bot()
+        trade = {
             "pair": "BTCUSDT",
             "target_price": 1010,
             "stop_loss_price": 980,
-            "ingestion_time": datetime.datetime.now() - datetime.timedelta(hours=1),
+            "ingestion_time": datetime.datetime.now(),
             "purchase_price": 1000,
             "quantity": 1,
         }
+        self.bot.max_open_positions = 3
+        self.bot.open_trades = [trade]
+        self.bot.data_hist["BTC"] = [1020]
+        self.bot.estimations["SOL"] = 0.8
+        self.bot.thresholds["SOL"] = 0.6
+        self.bot.data_hist["SOL"] = [100]
+
+        self.bot.decide(False)
+
+        self.bot.close_trade.assert_called_once_with(
+            "BTC", trade["ingestion_time"], 1020, 20.0
+        )
+        self.bot.open_trade.assert_not_called()
+
+    def test_decision_portfolio(self):
+        self.reset_decision_bot()
+        self.bot.max_open_positions = 3
+        now = datetime.datetime.now()
+        self.bot.open_trades = [
+            {
+                "pair": "BTCUSDT",
+                "target_price": 1010,
+                "stop_loss_price": 980,
+                "ingestion_time": now,
+                "purchase_price": 1000,
+                "quantity": 1,
+            },
+            {
+                "pair": "ETHUSDT",
+                "target_price": 101,
+                "stop_loss_price": 98,
+                "ingestion_time": now,
+                "purchase_price": 100,
+                "quantity": 2,
+            },
+        ]
         self.bot.data_hist["BTC"] = [1000]
-        self.bot.close_trade = mock.Mock()
+        self.bot.data_hist["ETH"] = [102]
+        self.bot.data_hist["SOL"] = [50]
+        for coin in ["BTC", "ETH", "SOL"]:
+            self.bot.estimations[coin] = 0.9
+            self.bot.thresholds[coin] = 0.6
 
         self.bot.decide()
 
-        self.bot.close_trade.assert_called_once_with(
-            "BTC", self.bot.current_open_trade["ingestion_time"], 1000, 0.0
+        # ETH is closed, its slot is only used on the next tick, and the
+        # coins held are not bought again
+        self.bot.close_trade.assert_called_once_with("ETH", now, 102, 4.0)
+        self.bot.open_trade.assert_called_once_with(
+            symbol="SOLUSDT",
+            current_price=50,
+            target=50.5,
+            stop_loss=49.0,
+            usd_amount=1000,
+        )
+        self.assertEqual(
+            [trade["pair"] for trade in self.bot.open_trades], ["BTCUSDT"]
+        )
+
+        # The available USDT is split between the free slots
+        self.reset_decision_bot()
+        self.bot.max_open_positions = 3
+        self.bot.data_hist["ETH"] = [100]
+        self.bot.data_hist["SOL"] = [50]
+        self.bot.estimations["ETH"] = 0.7
+        self.bot.estimations["SOL"] = 0.8
+        self.bot.thresholds["ETH"] = 0.6
+        self.bot.thresholds["SOL"] = 0.6
+
+        self.bot.decide()
+
+        # The orders are sent concurrently
+        self.assertCountEqual(
+            [call.kwargs["symbol"] for call in self.bot.open_trade.call_args_list],
+            ["SOLUSDT", "ETHUSDT"],
+        )
+        self.assertAlmostEqual(
+            self.bot.open_trade.call_args.kwargs["usd_amount"], 1000 / 3
         )
 
 
@@ -0,0 +1,55 @@
+"""
+BinanceClient Class module
+"""
+import requests
+from requests.adapters import HTTPAdapter
+
+from weightbudget import WeightBudget, endpoint
+
+BINANCE_URL = "https://api.binance.com"
+
+
+class BinanceClient:
+    """
+    HTTP client shared by all the calls to the Binance API. It keeps a pool of
+    connections to the API alive, so that the ticker, klines, account and
+    order calls do not each pay a new TCP and TLS handshake. The timeout, if
+    provided, applies to every request. Every request goes through the weight
+    budget of the client, with the priority of its endpoint unless one is
+    provided.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        base_url: str = BINANCE_URL,
+        timeout: float = None,
+        budget: WeightBudget = None,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.budget = budget or WeightBudget()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path: str, priority: int = None, **kwargs):
+        """Send a GET request to the provided path of the API"""
+        return self._send("get", path, priority, **kwargs)
+
+    def post(self, path: str, priority: int = None, **kwargs):
+        """Send a POST request to the provided path of the API"""
+        return self._send("post", path, priority, **kwargs)
+
+    def delete(self, path: str, priority: int = None, **kwargs):
+        """Send a DELETE request to the provided path of the API"""
+        return self._send("delete", path, priority, **kwargs)
+
+    def _send(self, method: str, path: str, priority: int, **kwargs):
+        weight, default_priority = endpoint(method, path)
+        self.budget.acquire(weight, default_priority if priority is None else priority)
+        kwargs.setdefault("timeout", self.timeout)
+        response = getattr(self.session, method)(self.base_url + path, **kwargs)
+        self.budget.update(response)
+        return response
@@ -0,0 +1,107 @@
+"""
+Bracket orders of the trades: an OCO sell order placed on the exchange when a
+trade is opened, with a limit leg at the take profit and a stop-limit leg at
+the stop loss, so that the exits at these prices no longer wait for a tick.
+The state of each bracket is tracked locally, in the trade ledger.
+"""
+import math
+
+OPEN = "OPEN"
+FILLED = "FILLED"
+CANCELED = "CANCELED"
+# Statuses a bracket can move to from each status, FILLED and CANCELED being
+# final
+TRANSITIONS = {OPEN: {FILLED, CANCELED}, FILLED: set(), CANCELED: set()}
+
+# Statuses of the orders of Binance which will not change any more
+FINAL_ORDER_STATUSES = {"FILLED", "CANCELED", "REJECTED", "EXPIRED"}
+
+# The limit of the stop-loss leg is set below its stop price, so that the
+# order still fills when the price falls through the stop
+STOP_LIMIT_MARGIN = 0.005
+
+
+def check_transition(status: str, new_status: str):
+    """Raise a ValueError if a bracket cannot move from a status to another"""
+    if new_status not in TRANSITIONS[status]:
+        raise ValueError(
+            f"Invalid transition of a bracket from {status} to {new_status}"
+        )
+
+
+def round_down(value: float, step: float) -> float:
+    """Value rounded down to a multiple of a step, such as a stepSize"""
+    decimals = max(0, -math.floor(math.log10(step)))
+    return round(math.floor(round(value / step, 9)) * step, decimals)
+
+
+def round_price(value: float, tick: float) -> float:
+    """Price rounded to the nearest multiple of the tickSize"""
+    decimals = max(0, -math.floor(math.log10(tick)))
+    return round(round(value / tick) * tick, decimals)
+
+
+def bracket_params(symbol: str, quantity: float, target, stop_loss, settings):
+    """
+    Parameters of the OCO sell order of a bracket, with the quantity and the
+    prices rounded to the LOT_SIZE and PRICE_FILTER settings of the symbol
+    """
+    tick = settings["tickSize"]
+    quantity = min(round_down(quantity, settings["stepSize"]), settings["maxQty"])
+    return {
+        "symbol": symbol,
+        "side": "SELL",
+        "quantity": format(quantity, "f"),
+        "price": format(round_price(target, tick), "f"),
+        "stopPrice": format(round_price(stop_loss, tick), "f"),
+        "stopLimitPrice": format(
+            round_price(stop_loss * (1 - STOP_LIMIT_MARGIN), tick), "f"
+        ),
+        "stopLimitTimeInForce": "GTC",
+        "newOrderRespType": "FULL",
+    }
+
+
+def bracket_legs(orders):
+    """Ids of the limit and stop-loss legs of a bracket, from its orders"""
+    legs = {order["type"]: order["orderId"] for order in orders}
+    return legs["LIMIT_MAKER"], legs["STOP_LOSS_LIMIT"]
+
+
+def match_bracket(trades, orders, placed_at, settings):
+    """
+    Trade of a bracket found on the exchange, from the queried orders of its
+    legs: the last of the trades opened before the bracket was placed, in the
+    same symbol, whose quantity rounded as in bracket_params is the one of
+    the legs. Returns None if no trade matches.
+    """
+    symbol = orders[0]["symbol"]
+    quantity = float(orders[0]["origQty"])
+    candidates = [
+        trade
+        for trade in trades
+        if trade["pair"] == symbol
+        and trade["ingestion_time"] <= placed_at
+        and math.isclose(
+            min(
+                round_down(float(trade["quantity"]), settings["stepSize"]),
+                settings["maxQty"],
+            ),
+            quantity,
+        )
+    ]
+    return max(candidates, key=lambda trade: trade["ingestion_time"], default=None)
+
+
+def bracket_outcome(orders):
+    """
+    Status of a bracket from the queried orders of its legs, and the leg
+    which filled, if any. A bracket whose legs all ended without a fill was
+    canceled, outside of the bot or by the exchange.
+    """
+    for order in orders:
+        if order["status"] == "FILLED":
+            return FILLED, order
+    if all(order["status"] in FINAL_ORDER_STATUSES for order in orders):
+        return CANCELED, None
+    return OPEN, None
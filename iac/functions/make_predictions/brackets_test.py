@@ -0,0 +1,87 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from brackets import (
+    CANCELED,
+    FILLED,
+    OPEN,
+    bracket_legs,
+    bracket_outcome,
+    bracket_params,
+    check_transition,
+    match_bracket,
+    round_down,
+    round_price,
+)
+
+
+class TestCases(unittest.TestCase):
+    def test_rounding(self):
+        self.assertEqual(round_down(0.123456789, 1e-5), 0.12345)
+        self.assertEqual(round_down(0.3, 0.1), 0.3)
+        self.assertEqual(round_down(12.7, 1), 12)
+        self.assertEqual(round_price(101.006, 0.01), 101.01)
+        self.assertEqual(round_price(98.004, 0.01), 98.0)
+
+    def test_bracket_params(self):
+        settings = {"minQty": 1e-5, "maxQty": 9e3, "stepSize": 1e-5, "tickSize": 0.01}
+        params = bracket_params("BTCUSDT", 0.0123456, 40400.123, 39200.456, settings)
+        self.assertEqual(params["side"], "SELL")
+        self.assertEqual(params["quantity"], "0.012340")
+        self.assertEqual(params["price"], "40400.120000")
+        self.assertEqual(params["stopPrice"], "39200.460000")
+        self.assertLess(float(params["stopLimitPrice"]), 39200.46)
+
+    def test_bracket_outcome(self):
+        self.assertEqual(
+            bracket_outcome([{"status": "NEW"}, {"status": "NEW"}]), (OPEN, None)
+        )
+        filled = {"status": "FILLED", "executedQty": "1"}
+        self.assertEqual(
+            bracket_outcome([{"status": "EXPIRED"}, filled]), (FILLED, filled)
+        )
+        self.assertEqual(
+            bracket_outcome([{"status": "CANCELED"}, {"status": "CANCELED"}]),
+            (CANCELED, None),
+        )
+
+    def test_match_bracket(self):
+        settings = {"minQty": 1e-5, "maxQty": 9e3, "stepSize": 1e-5, "tickSize": 0.01}
+        start = datetime(2022, 2, 15, tzinfo=timezone.utc)
+        trades = [
+            {"ingestion_time": start, "pair": "BTCUSDT", "quantity": 0.0123456},
+            {
+                "ingestion_time": start + timedelta(minutes=5),
+                "pair": "BTCUSDT",
+                "quantity": 0.0123459,
+            },
+            {"ingestion_time": start, "pair": "ETHUSDT", "quantity": 0.0123456},
+        ]
+        orders = [
+            {"symbol": "BTCUSDT", "orderId": 2, "type": "STOP_LOSS_LIMIT"},
+            {"symbol": "BTCUSDT", "orderId": 3, "type": "LIMIT_MAKER"},
+        ]
+        for order in orders:
+            order["origQty"] = "0.01234000"
+        self.assertEqual(bracket_legs(orders), (3, 2))
+        # The last trade opened before the bracket
+        placed_at = start + timedelta(minutes=10)
+        self.assertIs(match_bracket(trades, orders, placed_at, settings), trades[1])
+        placed_at = start + timedelta(minutes=1)
+        self.assertIs(match_bracket(trades, orders, placed_at, settings), trades[0])
+        self.assertIsNone(match_bracket(trades[2:], orders, placed_at, settings))
+        for order in orders:
+            order["origQty"] = "0.01235000"
+        self.assertIsNone(match_bracket(trades, orders, placed_at, settings))
+
+    def test_check_transition(self):
+        check_transition(OPEN, FILLED)
+        check_transition(OPEN, CANCELED)
+        with self.assertRaises(ValueError):
+            check_transition(FILLED, CANCELED)
+        with self.assertRaises(ValueError):
+            check_transition(CANCELED, OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
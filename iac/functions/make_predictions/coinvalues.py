@@ -0,0 +1,57 @@
+"""
+CoinValues Class module
+"""
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+class CoinValues(MutableMapping):
+    """
+    Mapping of the coins of the bot to a value, such as their estimation or
+    threshold, held in an array aligned with the coin list, so that the
+    decisions read the values of all coins without a loop. A missing value is
+    NaN in the array. The keys which are not coins of the list, such as the
+    timestamp of the thresholds, are kept aside.
+    """
+
+    def __init__(self, coin_list, values=None):
+        self.coin_list = list(coin_list)
+        self.index = {coin: position for position, coin in enumerate(self.coin_list)}
+        self.array = np.full(len(self.coin_list), np.nan)
+        self.extra = {}
+        if values:
+            self.update(values)
+
+    def __getitem__(self, key):
+        if key in self.index:
+            value = self.array[self.index[key]]
+            if np.isnan(value):
+                raise KeyError(key)
+            return float(value)
+        return self.extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.index:
+            self.array[self.index[key]] = value
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.index:
+            if np.isnan(self.array[self.index[key]]):
+                raise KeyError(key)
+            self.array[self.index[key]] = np.nan
+        else:
+            del self.extra[key]
+
+    def __iter__(self):
+        present = ~np.isnan(self.array)
+        keys = [coin for coin, kept in zip(self.coin_list, present) if kept]
+        return iter(keys + list(self.extra))
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self.array))) + len(self.extra)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -0,0 +1,31 @@
+import unittest
+
+import json
+
+import numpy as np
+
+from coinvalues import CoinValues
+
+
+class TestCases(unittest.TestCase):
+    def test_mapping(self):
+        values = CoinValues(["BTC", "ETH", "SOL"], {"ETH": 0.7, "timestamp": 12})
+        np.testing.assert_array_equal(values.array, [np.nan, 0.7, np.nan])
+        self.assertEqual(values["ETH"], 0.7)
+        self.assertNotIn("BTC", values)
+        self.assertEqual(values.get("BTC"), None)
+        values["BTC"] = 0.6
+        self.assertEqual(values, {"BTC": 0.6, "ETH": 0.7, "timestamp": 12})
+        self.assertEqual(len(values), 3)
+        del values["ETH"]
+        self.assertTrue(np.isnan(values.array[1]))
+        with self.assertRaises(KeyError):
+            values["ETH"]
+        self.assertEqual(
+            json.loads(json.dumps(dict(values))), {"BTC": 0.6, "timestamp": 12}
+        )
+        self.assertFalse(CoinValues(["BTC"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
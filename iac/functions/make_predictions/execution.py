@@ -0,0 +1,69 @@
+"""
+OrderExecution Class module
+"""
+import concurrent.futures
+import time
+
+
+class OrderExecution:
+    """
+    Runs the orders of a decision concurrently, in a persistent pool of
+    threads sized for the largest decision, so that the exits and entries of
+    a tick do not wait for each other. The latency of each order, from the
+    decision to the end of its call, once the API acknowledged it, is
+    recorded in the timeline of the bot.
+    """
+
+    def __init__(self, max_orders: int, timeline):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_orders)
+        self.timeline = timeline
+
+    def run(self, orders):
+        """
+        Run the (name, call) orders at once and return their results, None
+        for the orders which failed, whose errors are printed
+        """
+        start = time.perf_counter()
+        futures = [
+            self.executor.submit(self.timed, name, start, call) for name, call in orders
+        ]
+        results = []
+        for (name, _), future in zip(orders, futures):
+            try:
+                results.append(future.result())
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"{name} failed: {error!r}")
+                results.append(None)
+        return results
+
+    def timed(self, name: str, start: float, call):
+        """Make an order call, recording its latency since the decision"""
+        try:
+            return call()
+        finally:
+            self.timeline.record(name, start)
+
+
+def order_fill(response):
+    """
+    Executed quantity, quote quantity, average price and commissions by asset
+    of an order, from its FULL response, or None when it has no fill
+    """
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or float(data.get("executedQty", 0)) <= 0:
+        return None
+    commissions = {}
+    for fill in data.get("fills", []):
+        asset = fill["commissionAsset"]
+        commissions[asset] = commissions.get(asset, 0.0) + float(fill["commission"])
+    quantity = float(data["executedQty"])
+    quote_quantity = float(data["cummulativeQuoteQty"])
+    return {
+        "quantity": quantity,
+        "quote_quantity": quote_quantity,
+        "price": quote_quantity / quantity,
+        "commissions": commissions,
+    }
@@ -0,0 +1,67 @@
+import unittest
+
+import json
+import threading
+import time
+
+from execution import OrderExecution, order_fill
+from timing import Timeline
+
+
+class MockResponse:
+    def __init__(self, json_data):
+        self.json_data = json_data
+
+    def json(self):
+        return self.json_data
+
+
+class TestCases(unittest.TestCase):
+    def test_run(self):
+        timeline = Timeline()
+        execution = OrderExecution(2, timeline)
+        barrier = threading.Barrier(2, timeout=1)
+
+        def order(result):
+            # Both orders must be running at once to pass the barrier
+            barrier.wait()
+            time.sleep(0.01)
+            return result
+
+        def failing():
+            raise Exception("Insufficient balance")
+
+        timeline.begin()
+        results = execution.run(
+            [
+                ("close_order BTC", lambda: order(1)),
+                ("open_order ETH", lambda: order(2)),
+            ]
+        )
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(execution.run([("open_order SOL", failing)]), [None])
+        spans = {span["name"]: span for span in timeline.end()["spans"]}
+        self.assertEqual(
+            set(spans), {"close_order BTC", "open_order ETH", "open_order SOL"}
+        )
+        self.assertGreaterEqual(spans["open_order ETH"]["duration"], 0.01)
+
+    def test_order_fill(self):
+        with open("test_data/full_order.json", "r") as file:
+            response = MockResponse(json.load(file))
+        fill = order_fill(response)
+        self.assertAlmostEqual(fill["quantity"], 10)
+        self.assertAlmostEqual(fill["quote_quantity"], 102)
+        self.assertAlmostEqual(fill["price"], 10.2)
+        self.assertEqual(list(fill["commissions"]), ["BTC"])
+        self.assertAlmostEqual(fill["commissions"]["BTC"], 0.01)
+
+        # ACK responses and orders without execution have no fill
+        self.assertIsNone(order_fill(MockResponse({"orderId": 28})))
+        unfilled = dict(response.json_data, executedQty="0")
+        self.assertIsNone(order_fill(MockResponse(unfilled)))
+        self.assertIsNone(order_fill(MockResponse([[1, 2]])))
+
+
+if __name__ == "__main__":
+    unittest.main()
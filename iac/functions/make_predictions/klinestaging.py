@@ -0,0 +1,98 @@
+"""
+KlineStaging Class module
+"""
+import io
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+from google.cloud import bigquery
+
+COLUMNS = [
+    ("open_time", int),
+    ("open", float),
+    ("high", float),
+    ("low", float),
+    ("close", float),
+    ("volume", float),
+    ("close_time", int),
+    ("quote_asset_volume", float),
+    ("number_of_trades", int),
+    ("taker_buy_base_asset_volume", float),
+    ("taker_buy_quote_asset_volume", float),
+]
+
+
+def kline_lines(klines):
+    """Newline delimited JSON rows of the minute tables for Binance klines"""
+    for kline in klines:
+        row = {name: cast(value) for (name, cast), value in zip(COLUMNS, kline)}
+        row["minute_timestamp"] = datetime.fromtimestamp(
+            kline[0] / 1000, tz=timezone.utc
+        ).strftime("%Y-%m-%d %H:%M:%S UTC")
+        yield json.dumps(row, separators=(",", ":")) + "\n"
+
+
+def load_klines(bq_client, table_id: str, klines):
+    """Insert klines in a minute table with a single load job"""
+    data = io.BytesIO("".join(kline_lines(klines)).encode("utf-8"))
+    return load_file(bq_client, table_id, data)
+
+
+def load_file(bq_client, table_id: str, file):
+    """Append the rows of a newline delimited JSON file to a table"""
+    job = bq_client.load_table_from_file(
+        file,
+        table_id,
+        job_config=bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        ),
+    )
+    job.result()
+    return job
+
+
+class KlineStaging:
+    """
+    Staging file of the klines of a minute table. The klines are appended to
+    a newline delimited JSON file, which is loaded in BigQuery with one load
+    job every max_rows rows, instead of one INSERT query per batch of klines.
+    The file is kept on disk until it is loaded, so an interrupted run can
+    load it later.
+    """
+
+    def __init__(self, bq_client, table_id: str, path: str, max_rows: int = 250000):
+        self.bq_client = bq_client
+        self.table_id = table_id
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.rows = 0
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                self.rows = sum(1 for _ in file)
+
+    def add(self, klines):
+        """Stage klines, loading the file when it is large enough"""
+        with self.lock:
+            with open(self.path, "a") as file:
+                file.writelines(kline_lines(klines))
+            self.rows += len(klines)
+            if self.rows >= self.max_rows:
+                self._load()
+
+    def flush(self):
+        """Load the klines staged so far"""
+        with self.lock:
+            self._load()
+
+    def _load(self):
+        if self.rows:
+            with open(self.path, "rb") as file:
+                load_file(self.bq_client, self.table_id, file)
+            print(f"\nLoaded {self.rows} rows in {self.table_id}")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.rows = 0
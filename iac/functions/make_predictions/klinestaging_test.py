@@ -0,0 +1,49 @@
+import unittest
+from unittest import mock
+
+import json
+import os
+import tempfile
+
+from klinestaging import KlineStaging, kline_lines, load_klines
+
+
+class TestCases(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("test_data/full_history.json", "r") as file:
+            self.klines = json.load(file)
+
+    def test_kline_lines(self):
+        row = json.loads(next(kline_lines(self.klines)))
+        self.assertEqual(row["minute_timestamp"], "2022-02-15 08:37:00 UTC")
+        self.assertEqual(row["open_time"], 1644914220000)
+        self.assertEqual(row["close"], 43969.91)
+        self.assertEqual(row["number_of_trades"], 741)
+        self.assertEqual(len(row), 12)
+
+    def test_load_klines(self):
+        bq_client = mock.Mock()
+        load_klines(bq_client, "project.binance_data.minute_btc", self.klines)
+        bq_client.load_table_from_file.assert_called_once()
+        data = bq_client.load_table_from_file.call_args[0][0].getvalue()
+        self.assertEqual(data.count(b"\n"), len(self.klines))
+
+    def test_staging(self):
+        bq_client = mock.Mock()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "BTC.ndjson")
+            staging = KlineStaging(bq_client, "table", path, max_rows=700)
+            staging.add(self.klines[:600])
+            bq_client.load_table_from_file.assert_not_called()
+            # An interrupted run is resumed from the file
+            staging = KlineStaging(bq_client, "table", path, max_rows=700)
+            self.assertEqual(staging.rows, 600)
+            staging.add(self.klines[600:])
+            bq_client.load_table_from_file.assert_called_once()
+            self.assertFalse(os.path.exists(path))
+            staging.flush()
+            bq_client.load_table_from_file.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
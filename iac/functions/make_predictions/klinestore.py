@@ -0,0 +1,122 @@
+"""
+KlineStore Class module
+"""
+import os
+import threading
+
+import numpy as np
+
+from klinestaging import COLUMNS
+
+DTYPES = {int: np.dtype("<i8"), float: np.dtype("<f8")}
+
+
+class KlineStore:
+    """
+    On disk columnar store of minute klines. Each of the 11 fields of the
+    klines of a symbol is an append-only file of little endian values,
+    <path>/<symbol>/<field>.bin, sorted by open time. Reads return views of
+    memory-mapped files, so that years of minutes are read without copying
+    them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.symbol_locks = {}
+        os.makedirs(path, exist_ok=True)
+
+    def symbols(self):
+        """Symbols with klines in the store"""
+        return sorted(
+            entry
+            for entry in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, entry))
+        )
+
+    def length(self, symbol: str) -> int:
+        """Number of klines stored for a symbol"""
+        sizes = []
+        for name, cast in COLUMNS:
+            file = self._file(symbol, name)
+            size = os.path.getsize(file) if os.path.exists(file) else 0
+            sizes.append(size // DTYPES[cast].itemsize)
+        return min(sizes)
+
+    def read(self, symbol: str, start_time: int = None, end_time: int = None):
+        """
+        Columns of the klines of a symbol whose open time is between
+        start_time (included) and end_time (excluded), as a {field: array}
+        dict of read-only memory-mapped views
+        """
+        count = self.length(symbol)
+        columns = {}
+        for name, cast in COLUMNS:
+            if count:
+                columns[name] = np.memmap(
+                    self._file(symbol, name),
+                    dtype=DTYPES[cast],
+                    mode="r",
+                    shape=(count,),
+                )
+            else:
+                columns[name] = np.empty(0, dtype=DTYPES[cast])
+        first = 0
+        if start_time is not None:
+            first = np.searchsorted(columns["open_time"], start_time)
+        last = count
+        if end_time is not None:
+            last = np.searchsorted(columns["open_time"], end_time)
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def write(self, symbol: str, klines):
+        """
+        Add klines in the format of the Binance API to the store. Klines more
+        recent than the stored ones are appended. Older ones are merged with
+        the stored klines that follow them, the new values replacing the
+        stored ones for the same minute, and this tail is rewritten in place:
+        the files never shrink, so the views returned by read stay valid.
+        """
+        if not len(klines):
+            return
+        columns = _unique(
+            {
+                name: np.array([kline[index] for kline in klines], dtype=DTYPES[cast])
+                for index, (name, cast) in enumerate(COLUMNS)
+            }
+        )
+        with self.lock:
+            lock = self.symbol_locks.setdefault(symbol, threading.Lock())
+        with lock:
+            os.makedirs(os.path.join(self.path, symbol), exist_ok=True)
+            count = self.length(symbol)
+            position = count
+            if count:
+                stored = self.read(symbol)
+                position = int(
+                    np.searchsorted(stored["open_time"], columns["open_time"][0])
+                )
+                if position < count:
+                    columns = _unique(
+                        {
+                            name: np.concatenate([stored[name][position:], column])
+                            for name, column in columns.items()
+                        }
+                    )
+                del stored
+            for name, column in columns.items():
+                file = self._file(symbol, name)
+                with open(file, "r+b" if os.path.exists(file) else "wb") as output:
+                    output.seek(position * column.itemsize)
+                    output.write(column.tobytes())
+
+    def _file(self, symbol: str, name: str):
+        return os.path.join(self.path, symbol, f"{name}.bin")
+
+
+def _unique(columns):
+    """Sort the columns by open time, keeping the last kline of each minute"""
+    reverse = columns["open_time"][::-1]
+    _, index = np.unique(reverse, return_index=True)
+    index = reverse.size - 1 - index
+    return {name: column[index] for name, column in columns.items()}
@@ -0,0 +1,61 @@
+import unittest
+
+import json
+import tempfile
+
+import numpy as np
+
+from klinestore import KlineStore
+
+
+class TestCases(unittest.TestCase):
+    def setUp(self) -> None:
+        with open("test_data/full_history.json", "r") as file:
+            self.klines = json.load(file)
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = KlineStore(self.directory.name)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_write_read(self):
+        self.store.write("BTCUSDT", self.klines[:400])
+        self.store.write("BTCUSDT", self.klines[400:])
+        self.assertEqual(self.store.symbols(), ["BTCUSDT"])
+        self.assertEqual(self.store.length("BTCUSDT"), 720)
+        columns = self.store.read("BTCUSDT")
+        self.assertEqual(len(columns), 11)
+        self.assertEqual(columns["open_time"][0], 1644914220000)
+        self.assertEqual(columns["close"][0], 43969.91)
+        self.assertEqual(columns["close"][-1], 44057.45)
+        self.assertEqual(columns["number_of_trades"][0], 741)
+        self.assertIsInstance(columns["close"], np.memmap)
+
+    def test_read_range(self):
+        self.store.write("BTCUSDT", self.klines)
+        start = self.klines[100][0]
+        columns = self.store.read("BTCUSDT", start, start + 10 * 60000)
+        np.testing.assert_array_equal(
+            columns["open_time"], [kline[0] for kline in self.klines[100:110]]
+        )
+        self.assertEqual(self.store.read("ETHUSDT")["close"].size, 0)
+
+    def test_write_out_of_order(self):
+        self.store.write("BTCUSDT", self.klines[500:])
+        view = self.store.read("BTCUSDT")["open_time"]
+        self.store.write("BTCUSDT", self.klines[:200])
+        # Overlapping klines replace the stored ones
+        updated = [list(kline) for kline in self.klines[150:550]]
+        updated[-1][4] = "1.5"
+        self.store.write("BTCUSDT", updated)
+        columns = self.store.read("BTCUSDT")
+        self.assertEqual(columns["open_time"].size, 720)
+        self.assertTrue(np.all(np.diff(columns["open_time"]) > 0))
+        self.assertEqual(columns["close"][549], 1.5)
+        # Views of a previous read stay usable
+        self.assertEqual(view.size, 220)
+        self.assertTrue(np.all(np.diff(view) > 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,280 @@
+"""
+TradeLedger Class module
+"""
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+from google.cloud import bigquery
+
+from brackets import OPEN, check_transition
+
+COLUMNS = [
+    ("ingestion_time", "TIMESTAMP"),
+    ("pair", "STRING"),
+    ("purchase_price", "FLOAT64"),
+    ("target_price", "FLOAT64"),
+    ("stop_loss_price", "FLOAT64"),
+    ("sale_price", "FLOAT64"),
+    ("quantity", "FLOAT64"),
+    ("still_open", "BOOL"),
+    ("profit", "FLOAT64"),
+    ("paid_commissions", "FLOAT64"),
+    ("close_time", "TIMESTAMP"),
+]
+
+
+class TradeLedger:
+    """
+    Local ledger of the trades, in a SQLite database in write-ahead log mode.
+    It is the source of truth for the open positions: opening and closing a
+    trade only writes in the ledger, and the changed trades are flushed to
+    the trades table in batches, with a single MERGE query. Each trade has a
+    version, so that a trade changed during a flush is flushed again.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS trades ("
+            " ingestion_time TEXT PRIMARY KEY,"
+            " pair TEXT,"
+            " purchase_price REAL,"
+            " target_price REAL,"
+            " stop_loss_price REAL,"
+            " sale_price REAL,"
+            " quantity REAL,"
+            " still_open INTEGER,"
+            " profit REAL,"
+            " paid_commissions REAL,"
+            " close_time TEXT,"
+            " version INTEGER NOT NULL DEFAULT 1,"
+            " flushed_version INTEGER NOT NULL DEFAULT 0"
+            ")"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        # Local state of the bracket orders of the trades, not flushed
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS brackets ("
+            " order_list_id INTEGER PRIMARY KEY,"
+            " trade_time TEXT,"
+            " pair TEXT,"
+            " limit_order_id INTEGER,"
+            " stop_order_id INTEGER,"
+            " status TEXT"
+            ")"
+        )
+
+    @property
+    def bootstrapped(self) -> bool:
+        """Whether the open trades of the trades table were loaded"""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM metadata WHERE key = 'bootstrapped'"
+            ).fetchone()
+        return row is not None
+
+    def bootstrap(self, rows):
+        """Load trades read from the trades table, as already flushed"""
+        with self.lock, self.connection:
+            self.connection.execute("BEGIN")
+            for row in rows:
+                values = [
+                    _to_text(row[name]) if kind == "TIMESTAMP" else row[name]
+                    for name, kind in COLUMNS
+                ]
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO trades VALUES"
+                    f" ({','.join('?' * len(COLUMNS))}, 1, 1)",
+                    values,
+                )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata VALUES ('bootstrapped', ?)",
+                (_to_text(datetime.now(timezone.utc)),),
+            )
+
+    def open_trade(
+        self, pair: str, purchase_price: float, target_price, stop_loss_price, quantity
+    ):
+        """Record a new open trade and return its ingestion time"""
+        ingestion_time = datetime.now(timezone.utc)
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO trades (ingestion_time, pair, purchase_price,"
+                " target_price, stop_loss_price, quantity, still_open)"
+                " VALUES (?, ?, ?, ?, ?, ?, 1)",
+                (
+                    _to_text(ingestion_time),
+                    pair,
+                    purchase_price,
+                    target_price,
+                    stop_loss_price,
+                    quantity,
+                ),
+            )
+        return ingestion_time
+
+    def close_trade(self, ingestion_time, sale_price: float, profit: float):
+        """Record the sale of the trade opened at the provided time"""
+        with self.lock:
+            self.connection.execute(
+                "UPDATE trades SET still_open = 0, sale_price = ?, profit = ?,"
+                " close_time = ?, version = version + 1"
+                " WHERE ingestion_time = ?",
+                (
+                    sale_price,
+                    profit,
+                    _to_text(datetime.now(timezone.utc)),
+                    _to_text(ingestion_time),
+                ),
+            )
+
+    def open_trades(self):
+        """Trades still open, as dicts with the columns of the trades table"""
+        return self._select("WHERE still_open ORDER BY ingestion_time")
+
+    def add_bracket(
+        self,
+        order_list_id: int,
+        trade_time,
+        pair: str,
+        limit_order_id: int,
+        stop_order_id: int,
+    ):
+        """Record the open bracket order of the trade opened at trade_time"""
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO brackets VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    order_list_id,
+                    _to_text(trade_time),
+                    pair,
+                    limit_order_id,
+                    stop_order_id,
+                    OPEN,
+                ),
+            )
+
+    def set_bracket_status(self, order_list_id: int, status: str):
+        """
+        Move a bracket to a new status, raising a ValueError if its current
+        status does not lead to it
+        """
+        with self.lock:
+            (current,) = self.connection.execute(
+                "SELECT status FROM brackets WHERE order_list_id = ?",
+                (order_list_id,),
+            ).fetchone()
+            check_transition(current, status)
+            self.connection.execute(
+                "UPDATE brackets SET status = ? WHERE order_list_id = ?",
+                (status, order_list_id),
+            )
+
+    def open_brackets(self):
+        """Brackets still open, as dicts, by time of their trade"""
+        names = [
+            "order_list_id",
+            "trade_time",
+            "pair",
+            "limit_order_id",
+            "stop_order_id",
+            "status",
+        ]
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(names)} FROM brackets WHERE status = ?",
+                (OPEN,),
+            ).fetchall()
+        brackets = {}
+        for row in rows:
+            bracket = dict(zip(names, row))
+            bracket["trade_time"] = datetime.fromisoformat(bracket["trade_time"])
+            brackets[bracket["trade_time"]] = bracket
+        return brackets
+
+    def pending(self):
+        """Trades changed since they were last flushed, with their version"""
+        return self._select("WHERE version > flushed_version", ["version"])
+
+    def flush(self, bq_client, table_id: str) -> int:
+        """
+        Write the pending trades in the trades table with a single MERGE
+        query, and return their number
+        """
+        trades = self.pending()
+        if not trades:
+            return 0
+        names = [name for name, _ in COLUMNS]
+        bq_client.query(
+            f"MERGE `{table_id}` AS target"
+            " USING UNNEST(@trades) AS source"
+            " ON target.ingestion_time = source.ingestion_time"
+            " WHEN MATCHED THEN UPDATE SET "
+            + ", ".join(f"{name} = source.{name}" for name in names[1:])
+            + f" WHEN NOT MATCHED THEN INSERT ({', '.join(names)}) VALUES ("
+            + ", ".join(f"source.{name}" for name in names)
+            + ")",
+            job_config=bigquery.QueryJobConfig(
+                query_parameters=[
+                    bigquery.ArrayQueryParameter(
+                        "trades",
+                        "STRUCT",
+                        [
+                            bigquery.StructQueryParameter(
+                                None,
+                                *[
+                                    bigquery.ScalarQueryParameter(
+                                        name, kind, trade[name]
+                                    )
+                                    for name, kind in COLUMNS
+                                ],
+                            )
+                            for trade in trades
+                        ],
+                    )
+                ]
+            ),
+        ).result()
+        with self.lock:
+            self.connection.executemany(
+                "UPDATE trades SET flushed_version = :version"
+                " WHERE ingestion_time = :time AND flushed_version < :version",
+                [
+                    {
+                        "version": trade["version"],
+                        "time": _to_text(trade["ingestion_time"]),
+                    }
+                    for trade in trades
+                ],
+            )
+        return len(trades)
+
+    def _select(self, condition: str, extra_columns=()):
+        names = [name for name, _ in COLUMNS] + list(extra_columns)
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(names)} FROM trades {condition}"
+            ).fetchall()
+        trades = []
+        for row in rows:
+            trade = dict(zip(names, row))
+            for name, kind in COLUMNS:
+                if kind == "TIMESTAMP" and trade[name] is not None:
+                    trade[name] = datetime.fromisoformat(trade[name])
+            trade["still_open"] = bool(trade["still_open"])
+            trades.append(trade)
+        return trades
+
+
+def _to_text(timestamp):
+    """Text of a timestamp in UTC, sortable and without loss of precision"""
+    if timestamp is None:
+        return None
+    return timestamp.astimezone(timezone.utc).isoformat(timespec="microseconds")
@@ -0,0 +1,83 @@
+import unittest
+from unittest import mock
+
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from ledger import TradeLedger
+
+
+class TestCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.ledger = TradeLedger(":memory:")
+
+    def test_open_close(self):
+        ingestion_time = self.ledger.open_trade("BTCUSDT", 100, 101, 98, 0.5)
+        trade = self.ledger.open_trades()[0]
+        self.assertEqual(trade["ingestion_time"], ingestion_time)
+        self.assertEqual(trade["pair"], "BTCUSDT")
+        self.assertTrue(trade["still_open"])
+        self.ledger.close_trade(ingestion_time, 101, 0.5)
+        self.assertEqual(self.ledger.open_trades(), [])
+        trade = self.ledger.pending()[0]
+        self.assertEqual(trade["version"], 2)
+        self.assertFalse(trade["still_open"])
+        self.assertEqual(trade["profit"], 0.5)
+        self.assertIsNotNone(trade["close_time"])
+
+    def test_brackets(self):
+        ingestion_time = self.ledger.open_trade("BTCUSDT", 100, 101, 98, 0.5)
+        self.ledger.add_bracket(7, ingestion_time, "BTCUSDT", 8, 9)
+        bracket = self.ledger.open_brackets()[ingestion_time]
+        self.assertEqual(bracket["order_list_id"], 7)
+        self.assertEqual(bracket["limit_order_id"], 8)
+        self.assertEqual(bracket["stop_order_id"], 9)
+        self.assertEqual(bracket["status"], "OPEN")
+        self.ledger.set_bracket_status(7, "FILLED")
+        self.assertEqual(self.ledger.open_brackets(), {})
+        with self.assertRaises(ValueError):
+            self.ledger.set_bracket_status(7, "CANCELED")
+
+    def test_flush(self):
+        bq_client = mock.Mock()
+        self.assertEqual(self.ledger.flush(bq_client, "project.trades.trades"), 0)
+        bq_client.query.assert_not_called()
+        ingestion_time = self.ledger.open_trade("BTCUSDT", 100, 101, 98, 0.5)
+        self.ledger.open_trade("ETHUSDT", 10, 11, 9, 5)
+        self.assertEqual(self.ledger.flush(bq_client, "project.trades.trades"), 2)
+        query = bq_client.query.call_args[0][0]
+        self.assertTrue(query.startswith("MERGE `project.trades.trades`"))
+        parameter = bq_client.query.call_args[1]["job_config"].query_parameters[0]
+        self.assertEqual(len(parameter.values), 2)
+        self.assertEqual(self.ledger.pending(), [])
+        self.ledger.close_trade(ingestion_time, 101, 0.5)
+        self.assertEqual(self.ledger.flush(bq_client, "project.trades.trades"), 1)
+
+    def test_bootstrap_persists(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ledger.sqlite3")
+            ledger = TradeLedger(path)
+            self.assertFalse(ledger.bootstrapped)
+            row = {
+                "ingestion_time": datetime(2022, 2, 15, 8, 37, tzinfo=timezone.utc),
+                "pair": "BTCUSDT",
+                "purchase_price": 100.0,
+                "target_price": 101.0,
+                "stop_loss_price": 98.0,
+                "sale_price": None,
+                "quantity": 0.5,
+                "still_open": True,
+                "profit": None,
+                "paid_commissions": None,
+                "close_time": None,
+            }
+            ledger.bootstrap([row])
+            ledger = TradeLedger(path)
+            self.assertTrue(ledger.bootstrapped)
+            self.assertEqual(ledger.open_trades(), [row])
+            self.assertEqual(ledger.pending(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,10 @@
 """
 This cloud functions uses the warm start acceleration of google cloud functions
 to keep in memory the price history of all coins of the last 24 hours and the
-thresholds used by the models.
+thresholds used by the models. This state is also saved in a snapshot after
+each decision, so that a cold start only fetches the minutes it missed. The
+event loop and the threads of the bot are kept as well, from one tick to the
+next.
 """
 from binancebot import BinanceBot
 
@@ -17,5 +20,4 @@ def main(event, context):
          context (google.cloud.functions.Context): Metadata for the event.
     """
     del event, context
-    binance_bot.update_information()
-    binance_bot.decide()
+    binance_bot.tick()
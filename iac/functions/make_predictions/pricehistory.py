@@ -0,0 +1,83 @@
+"""
+PriceHistory Class module
+"""
+import numpy as np
+
+HISTORY_LENGTH = 1441
+
+
+class PriceHistory:
+    """
+    Fixed size price history of a coin. The prices are written twice in a
+    preallocated float64 array, so that the window of the last `size` prices
+    is always a contiguous view, and a running sum is kept to normalise them by
+    their mean without summing the whole window on every tick.
+    """
+
+    def __init__(self, size: int, indexes):
+        self.size = size
+        self.indexes = np.asarray(indexes, dtype=np.int64)
+        self.buffer = np.zeros(2 * size, dtype=np.float64)
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+        self.updates = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.window()[index]
+
+    def __iter__(self):
+        return iter(self.window())
+
+    def window(self):
+        """View of the stored prices, from the oldest to the latest"""
+        return self.buffer[self.head : self.head + self.count]
+
+    def append(self, price: float):
+        """Add the latest price, dropping the oldest one if the window is full"""
+        if self.count == self.size:
+            position = self.head
+            self.total -= self.buffer[position]
+            self.head = (self.head + 1) % self.size
+        else:
+            position = self.count
+            self.count += 1
+        self.buffer[position] = self.buffer[position + self.size] = price
+        self.total += price
+        self.updates += 1
+        if self.updates >= self.size:
+            # Sum the window again from time to time to avoid a drift
+            self.total = float(self.window().sum())
+            self.updates = 0
+
+    def update_last(self, price: float):
+        """Replace the latest price, for a minute which is not over yet"""
+        if self.count == 0:
+            self.append(price)
+            return
+        position = (self.head + self.count - 1) % self.size
+        self.total += price - self.buffer[position]
+        self.buffer[position] = self.buffer[position + self.size] = price
+
+    def reset(self, prices):
+        """Replace the whole history by the provided prices"""
+        prices = np.asarray(prices, dtype=np.float64)[-self.size :]
+        self.count = prices.size
+        self.head = 0
+        self.buffer[: self.count] = prices
+        self.buffer[self.size : self.size + self.count] = prices
+        self.total = float(prices.sum())
+        self.updates = 0
+
+    def features(self):
+        """
+        Prices at the configured indexes, counted in minutes back from the
+        latest one, divided by the mean of the window: the
+        value_<coin>_<index> columns of features_<coin>
+        """
+        return self.window()[self.count - 1 - self.indexes] * (
+            self.count / self.total
+        )
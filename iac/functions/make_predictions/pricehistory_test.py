@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from pricehistory import PriceHistory
+
+
+class TestCases(unittest.TestCase):
+    def setUp(self) -> None:
+        self.indexes = [0, 1, 2, 60, 120, 1440]
+        self.history = PriceHistory(1441, self.indexes)
+
+    def test_append_keeps_size(self):
+        prices = np.random.default_rng(0).uniform(100, 200, 5000)
+        for price in prices:
+            self.history.append(price)
+        self.assertEqual(len(self.history), 1441)
+        self.assertEqual(self.history.buffer.size, 2 * 1441)
+        np.testing.assert_array_equal(self.history.window(), prices[-1441:])
+        self.assertEqual(self.history[-1], prices[-1])
+        self.assertAlmostEqual(self.history.total, prices[-1441:].sum(), places=6)
+
+    def test_features(self):
+        prices = np.random.default_rng(1).uniform(100, 200, 3000)
+        self.history.reset(prices[:2000])
+        for price in prices[2000:]:
+            self.history.append(price)
+        window = prices[-1441:]
+        expected = [window[-1 - index] * 1441 / window.sum() for index in self.indexes]
+        np.testing.assert_allclose(self.history.features(), expected)
+
+    def test_features_orientation(self):
+        # Index 0 is the latest minute and index 1440 the oldest one, as in
+        # features_<coin>, whose value_<coin>_<delta> is the close delta
+        # minutes before minute_start
+        self.history.reset(range(1, 1442))
+        features = self.history.features()
+        self.assertAlmostEqual(features[0], 1441 / 721)
+        self.assertAlmostEqual(features[1], 1440 / 721)
+        self.assertAlmostEqual(features[-1], 1 / 721)
+
+    def test_window_is_a_view(self):
+        self.history.reset(range(1441))
+        self.history.append(1441)
+        self.assertTrue(np.shares_memory(self.history.window(), self.history.buffer))
+        self.assertEqual(self.history[0], 1)
+
+    def test_partial_history(self):
+        self.history.append(10)
+        self.history.append(30)
+        self.assertEqual(len(self.history), 2)
+        self.assertEqual(list(self.history), [10, 30])
+
+
+    def test_update_last(self):
+        prices = np.random.default_rng(2).uniform(100, 200, 2000)
+        self.history.reset(prices)
+        self.history.update_last(150.0)
+        prices[-1] = 150.0
+        np.testing.assert_array_equal(self.history.window(), prices[-1441:])
+        self.assertAlmostEqual(self.history.total, prices[-1441:].sum(), places=6)
+        self.history.append(160.0)
+        self.assertEqual(list(self.history)[-2:], [150.0, 160.0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+RequestSigner Class module
+"""
+import hashlib
+import hmac
+import threading
+import time
+
+# Error code of the requests whose timestamp is outside of the recvWindow
+TIMESTAMP_ERROR = -1021
+
+
+class RequestSigner:
+    """
+    Signs and sends the requests of the bot to the private endpoints of the
+    Binance API. The HMAC of the private key is computed once for each key,
+    and copied for each request instead of being keyed again. The timestamp
+    of the requests is corrected with the offset of the server clock, which
+    is measured on the first rejection of a request for its timestamp; the
+    rejected request is then sent again once.
+    """
+
+    def __init__(self, binance_client, recv_window: int = None):
+        self.binance_client = binance_client
+        self.recv_window = recv_window
+        self.lock = threading.Lock()
+        self.private_key = None
+        self.keyed_hmac = None
+        self.headers = {}
+        self.offset_ms = 0
+
+    def set_keys(self, api_key: str, private_key: str):
+        """Use the provided keys, keying a new HMAC only when they change"""
+        if private_key != self.private_key:
+            keyed_hmac = hmac.new(private_key.encode("utf-8"), digestmod=hashlib.sha256)
+            with self.lock:
+                self.private_key, self.keyed_hmac = private_key, keyed_hmac
+        if self.headers.get("X-MBX-APIKEY") != api_key:
+            self.headers = {"X-MBX-APIKEY": api_key}
+
+    def sign(self, params=None):
+        """Parameters of a request, timestamped and with their signature"""
+        params = dict(params or {})
+        if self.recv_window:
+            params["recvWindow"] = self.recv_window
+        params["timestamp"] = round(time.time() * 1000) + self.offset_ms
+        query_str = "&".join(f"{key}={value}" for key, value in params.items())
+        with self.lock:
+            signature = self.keyed_hmac.copy()
+        signature.update(query_str.encode("utf-8"))
+        params["signature"] = signature.hexdigest()
+        return params
+
+    def request(self, method: str, path: str, params=None):
+        """Send a signed request to the provided path of the API"""
+        response = self._send(method, path, params)
+        if response.status_code == 400 and _error_code(response) == TIMESTAMP_ERROR:
+            self.sync_time()
+            response = self._send(method, path, params)
+        return response
+
+    def sync_time(self):
+        """Measure the offset of the server clock, at the middle of the call"""
+        start = time.time()
+        response = self.binance_client.get("/api/v3/time")
+        end = time.time()
+        self.offset_ms = response.json()["serverTime"] - round((start + end) * 500)
+        print(f"Server time offset: {self.offset_ms}ms")
+
+    def _send(self, method: str, path: str, params):
+        return getattr(self.binance_client, method)(
+            path, headers=self.headers, params=self.sign(params)
+        )
+
+
+def _error_code(response):
+    """Binance error code of a response, or None"""
+    try:
+        return response.json().get("code")
+    except (ValueError, AttributeError):
+        return None
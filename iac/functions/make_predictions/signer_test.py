@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+
+import hashlib
+import hmac
+import time
+
+from signer import RequestSigner
+
+
+def response(status_code, data):
+    return mock.Mock(status_code=status_code, json=mock.Mock(return_value=data))
+
+
+class TestCases(unittest.TestCase):
+    def test_sign(self):
+        signer = RequestSigner(mock.Mock(), recv_window=5000)
+        signer.set_keys("trululu", "tralala")
+        params = signer.sign({"symbol": "BTCUSDT", "side": "BUY"})
+        self.assertEqual(
+            list(params), ["symbol", "side", "recvWindow", "timestamp", "signature"]
+        )
+        self.assertAlmostEqual(params["timestamp"], time.time() * 1000, delta=1000)
+        query_str = (
+            f"symbol=BTCUSDT&side=BUY&recvWindow=5000&timestamp={params['timestamp']}"
+        )
+        expected = hmac.new(b"tralala", query_str.encode("utf-8"), hashlib.sha256)
+        self.assertEqual(params["signature"], expected.hexdigest())
+        self.assertEqual(signer.headers, {"X-MBX-APIKEY": "trululu"})
+
+        # The HMAC is only keyed again when the private key changes
+        keyed_hmac = signer.keyed_hmac
+        signer.set_keys("trululu", "tralala")
+        self.assertIs(signer.keyed_hmac, keyed_hmac)
+        signer.set_keys("trululu", "oupsi")
+        self.assertIsNot(signer.keyed_hmac, keyed_hmac)
+        self.assertNotEqual(signer.sign()["signature"], params["signature"])
+
+    def test_request(self):
+        binance_client = mock.Mock()
+        signer = RequestSigner(binance_client)
+        signer.set_keys("trululu", "tralala")
+        binance_client.post.return_value = response(200, {"orderId": 1})
+        signer.request("post", "/api/v3/order", {"symbol": "BTCUSDT"})
+        path = binance_client.post.call_args[0][0]
+        params = binance_client.post.call_args[1]["params"]
+        self.assertEqual(path, "/api/v3/order")
+        self.assertNotIn("recvWindow", params)
+        binance_client.get.assert_not_called()
+
+        # A request rejected for its timestamp is sent again after a sync
+        server_time = round(time.time() * 1000) + 3000
+        binance_client.get.return_value = response(200, {"serverTime": server_time})
+        binance_client.post.side_effect = [
+            response(400, {"code": -1021, "msg": "Timestamp outside of recvWindow"}),
+            response(200, {"orderId": 2}),
+        ]
+        result = signer.request("post", "/api/v3/order", {"symbol": "BTCUSDT"})
+        self.assertEqual(result.json()["orderId"], 2)
+        binance_client.get.assert_called_once_with("/api/v3/time")
+        self.assertAlmostEqual(signer.offset_ms, 3000, delta=500)
+        params = binance_client.post.call_args[1]["params"]
+        self.assertAlmostEqual(params["timestamp"], server_time, delta=500)
+
+
+if __name__ == "__main__":
+    unittest.main()
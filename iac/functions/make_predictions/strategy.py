@@ -0,0 +1,103 @@
+"""
+Decision rules of the bot, written with NumPy operations so that the same
+functions decide a single tick in BinanceBot.decide and whole price series in
+the backtests.
+"""
+import numpy as np
+
+
+def exit_reached(
+    price, target_price, stop_loss_price, elapsed_seconds, max_duration_seconds
+):
+    """
+    Whether an open trade must be closed: the price reached the take profit
+    or the stop loss limit, or the trade is open for too long.
+    """
+    return (
+        (price >= target_price)
+        | (price <= stop_loss_price)
+        | (elapsed_seconds > max_duration_seconds)
+    )
+
+
+def best_signal(estimations, thresholds):
+    """
+    Index of the coin whose estimation is the furthest above its threshold,
+    along the last axis, or -1 when no estimation reaches its threshold.
+    """
+    estimations = np.asarray(estimations, dtype=np.float64)
+    margins = np.where(
+        estimations >= thresholds, estimations - thresholds, -np.inf
+    )
+    best = np.argmax(margins, axis=-1)
+    return np.where(np.max(margins, axis=-1) > -np.inf, best, -1)
+
+
+THRESHOLD_GRID = np.round(np.linspace(0.5, 1.0, 51), 2)
+
+
+def best_threshold(estimations, wins, thresholds=THRESHOLD_GRID):
+    """
+    Threshold of the increasing thresholds maximising the number of winning
+    minutes minus the number of losing ones among the minutes estimated above
+    it, as update_threshold_<coin> picks it from vw_stats_<coin>, the highest
+    one on a tie. The estimations are sorted once, and the wins above each
+    threshold read from their cumulative counts. NaN estimations are ignored.
+    Returns None when no estimation is above any threshold.
+    """
+    estimations = np.asarray(estimations, dtype=np.float64)
+    valid = ~np.isnan(estimations)
+    order = np.argsort(estimations[valid], kind="stable")
+    sorted_estimations = estimations[valid][order]
+    sorted_wins = np.asarray(wins, dtype=bool)[valid][order]
+    # Wins among the estimations from each position to the end
+    wins_from = np.concatenate([np.cumsum(sorted_wins[::-1])[::-1], [0]])
+    first_above = np.searchsorted(sorted_estimations, thresholds, side="right")
+    positives = sorted_estimations.size - first_above
+    if not np.any(positives > 0):
+        return None
+    scores = np.where(
+        positives > 0, 2 * wins_from[first_above] - positives, np.iinfo(np.int64).min
+    )
+    return float(np.asarray(thresholds)[np.flatnonzero(scores == scores.max())[-1]])
+
+
+def portfolio_decision(
+    position_prices,
+    target_prices,
+    stop_loss_prices,
+    elapsed_seconds,
+    max_duration_seconds,
+    positions,
+    estimations,
+    thresholds,
+    max_positions: int,
+):
+    """
+    Decisions on a portfolio of at most max_positions open trades, the
+    positions being the indexes of the coins held, with the arrays of their
+    price and exit limits. Returns the mask of the positions to close, and
+    the indexes of the coins to buy, the furthest above its threshold first,
+    in the slots left free. As with a single trade, the slots freed on a tick
+    are only used on the next one, and a coin is not bought twice.
+    """
+    exits = exit_reached(
+        np.asarray(position_prices, dtype=np.float64),
+        np.asarray(target_prices, dtype=np.float64),
+        np.asarray(stop_loss_prices, dtype=np.float64),
+        np.asarray(elapsed_seconds, dtype=np.float64),
+        max_duration_seconds,
+    )
+    free_slots = max_positions - len(positions)
+    if free_slots <= 0:
+        return exits, np.empty(0, dtype=np.int64)
+    estimations = np.nan_to_num(
+        np.asarray(estimations, dtype=np.float64), nan=-np.inf
+    )
+    margins = np.where(
+        estimations >= thresholds, estimations - thresholds, -np.inf
+    )
+    margins[np.asarray(positions, dtype=np.int64)] = -np.inf
+    candidates = np.flatnonzero(margins > -np.inf)
+    order = np.argsort(-margins[candidates], kind="stable")
+    return exits, candidates[order[:free_slots]]
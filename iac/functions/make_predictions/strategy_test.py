@@ -0,0 +1,73 @@
+import unittest
+
+import numpy as np
+
+from strategy import best_signal, best_threshold, exit_reached, portfolio_decision
+
+
+class TestCases(unittest.TestCase):
+    def test_exit_reached(self):
+        self.assertTrue(exit_reached(1020, 1010, 980, 10, 3600))
+        self.assertTrue(exit_reached(970, 1010, 980, 10, 3600))
+        self.assertTrue(exit_reached(1000, 1010, 980, 3601, 3600))
+        self.assertFalse(exit_reached(1000, 1010, 980, 3600, 3600))
+        np.testing.assert_array_equal(
+            exit_reached(np.array([1000, 1010, 980]), 1010, 980, 0, 3600),
+            [False, True, True],
+        )
+
+    def test_best_signal(self):
+        self.assertEqual(best_signal([0.5, 0.5, 0.5], [0.6, 0.6, 0.6]), -1)
+        self.assertEqual(best_signal([0.5, 0.7, 0.8], [0.6, 0.6, 0.6]), 2)
+        self.assertEqual(best_signal([0.6, 0.5, 0.6], [0.6, 0.6, 0.6]), 0)
+        np.testing.assert_array_equal(
+            best_signal(np.array([[0.5, 0.7], [0.9, 0.7], [0.1, 0.2]]), [0.6, 0.6]),
+            [1, 0, -1],
+        )
+
+    def test_best_threshold(self):
+        rng = np.random.default_rng(0)
+        estimations = rng.random(5000)
+        wins = rng.random(5000) < estimations**2
+        estimations[::100] = np.nan
+        thresholds = np.round(np.linspace(0.5, 1.0, 51), 2)
+        # Same choice as the count of vw_stats for each threshold
+        valid = ~np.isnan(estimations)
+        scores = [
+            2 * np.sum(wins[valid] & (estimations[valid] > threshold))
+            - np.sum(estimations[valid] > threshold)
+            if np.any(estimations[valid] > threshold)
+            else -np.inf
+            for threshold in thresholds
+        ]
+        expected = thresholds[np.flatnonzero(scores == np.max(scores))[-1]]
+        self.assertEqual(best_threshold(estimations, wins), expected)
+        self.assertEqual(best_threshold([0.7, 0.8], [True, True], [0.6, 0.75]), 0.6)
+        self.assertEqual(best_threshold([0.7, 0.8], [False, True], [0.6, 0.75]), 0.75)
+        self.assertIsNone(best_threshold([0.4, np.nan], [True, True]))
+
+    def test_portfolio_decision(self):
+        estimations = np.array([0.7, np.nan, 0.9, 0.65, 0.8, 0.5])
+        thresholds = np.full(6, 0.6)
+        exits, entries = portfolio_decision(
+            [1020, 1000], [1010, 1010], [980, 980], [10, 10], 3600, [2, 5],
+            estimations, thresholds, 4,
+        )
+        np.testing.assert_array_equal(exits, [True, False])
+        # The best signals of the coins not held, in the free slots
+        np.testing.assert_array_equal(entries, [4, 0])
+        # The first coin is taken on a tie, as with best_signal
+        _, entries = portfolio_decision(
+            [], [], [], [], 3600, [], [0.7, 0.7, 0.7], [0.6, 0.6, 0.6], 1
+        )
+        np.testing.assert_array_equal(entries, [0])
+        # No free slot
+        exits, entries = portfolio_decision(
+            [1000], [1010], [980], [3601], 3600, [0], estimations, thresholds, 1
+        )
+        np.testing.assert_array_equal(exits, [True])
+        self.assertEqual(entries.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
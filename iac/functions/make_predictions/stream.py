@@ -0,0 +1,151 @@
+"""
+Long running alternative to the Pub/Sub triggered function of main.py: the
+bot follows the 1 minute kline streams of all its coins on the Binance
+websocket API, instead of polling the ticker once a minute. The price history
+is updated with each kline, and the bot decides on each closed candle, or as
+soon as the price of the open trade crosses its take profit or stop loss.
+
+    python stream.py
+"""
+import asyncio
+import json
+import time
+
+import websockets
+
+from binancebot import BinanceBot
+from strategy import exit_reached
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"
+RECONNECT_DELAY_SECONDS = 5
+
+
+class KlineStream:
+    """
+    Feeds a BinanceBot with the combined @kline_1m streams of its coins
+    """
+
+    def __init__(self, bot: BinanceBot, url: str = STREAM_URL):
+        self.bot = bot
+        self.url = url + "?streams=" + "/".join(
+            f"{coin.lower()}usdt@kline_1m" for coin in bot.coin_list
+        )
+        self.lock = None
+        self.open_times = {}
+        self.refreshed_minute = 0
+        # Whether the last refresh read the open trades and the balances
+        self.refreshed = False
+        self.tasks = set()
+
+    async def run(self):
+        """Follow the streams, reconnecting when the connection is lost"""
+        self.refreshed = await self.bot.gather_information()
+        while True:
+            try:
+                await self.listen()
+            except (OSError, websockets.ConnectionClosed) as error:
+                print(f"Stream connection lost: {error!r}")
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def listen(self):
+        """Handle the messages of one connection until it is closed"""
+        self.lock = asyncio.Lock()
+        async with websockets.connect(self.url) as websocket:
+            async for message in websocket:
+                await self.handle(json.loads(message)["data"])
+        await asyncio.gather(*self.tasks)
+
+    async def handle(self, event):
+        """Update the price history with a kline event and decide if needed"""
+        kline = event["k"]
+        coin = event["s"][:-4]
+        open_time, price = kline["t"], float(kline["c"])
+        last_open_time = self.open_times.get(coin, int(time.time() // 60) * 60000)
+        if open_time < last_open_time:
+            return
+        if open_time > last_open_time + 60000:
+            klines = await self.bot.call(
+                self.bot.fetch_missing_history, coin, last_open_time + 60000
+            )
+            # The gap is fetched again with the next event of the coin
+            if klines is None:
+                return
+            self.bot.append_klines(coin, klines)
+        elif open_time == last_open_time + 60000:
+            self.bot.data_hist[coin].append(price)
+        self.open_times[coin] = open_time
+        self.bot.data_hist[coin].update_last(price)
+        if kline["x"]:
+            self.schedule(self.on_closed_candle(coin, open_time))
+        elif self.exit_crossed(coin, price) and not self.lock.locked():
+            self.schedule(self.decide())
+
+    def exit_crossed(self, coin: str, price: float) -> bool:
+        """Whether the price crossed a limit of an open trade of the coin"""
+        return any(
+            exit_reached(
+                price,
+                float(trade["target_price"]),
+                float(trade["stop_loss_price"]),
+                0,
+                self.bot.max_trade_duration_seconds,
+            )
+            for trade in self.bot.open_trades
+            if trade["pair"] == coin + "USDT"
+        )
+
+    def schedule(self, coroutine):
+        """Run a coroutine without blocking the reading of the stream"""
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def on_closed_candle(self, coin: str, open_time: int):
+        """
+        Refresh the other information once per minute, then update the
+        estimation of the coin and decide. The timing record of the previous
+        minute is reported before the refresh.
+        """
+        async with self.lock:
+            if open_time > self.refreshed_minute:
+                if self.refreshed_minute:
+                    self.bot.report_timing()
+                self.refreshed_minute = open_time
+                self.refreshed = await self.bot.gather_information(prices=False)
+                # The last tick of a coin is the minute of its last kline in
+                # the history, which a gap not fetched yet does not move
+                self.bot.last_ticks.update(
+                    (other, minute / 1000) for other, minute in self.open_times.items()
+                )
+                await self.bot.call(self.bot.save_snapshot)
+            await self.bot.refresh_estimations([coin])
+        await self.decide()
+
+    async def decide(self):
+        """
+        Run the decision of the bot, one at a time, only closing trades
+        unless the last refresh read the open trades and the balances, then
+        flush the trades it changed without waiting for it
+        """
+        async with self.lock:
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    self.bot.timeline.timed,
+                    "decide",
+                    self.bot.decide,
+                    self.refreshed,
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                print(f"Decision failed: {error!r}")
+            self.bot.schedule_flush()
+
+
+def main():
+    """Run the bot on the kline streams until it is stopped"""
+    binance_bot = BinanceBot(parameter_file="parameters.json")
+    binance_bot.loop.run_until_complete(KlineStream(binance_bot).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import unittest
+from unittest import mock
+
+import asyncio
+import json
+import time
+
+import websockets
+
+from binancebot import BinanceBot
+from binancebot_test import mocked_binance_public
+from stream import KlineStream
+
+
+def kline_event(coin, open_time, close, closed=False):
+    return json.dumps(
+        {
+            "stream": f"{coin.lower()}usdt@kline_1m",
+            "data": {
+                "e": "kline",
+                "s": coin + "USDT",
+                "k": {"t": open_time, "c": str(close), "x": closed},
+            },
+        }
+    )
+
+
+class TestCases(unittest.TestCase):
+    @mock.patch("binancebot.BinanceBot.load_snapshot", return_value=False)
+    @mock.patch("requests.Session.get", side_effect=mocked_binance_public)
+    def setUp(self, mock_get, mock_load_snapshot) -> None:
+        self.bot = BinanceBot("parameters.json")
+        self.bot.kline_store = None
+        self.bot.gather_information = mock.AsyncMock(return_value=True)
+        self.bot.save_snapshot = mock.Mock()
+        self.bot.estimate = mock.Mock(return_value={"BTC": 0.7})
+        self.bot.fetch_missing_history = mock.Mock(
+            return_value=[[0, "0", "0", "0", "99", "1"]] * 4
+        )
+        self.bot.decide = mock.Mock()
+        for coin in self.bot.coin_list:
+            self.bot.data_hist[coin].reset(range(1441))
+
+    def run_stream(self, messages):
+        async def handler(websocket, *args):
+            for message in messages:
+                await websocket.send(message)
+                await asyncio.sleep(0.05)
+
+        async def run():
+            async with websockets.serve(handler, "localhost", 0) as server:
+                port = server.sockets[0].getsockname()[1]
+                await KlineStream(self.bot, f"ws://localhost:{port}").listen()
+
+        self.bot.loop.run_until_complete(run())
+
+    def test_url(self):
+        stream = KlineStream(self.bot, "ws://localhost")
+        self.assertEqual(
+            stream.url,
+            "ws://localhost?streams=btcusdt@kline_1m/ethusdt@kline_1m/solusdt@kline_1m",
+        )
+
+    def test_closed_candle(self):
+        minute = int(time.time() // 60 * 60000)
+        self.run_stream(
+            [
+                kline_event("BTC", minute, 100),
+                kline_event("ETH", minute + 60000, 50),
+                kline_event("BTC", minute, 101, closed=True),
+            ]
+        )
+        self.assertEqual(self.bot.data_hist["BTC"][-1], 101)
+        self.assertEqual(self.bot.data_hist["BTC"][-2], 1439)
+        self.assertEqual(self.bot.data_hist["ETH"][-1], 50)
+        self.assertEqual(self.bot.data_hist["ETH"][-2], 1440)
+        self.bot.gather_information.assert_awaited_once_with(prices=False)
+        self.bot.save_snapshot.assert_called_once()
+        self.assertEqual(list(self.bot.estimate.call_args[0][0]), ["BTC"])
+        self.assertEqual(self.bot.estimations["BTC"], 0.7)
+        self.bot.decide.assert_called_once_with(True)
+
+    def test_exit_crossing(self):
+        minute = int(time.time() // 60 * 60000)
+        self.bot.current_open_trade = {
+            "pair": "SOLUSDT",
+            "target_price": 200,
+            "stop_loss_price": 10,
+        }
+        self.run_stream(
+            [
+                kline_event("SOL", minute, 150),
+                kline_event("BTC", minute, 250),
+                kline_event("SOL", minute, 250),
+            ]
+        )
+        # Only exits before a refresh of the open trades and balances
+        self.bot.decide.assert_called_once_with(False)
+        self.bot.gather_information.assert_not_awaited()
+
+    def test_missed_minutes(self):
+        minute = int(time.time() // 60 * 60000)
+        self.run_stream([kline_event("BTC", minute + 5 * 60000, 100)])
+        self.bot.fetch_missing_history.assert_called_once_with("BTC", minute + 60000)
+        self.assertEqual(self.bot.data_hist["BTC"][-1], 100)
+        self.assertEqual(self.bot.data_hist["BTC"][-2], 99)
+
+    def test_missed_minutes_error(self):
+        # The gap is fetched again with the next event
+        minute = int(time.time() // 60 * 60000)
+        self.bot.fetch_missing_history.side_effect = [Exception("Timeout"), []]
+        self.run_stream(
+            [
+                kline_event("BTC", minute + 5 * 60000, 100),
+                kline_event("BTC", minute + 5 * 60000, 101),
+            ]
+        )
+        self.assertEqual(self.bot.fetch_missing_history.call_count, 2)
+        self.assertEqual(self.bot.data_hist["BTC"][-1], 101)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Timeline Class module
+"""
+import collections
+import contextlib
+import json
+import threading
+import time
+
+import numpy as np
+
+HISTORY_TICKS = 1440
+TRACE_TICKS = 60
+
+
+class Timeline:
+    """
+    Timing spans of the calls of the bot, grouped by tick. Each tick gives a
+    record of its spans, the durations of the last HISTORY_TICKS ticks give
+    the percentiles of each call, and the spans of the last TRACE_TICKS ticks
+    can be exported in the Chrome trace format (chrome://tracing, Perfetto).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Offset from the performance counter to the epoch
+        self.origin = time.time() - time.perf_counter()
+        self.tick_start = time.perf_counter()
+        self.spans = []
+        self.count = 0
+        self.durations = collections.defaultdict(
+            lambda: collections.deque(maxlen=HISTORY_TICKS)
+        )
+        self.ticks = collections.deque(maxlen=TRACE_TICKS)
+
+    def begin(self):
+        """Start a tick, dropping the spans recorded since the previous one"""
+        with self.lock:
+            self.tick_start = time.perf_counter()
+            self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        """Record the time spent in the block, in the current tick"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def record(self, name: str, start: float):
+        """Record a span from a performance counter time until now"""
+        duration = time.perf_counter() - start
+        with self.lock:
+            self.spans.append((name, start, duration, threading.get_ident()))
+
+    def timed(self, name: str, function, *args):
+        """Call a function in a span"""
+        with self.span(name):
+            return function(*args)
+
+    def end(self):
+        """
+        End the current tick, the next one starting now, and return its
+        record: start time, duration and spans, in seconds
+        """
+        with self.lock:
+            end = time.perf_counter()
+            start, spans = self.tick_start, self.spans
+            self.tick_start, self.spans = end, []
+            self.count += 1
+            self.ticks.append((start, end, spans))
+            self.durations["tick"].append(end - start)
+            for name, _, duration, _ in spans:
+                self.durations[name].append(duration)
+        return {
+            "start": self.origin + start,
+            "duration": end - start,
+            "spans": [
+                {"name": name, "offset": span_start - start, "duration": duration}
+                for name, span_start, duration, _ in sorted(spans, key=lambda s: s[1])
+            ],
+        }
+
+    def summary(self):
+        """Count and 50th, 95th and 99th percentiles of the durations by span"""
+        with self.lock:
+            durations = {name: list(values) for name, values in self.durations.items()}
+        summary = {}
+        for name, values in sorted(durations.items()):
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[name] = {
+                "count": len(values),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+            }
+        return summary
+
+    def chrome_trace(self):
+        """Trace events of the last ticks, each span on the row of its thread"""
+        with self.lock:
+            ticks = list(self.ticks)
+        events = []
+        for start, end, spans in ticks:
+            events.append(_event("tick", start, end - start, 0, self.origin))
+            for name, span_start, duration, thread in spans:
+                events.append(_event(name, span_start, duration, thread, self.origin))
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        """Write the Chrome trace of the last ticks in a JSON file"""
+        with open(path, "w") as file:
+            json.dump(self.chrome_trace(), file)
+
+
+def _event(name, start, duration, thread, origin):
+    """Complete event of the trace format, with times in microseconds"""
+    return {
+        "name": name,
+        "ph": "X",
+        "ts": round((origin + start) * 1e6),
+        "dur": round(duration * 1e6),
+        "pid": 0,
+        "tid": thread,
+    }
@@ -0,0 +1,67 @@
+import unittest
+
+import json
+import tempfile
+import threading
+import time
+
+from timing import Timeline
+
+
+class TestCases(unittest.TestCase):
+    def test_record(self):
+        timeline = Timeline()
+        timeline.begin()
+        with timeline.span("update_secrets"):
+            time.sleep(0.01)
+        thread = threading.Thread(
+            target=timeline.timed, args=("update_full_history BTC", time.sleep, 0.02)
+        )
+        thread.start()
+        thread.join()
+        record = timeline.end()
+        self.assertEqual(
+            [span["name"] for span in record["spans"]],
+            ["update_secrets", "update_full_history BTC"],
+        )
+        self.assertGreaterEqual(record["spans"][0]["duration"], 0.01)
+        self.assertGreaterEqual(record["spans"][1]["offset"], 0.01)
+        self.assertGreaterEqual(record["duration"], 0.03)
+        self.assertAlmostEqual(record["start"], time.time(), delta=1)
+        # Spans after the end belong to the next tick
+        self.assertEqual(timeline.timed("decide", max, 1, 2), 2)
+        self.assertEqual(timeline.end()["spans"][0]["name"], "decide")
+
+    def test_summary(self):
+        timeline = Timeline()
+        for duration in range(100):
+            timeline.spans.append(("decide", 0.0, float(duration), 0))
+            timeline.end()
+        summary = timeline.summary()
+        self.assertEqual(summary["decide"]["count"], 100)
+        self.assertEqual(summary["tick"]["count"], 100)
+        self.assertAlmostEqual(summary["decide"]["p50"], 49.5)
+        self.assertAlmostEqual(summary["decide"]["p95"], 94.05)
+        self.assertAlmostEqual(summary["decide"]["p99"], 98.01)
+
+    def test_export(self):
+        timeline = Timeline()
+        for _ in range(70):
+            with timeline.span("update_open_trade"):
+                pass
+            timeline.end()
+        with tempfile.NamedTemporaryFile(suffix=".json") as file:
+            timeline.export(file.name)
+            with open(file.name, "r") as exported:
+                trace = json.load(exported)
+        events = trace["traceEvents"]
+        # Only the last ticks are kept
+        self.assertEqual(len(events), 2 * 60)
+        self.assertEqual(events[0]["ph"], "X")
+        self.assertEqual(events[0]["name"], "tick")
+        self.assertLessEqual(events[0]["ts"], events[1]["ts"])
+        self.assertEqual(events[1]["tid"], threading.get_ident())
+
+
+if __name__ == "__main__":
+    unittest.main()
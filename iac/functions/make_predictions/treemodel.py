@@ -0,0 +1,171 @@
+"""
+TreeModel Class module
+"""
+import json
+import struct
+
+import numpy as np
+
+LEARNER_PARAM_SIZE = 136
+GBTREE_PARAM_SIZE = 160
+TREE_PARAM_SIZE = 148
+NODE_SIZE = 20
+NODE_STAT_SIZE = 16
+
+
+class TreeModel:
+    """
+    Boosted tree classifier exported from BigQuery ML (XGBoost booster),
+    scored locally with NumPy. All the trees are flattened in the same node
+    arrays so that a batch of feature rows is scored one tree level at a time.
+    """
+
+    def __init__(self, trees, base_score, feature_names=None):
+        """
+        trees is a list of dicts of node arrays: left, right, feature,
+        threshold, default_left and value (leaf value for leaves, -1 children).
+        """
+        offsets = np.cumsum([0] + [len(tree["left"]) for tree in trees])
+        self.roots = offsets[:-1].astype(np.int64)
+        self.left = np.concatenate(
+            [_shift(tree["left"], offset) for tree, offset in zip(trees, offsets)]
+        )
+        self.right = np.concatenate(
+            [_shift(tree["right"], offset) for tree, offset in zip(trees, offsets)]
+        )
+        self.is_leaf = self.left == -1
+        self.left[self.is_leaf] = np.flatnonzero(self.is_leaf)
+        self.right[self.is_leaf] = np.flatnonzero(self.is_leaf)
+        self.feature = np.concatenate([tree["feature"] for tree in trees]).astype(
+            np.int64
+        )
+        self.feature[self.is_leaf] = 0
+        self.threshold = np.concatenate(
+            [tree["threshold"] for tree in trees]
+        ).astype(np.float32)
+        self.default_left = np.concatenate(
+            [tree["default_left"] for tree in trees]
+        ).astype(bool)
+        self.value = np.concatenate([tree["value"] for tree in trees]).astype(
+            np.float64
+        )
+        self.value[~self.is_leaf] = 0.0
+        self.depth = max(_depth(tree["left"], tree["right"]) for tree in trees)
+        self.base_margin = float(np.log(base_score / (1.0 - base_score)))
+        self.feature_names = feature_names
+
+    @classmethod
+    def from_bytes(cls, raw: bytes, feature_names=None):
+        """Load an exported booster, in XGBoost's JSON or legacy binary format"""
+        if raw.lstrip()[:1] == b"{":
+            return cls.from_xgboost_json(json.loads(raw), feature_names)
+        return cls.from_xgboost_binary(raw, feature_names)
+
+    @classmethod
+    def from_xgboost_json(cls, model: dict, feature_names=None):
+        """Load a booster saved with XGBoost's JSON schema"""
+        learner = model["learner"]
+        trees = [
+            {
+                "left": tree["left_children"],
+                "right": tree["right_children"],
+                "feature": tree["split_indices"],
+                "threshold": tree["split_conditions"],
+                "default_left": tree["default_left"],
+                "value": tree["split_conditions"],
+            }
+            for tree in learner["gradient_booster"]["model"]["trees"]
+        ]
+        base_score = str(learner["learner_model_param"]["base_score"]).strip("[]")
+        return cls(
+            trees, float(base_score), feature_names or learner.get("feature_names")
+        )
+
+    @classmethod
+    def from_xgboost_binary(cls, raw: bytes, feature_names=None):
+        """Load a booster saved with XGBoost's legacy binary format (model.bst)"""
+        position = 4 if raw[:4] == b"binf" else 0
+        (base_score,) = struct.unpack_from("<f", raw, position)
+        position += LEARNER_PARAM_SIZE
+        for _ in range(2):  # objective and booster names
+            (length,) = struct.unpack_from("<Q", raw, position)
+            position += 8 + length
+        (num_trees,) = struct.unpack_from("<i", raw, position)
+        position += GBTREE_PARAM_SIZE
+        trees = []
+        for _ in range(num_trees):
+            (num_nodes,) = struct.unpack_from("<i", raw, position + 4)
+            position += TREE_PARAM_SIZE
+            nodes = np.frombuffer(
+                raw,
+                dtype=np.dtype(
+                    [
+                        ("parent", "<i4"),
+                        ("left", "<i4"),
+                        ("right", "<i4"),
+                        ("sindex", "<u4"),
+                        ("info", "<f4"),
+                    ]
+                ),
+                count=num_nodes,
+                offset=position,
+            )
+            position += num_nodes * (NODE_SIZE + NODE_STAT_SIZE)
+            trees.append(
+                {
+                    "left": nodes["left"],
+                    "right": nodes["right"],
+                    "feature": nodes["sindex"] & 0x7FFFFFFF,
+                    "threshold": nodes["info"],
+                    "default_left": (nodes["sindex"] >> 31) != 0,
+                    "value": nodes["info"],
+                }
+            )
+        return cls(trees, base_score, feature_names)
+
+    def bind_features(self, names):
+        """
+        Remap the split features so that predict takes its columns in the
+        order of the provided names instead of the training order.
+        """
+        if self.feature_names:
+            position = {name: index for index, name in enumerate(names)}
+            mapping = np.array(
+                [position[name] for name in self.feature_names], dtype=np.int64
+            )
+            self.feature = mapping[self.feature]
+        self.feature_names = list(names)
+
+    def predict(self, features):
+        """Probability of the positive class for one or several feature rows"""
+        rows = np.atleast_2d(np.asarray(features, dtype=np.float32))
+        nodes = np.broadcast_to(self.roots, (rows.shape[0], self.roots.size))
+        row_index = np.arange(rows.shape[0])[:, None]
+        for _ in range(self.depth):
+            values = rows[row_index, self.feature[nodes]]
+            go_left = np.where(
+                np.isnan(values),
+                self.default_left[nodes],
+                values < self.threshold[nodes],
+            )
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        margin = self.base_margin + self.value[nodes].sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-margin))
+
+
+def _shift(children, offset):
+    children = np.asarray(children, dtype=np.int64)
+    return np.where(children == -1, -1, children + offset)
+
+
+def _depth(left, right):
+    depth, level = 0, [0]
+    while level:
+        level = [
+            child
+            for node in level
+            for child in (left[node], right[node])
+            if child != -1
+        ]
+        depth += bool(level)
+    return depth
@@ -0,0 +1,107 @@
+import unittest
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from treemodel import TreeModel
+
+
+def to_legacy_binary(model):
+    """Serialize a JSON booster with XGBoost's legacy binary layout"""
+    learner = model["learner"]
+    trees = learner["gradient_booster"]["model"]["trees"]
+    raw = b"binf" + struct.pack("<fIi", 0.5, 70, 0) + bytes(136 - 12)
+    for name in (b"binary:logistic", b"gbtree"):
+        raw += struct.pack("<Q", len(name)) + name
+    raw += struct.pack("<i", len(trees)) + bytes(160 - 4)
+    for tree in trees:
+        num_nodes = len(tree["left_children"])
+        raw += struct.pack("<ii", 1, num_nodes) + bytes(148 - 8)
+        for node in range(num_nodes):
+            sindex = tree["split_indices"][node] | (tree["default_left"][node] << 31)
+            raw += struct.pack(
+                "<iiiIf",
+                -1,
+                tree["left_children"][node],
+                tree["right_children"][node],
+                sindex,
+                tree["split_conditions"][node],
+            )
+        raw += bytes(16 * num_nodes)
+    return raw + struct.pack(f"<{len(trees)}i", *[0] * len(trees))
+
+
+# Model exported by BigQuery with the probabilities of ML.PREDICT, as written
+# by tools/capture_model_fixture.py
+EXPORT_DIR = "test_data/export_bt_btc"
+
+
+class TestCases(unittest.TestCase):
+    def setUp(self) -> None:
+        # A small booster written by hand, and the probabilities given by a
+        # recursive walk of its trees
+        with open("test_data/bt_btc.json", "r") as file:
+            self.model_json = json.load(file)
+        with open("test_data/bt_btc_predictions.json", "r") as file:
+            self.predictions = json.load(file)
+        self.features = np.array(
+            [
+                [np.nan if value is None else value for value in row["features"]]
+                for row in self.predictions
+            ]
+        )
+        self.probs = np.array([row["prob"] for row in self.predictions])
+
+    def test_predict(self):
+        model = TreeModel.from_xgboost_json(self.model_json)
+        np.testing.assert_allclose(model.predict(self.features), self.probs, atol=1e-6)
+
+    @unittest.skipUnless(
+        os.path.exists(EXPORT_DIR), "no model captured from BigQuery in test_data"
+    )
+    def test_parity_with_ml_predict(self):
+        with open(os.path.join(EXPORT_DIR, "model.bst"), "rb") as file:
+            raw = file.read()
+        with open(os.path.join(EXPORT_DIR, "assets", "model_metadata.json")) as file:
+            feature_names = json.load(file).get("feature_names")
+        with open(os.path.join(EXPORT_DIR, "ml_predict.json"), "r") as file:
+            rows = json.load(file)
+        names = list(rows[0]["features"])
+        model = TreeModel.from_bytes(raw, feature_names)
+        model.bind_features(names)
+        features = np.array(
+            [
+                [
+                    np.nan if row["features"][name] is None else row["features"][name]
+                    for name in names
+                ]
+                for row in rows
+            ]
+        )
+        np.testing.assert_allclose(
+            model.predict(features), [row["prob"] for row in rows], atol=1e-6
+        )
+
+    def test_single_row(self):
+        model = TreeModel.from_xgboost_json(self.model_json)
+        for row, prob in zip(self.features, self.probs):
+            self.assertAlmostEqual(float(model.predict(row)[0]), prob, places=6)
+
+    def test_legacy_binary(self):
+        model = TreeModel.from_bytes(to_legacy_binary(self.model_json))
+        np.testing.assert_allclose(model.predict(self.features), self.probs, atol=1e-6)
+
+    def test_bind_features(self):
+        model = TreeModel.from_bytes(json.dumps(self.model_json).encode("utf-8"))
+        names = model.feature_names[::-1]
+        model.bind_features(names)
+        np.testing.assert_allclose(
+            model.predict(self.features[:, ::-1]), self.probs, atol=1e-6
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
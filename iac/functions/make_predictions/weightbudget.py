@@ -0,0 +1,111 @@
+"""
+WeightBudget Class module
+"""
+import threading
+import time
+
+# Priorities of the requests, the lowest first
+CRITICAL = 0
+NORMAL = 1
+BULK = 2
+# Share of the budget which a request of each priority leaves to the higher
+# ones, so that the orders never wait behind a backfill of the histories
+RESERVES = {CRITICAL: 0.0, NORMAL: 0.1, BULK: 0.3}
+
+# Request weight and priority of the endpoints, by method and path
+ENDPOINTS = {
+    ("GET", "/api/v3/account"): (20, CRITICAL),
+    ("POST", "/api/v3/order"): (1, CRITICAL),
+    ("GET", "/api/v3/order"): (4, CRITICAL),
+    ("POST", "/api/v3/order/oco"): (1, CRITICAL),
+    ("DELETE", "/api/v3/orderList"): (1, CRITICAL),
+    ("GET", "/api/v3/openOrderList"): (6, CRITICAL),
+    ("GET", "/api/v3/allOrderList"): (20, CRITICAL),
+    ("GET", "/api/v3/time"): (1, CRITICAL),
+    ("GET", "/api/v3/ticker/price"): (4, NORMAL),
+    ("GET", "/api/v3/exchangeInfo"): (20, NORMAL),
+    ("GET", "/api/v3/klines"): (2, BULK),
+}
+DEFAULT_ENDPOINT = (1, NORMAL)
+# Request weight allowed per minute until the exchange info gives the limit
+DEFAULT_LIMIT = 1200
+
+
+def endpoint(method: str, path: str):
+    """Request weight and priority of an endpoint, its query string ignored"""
+    return ENDPOINTS.get((method.upper(), path.split("?")[0]), DEFAULT_ENDPOINT)
+
+
+def weight_limit(rate_limits):
+    """Request weight allowed per minute, from the rateLimits of exchangeInfo"""
+    for rate_limit in rate_limits:
+        if (
+            rate_limit["rateLimitType"] == "REQUEST_WEIGHT"
+            and rate_limit["interval"] == "MINUTE"
+        ):
+            return rate_limit["limit"] // rate_limit["intervalNum"]
+    return None
+
+
+class WeightBudget:
+    """
+    Token bucket of the request weight of the Binance API, shared by all the
+    requests of a process. The bucket holds a fraction of the weight allowed
+    per minute, and refills at that pace. The X-MBX-USED-WEIGHT-1M header of
+    the responses caps the tokens left, so that the weight used by other
+    clients of the same IP is accounted for, and a 429 or 418 status pauses
+    every request for the duration of its Retry-After header. A request only
+    takes tokens while the reserve of the higher priorities stays available.
+    """
+
+    def __init__(self, limit: int = DEFAULT_LIMIT, usage: float = 0.8):
+        self.usage = usage
+        self.condition = threading.Condition()
+        self.capacity = limit * usage
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def set_limit(self, limit: int):
+        """Use the weight allowed per minute reported by the exchange"""
+        with self.condition:
+            self._refill()
+            capacity = limit * self.usage
+            self.tokens = min(self.tokens + capacity - self.capacity, capacity)
+            self.capacity = capacity
+            self.condition.notify_all()
+
+    def acquire(self, weight: int, priority: int = NORMAL):
+        """Wait until a request of the provided weight and priority can be sent"""
+        with self.condition:
+            while True:
+                self._refill()
+                weight = min(weight, self.capacity)
+                reserve = self.capacity * RESERVES[priority]
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0:
+                    if self.tokens - weight >= reserve:
+                        self.tokens -= weight
+                        return
+                    wait = (weight + reserve - self.tokens) * 60 / self.capacity
+                self.condition.wait(wait)
+
+    def update(self, response):
+        """Take into account the weight used and the bans in a response"""
+        used = response.headers.get("X-MBX-USED-WEIGHT-1M")
+        with self.condition:
+            self._refill()
+            if used is not None:
+                self.tokens = min(self.tokens, self.capacity - int(used))
+            if response.status_code in (418, 429):
+                retry_after = int(response.headers.get("Retry-After", 60))
+                self.paused_until = time.monotonic() + retry_after
+                self.tokens = min(self.tokens, 0)
+                print(f"Rate limited by Binance, pausing {retry_after}s")
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
@@ -0,0 +1,66 @@
+import unittest
+from unittest import mock
+
+import threading
+import time
+
+from weightbudget import BULK, CRITICAL, NORMAL, WeightBudget, endpoint, weight_limit
+
+
+def response(status_code=200, headers=None):
+    return mock.Mock(status_code=status_code, headers=headers or {})
+
+
+class TestCases(unittest.TestCase):
+    def test_endpoint(self):
+        self.assertEqual(endpoint("post", "/api/v3/order"), (1, CRITICAL))
+        self.assertEqual(endpoint("GET", "/api/v3/order?orderId=1"), (4, CRITICAL))
+        self.assertEqual(endpoint("GET", "/api/v3/klines?symbol=BTCUSDT"), (2, BULK))
+        self.assertEqual(endpoint("GET", "/api/v3/avgPrice"), (1, NORMAL))
+        rate_limits = [
+            {"rateLimitType": "ORDERS", "interval": "SECOND", "intervalNum": 10},
+            {
+                "rateLimitType": "REQUEST_WEIGHT",
+                "interval": "MINUTE",
+                "intervalNum": 1,
+                "limit": 6000,
+            },
+        ]
+        self.assertEqual(weight_limit(rate_limits), 6000)
+        self.assertIsNone(weight_limit([]))
+
+    def test_priorities(self):
+        # 60 tokens per minute, refilled at one per second
+        budget = WeightBudget(limit=75)
+        self.assertEqual(budget.capacity, 60)
+        budget.acquire(40, BULK)
+        start = time.monotonic()
+        budget.acquire(2, BULK)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+        # The backfill leaves the last 30% of the budget to the orders
+        waiting = threading.Thread(target=budget.acquire, args=(2, BULK))
+        waiting.start()
+        waiting.join(0.2)
+        self.assertTrue(waiting.is_alive())
+        start = time.monotonic()
+        budget.acquire(15, CRITICAL)
+        self.assertLess(time.monotonic() - start, 0.1)
+        budget.set_limit(10**6)
+        waiting.join(1)
+        self.assertFalse(waiting.is_alive())
+
+    def test_update(self):
+        budget = WeightBudget(limit=1200)
+        budget.update(response(headers={"X-MBX-USED-WEIGHT-1M": "900"}))
+        self.assertAlmostEqual(budget.tokens, 60, delta=1)
+
+        budget.update(response(429, {"Retry-After": "1"}))
+        start = time.monotonic()
+        budget.set_limit(10**6)
+        budget.acquire(1, CRITICAL)
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,13 @@
+resource "google_storage_bucket" "binancebot_bucket" {
+ name                        = format("%s-%s", var.project ,"binancebot-bucket")
+ location                    = "EUROPE-WEST1"
+ uniform_bucket_level_access = true
+ provider                    = google-beta
+}
+
+resource "google_storage_bucket_iam_member" "binancebot_bucket_functions" {
+  provider = google-beta
+  bucket   = google_storage_bucket.binancebot_bucket.name
+  role     = "roles/storage.objectAdmin"
+  member   = "serviceAccount:${var.project}@appspot.gserviceaccount.com"
+}
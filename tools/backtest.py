@@ -0,0 +1,389 @@
+"""
+This script replays the decisions of the bot over minute klines stored in
+files, for all the coins at once, and reports the result of the trades it
+would have made.
+
+The kline files are the CSV files of the Binance public data dumps (one line
+per minute, open_time first, close price and volume in the fifth and sixth
+columns), named
+<COIN>USDT*.csv in the data directory. The klines can also be read from a
+kline store, such as the one written by complete_historical_data.py
+--store-dir, with --store-dir instead of --data-dir. The models are read from the layout
+written by EXPORT MODEL (models/bt_<coin>/model.bst), so a copy of the bot
+bucket can be used directly:
+
+    gsutil -m cp -r gs://PROJECT_ID-binancebot-bucket/models .
+    python backtest.py --data-dir klines --models-dir models --thresholds 0.6
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "iac", "functions", "make_predictions")
+)
+# pylint: disable=wrong-import-position
+from klinestore import KlineStore
+from pricehistory import HISTORY_LENGTH
+from strategy import best_signal, exit_reached, portfolio_decision
+from treemodel import TreeModel
+
+PARAMETER_FILE = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "iac",
+    "functions",
+    "make_predictions",
+    "parameters.json",
+)
+CHUNK_SIZE = 100000
+
+
+def load_klines(data_dir: str, coin: str):
+    """
+    Read the open times, close prices and volumes of a coin from its CSV
+    files. The parsed columns are cached next to the files in a .npz file.
+    """
+    cache = os.path.join(data_dir, f"{coin}USDT.npz")
+    files = sorted(glob.glob(os.path.join(data_dir, f"{coin}USDT*.csv")))
+    if os.path.exists(cache) and all(
+        os.path.getmtime(cache) >= os.path.getmtime(file) for file in files
+    ):
+        with np.load(cache) as data:
+            if "volume" in data.files:
+                return data["open_time"], data["close"], data["volume"]
+    columns = []
+    for file in files:
+        with open(file, "r") as csv_file:
+            header = not csv_file.read(1).isdigit()
+        columns.append(
+            np.loadtxt(
+                file, delimiter=",", usecols=(0, 4, 5), ndmin=2, skiprows=int(header)
+            )
+        )
+    data = np.concatenate(columns)
+    open_time = data[:, 0].astype(np.int64)
+    # The dumps published since 2025 are in microseconds
+    open_time = np.where(open_time > 10**14, open_time // 1000, open_time)
+    order = np.argsort(open_time, kind="stable")
+    open_time, close, volume = open_time[order], data[order, 1], data[order, 2]
+    np.savez(cache, open_time=open_time, close=close, volume=volume)
+    return open_time, close, volume
+
+
+def align(klines):
+    """
+    Place the close prices and volumes of all coins on a common grid of
+    minutes, covering the period where every coin has data. Missing minutes
+    repeat the previous close, as the bot would see the same ticker price,
+    with no volume.
+    """
+    start = max(open_time[0] for open_time, _, _ in klines.values())
+    end = min(open_time[-1] for open_time, _, _ in klines.values())
+    minutes = np.arange(start, end + 60000, 60000, dtype=np.int64)
+    prices = np.empty((minutes.size, len(klines)))
+    volumes = np.empty((minutes.size, len(klines)))
+    for column, (open_time, close, volume) in enumerate(klines.values()):
+        position = np.searchsorted(open_time, minutes, side="right") - 1
+        prices[:, column] = close[position]
+        volumes[:, column] = np.where(
+            open_time[position] == minutes, volume[position], 0.0
+        )
+    return minutes, prices, volumes
+
+
+def read_klines(coin_list, data_dir=None, store_dir=None):
+    """Klines of the coins, from the CSV files or from a kline store"""
+    if store_dir is None:
+        return {coin: load_klines(data_dir, coin) for coin in coin_list}
+    store = KlineStore(store_dir)
+    klines = {}
+    for coin in coin_list:
+        columns = store.read(coin + "USDT")
+        klines[coin] = columns["open_time"], columns["close"], columns["volume"]
+    return klines
+
+
+def load_model(models_dir: str, coin: str, indexes):
+    """Load the model of a coin from a copy of the exported models"""
+    path = os.path.join(models_dir, f"bt_{coin.lower()}")
+    with open(os.path.join(path, "model.bst"), "rb") as file:
+        raw = file.read()
+    feature_names = None
+    metadata = os.path.join(path, "assets", "model_metadata.json")
+    if os.path.exists(metadata):
+        with open(metadata, "r") as file:
+            feature_names = json.load(file).get("feature_names")
+    model = TreeModel.from_bytes(raw, feature_names)
+    model.bind_features([f"value_{coin.lower()}_{index}" for index in indexes])
+    return model
+
+
+def estimate(prices, model, indexes):
+    """
+    Estimation of the model for each minute of a price series, with the
+    features the bot computes from its history: the prices at the indexes,
+    counted back from the minute, of the last HISTORY_LENGTH minutes divided
+    by their mean. The first minutes,
+    without a full history, get no estimation (NaN).
+    """
+    estimations = np.full(prices.size, np.nan)
+    if prices.size < HISTORY_LENGTH:
+        return estimations
+    cumulated = np.concatenate([[0.0], np.cumsum(prices)])
+    means = (cumulated[HISTORY_LENGTH:] - cumulated[:-HISTORY_LENGTH]) / HISTORY_LENGTH
+    windows = sliding_window_view(prices, HISTORY_LENGTH)
+    # The index 0 of the features is the latest minute of the window
+    columns = HISTORY_LENGTH - 1 - np.asarray(indexes)
+    for start in range(0, windows.shape[0], CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        features = windows[chunk][:, columns] / means[chunk, None]
+        first = HISTORY_LENGTH - 1 + start
+        estimations[first : first + features.shape[0]] = model.predict(features)
+    return estimations
+
+
+def estimate_all(prices, coin_list, models_dir: str, indexes):
+    """Estimations of the model of each coin, one column per coin"""
+    return np.column_stack(
+        [
+            estimate(prices[:, column], load_model(models_dir, coin, indexes), indexes)
+            for column, coin in enumerate(coin_list)
+        ]
+    )
+
+
+def exit_offsets(
+    prices, minutes, coins, take_profit, stop_loss, max_trade_duration_seconds
+):
+    """
+    Number of minutes after which the trades opened at the provided minutes
+    on the provided coins would be closed, using the exit rule of
+    BinanceBot.decide on the following ticks. Trades that would still be open
+    at the end of the data get an offset of 0.
+    """
+    horizon = int(max_trade_duration_seconds // 60) + 1
+    offsets = np.zeros(minutes.size, dtype=np.int64)
+    if prices.shape[0] <= horizon:
+        return offsets
+    elapsed = np.arange(1, horizon + 1) * 60
+    windows = sliding_window_view(prices, horizon + 1, axis=0)
+    complete = minutes < windows.shape[0]
+    for start in range(0, minutes.size, CHUNK_SIZE):
+        chunk = slice(start, start + CHUNK_SIZE)
+        selected = complete[chunk]
+        rows = windows[minutes[chunk][selected], coins[chunk][selected]]
+        entry = rows[:, :1]
+        reached = exit_reached(
+            rows[:, 1:],
+            entry * take_profit,
+            entry * stop_loss,
+            elapsed,
+            max_trade_duration_seconds,
+        )
+        offsets[chunk][selected] = np.argmax(reached, axis=-1) + 1
+    return offsets
+
+
+def simulate(
+    prices, estimations, thresholds, exit_rule, fee=0.0, max_positions=1, bracket=False
+):
+    """
+    Replay the decisions of the bot with portfolio_decision, as
+    BinanceBot.decide takes them: at most max_positions trades open at a
+    time, opened on the coins the furthest above their thresholds with an
+    equal share of the free USDT, and no new trade in the slots freed on the
+    same tick. exit_rule is the (take_profit, stop_loss,
+    max_trade_duration_seconds) tuple. With bracket, the trades leave at
+    their limits on the exchange, between two ticks, and only on their time
+    limit by the decisions. Returns the list of trades as (coin index, entry
+    minute, exit minute, return, amount) tuples, the amount being the share
+    of the starting capital invested in the trade.
+    """
+    signal = best_signal(np.nan_to_num(estimations, nan=-np.inf), thresholds)
+    return replay(
+        prices, estimations, thresholds, signal, exit_rule, fee, max_positions, bracket
+    )
+
+
+def replay(
+    prices,
+    estimations,
+    thresholds,
+    signal,
+    exit_rule,
+    fee=0.0,
+    max_positions=1,
+    bracket=False,
+):
+    """
+    Trades of simulate, with the best_signal of the estimations, computed
+    once for the thresholds so that it can be replayed with several exit
+    rules. The decisions are only taken on the minutes where a trade can
+    exit, or be opened in a free slot, the exit minute of each trade being
+    known from the exit_offsets of the minutes and coins above their
+    thresholds. The trades still open at the end of the data are left out.
+    """
+    take_profit, stop_loss, max_duration = exit_rule
+    size = signal.size
+    candidates = np.nonzero(np.nan_to_num(estimations, nan=-np.inf) >= thresholds)
+    offsets = np.zeros(prices.shape, dtype=np.int64)
+    offsets[candidates] = exit_offsets(prices, *candidates, *exit_rule)
+    next_signal = np.minimum.accumulate(
+        np.where(signal >= 0, np.arange(size), size)[::-1]
+    )[::-1]
+    trades = []
+    cash = 1.0
+    # Open trades as (coin index, entry minute, entry price, amount, exit minute)
+    positions = []
+
+    def close(position, minute, price):
+        coin, entry, entry_price, amount, _ = position
+        result = price / entry_price * (1 - fee) ** 2
+        trades.append((coin, entry, minute, result, amount))
+        return amount * result
+
+    minute = 0
+    while minute < size:
+        next_minute = min((position[4] for position in positions), default=size)
+        if len(positions) < max_positions:
+            next_minute = min(next_minute, next_signal[minute])
+        minute = next_minute
+        if minute >= size:
+            break
+        tick_prices = prices[minute]
+        if bracket:
+            # The brackets filled since the last tick are closed at their limit
+            remaining = []
+            for position in positions:
+                price, entry_price = tick_prices[position[0]], position[2]
+                if price >= entry_price * take_profit:
+                    cash += close(position, minute, entry_price * take_profit)
+                elif price <= entry_price * stop_loss:
+                    cash += close(position, minute, entry_price * stop_loss)
+                else:
+                    remaining.append(position)
+            positions = remaining
+        coins = [position[0] for position in positions]
+        entry_prices = np.array([position[2] for position in positions])
+        exits, entries = portfolio_decision(
+            tick_prices[coins],
+            np.full(len(positions), np.inf) if bracket else entry_prices * take_profit,
+            np.zeros(len(positions)) if bracket else entry_prices * stop_loss,
+            [(minute - position[1]) * 60 for position in positions],
+            max_duration,
+            coins,
+            estimations[minute],
+            thresholds,
+            max_positions,
+        )
+        # The free USDT is shared before the exits of the tick are filled
+        free_slots = max_positions - len(positions)
+        amount = cash / free_slots if free_slots > 0 else 0.0
+        for position, closed in zip(positions, exits):
+            if closed:
+                cash += close(position, minute, tick_prices[position[0]])
+        positions = [
+            position for position, closed in zip(positions, exits) if not closed
+        ]
+        for coin in entries:
+            offset = offsets[minute, coin]
+            exit_minute = minute + offset if offset else size
+            positions.append((coin, minute, tick_prices[coin], amount, exit_minute))
+            cash -= amount
+        minute += 1
+    return trades
+
+
+def report(coin_list, minutes, trades):
+    """
+    Summarise the simulated trades. The profit is that of the starting
+    capital, each trade adding the profit of its amount, and that of a coin
+    the share of its trades in it.
+    """
+    results = np.array([trade[3] for trade in trades])
+    profits = np.array([(trade[3] - 1) * trade[4] for trade in trades])
+    durations = np.array([trade[2] - trade[1] for trade in trades])
+    summary = {
+        "start": int(minutes[0]),
+        "end": int(minutes[-1]),
+        "trade_count": len(trades),
+        "pnl_percent": float(profits.sum() * 100) if trades else 0.0,
+        "win_rate": float(np.mean(results > 1)) if trades else 0.0,
+        "mean_duration_minutes": float(durations.mean()) if trades else 0.0,
+        "max_duration_minutes": int(durations.max()) if trades else 0,
+        "coins": {},
+    }
+    for index, coin in enumerate(coin_list):
+        coin_profits = np.array(
+            [profit for trade, profit in zip(trades, profits) if trade[0] == index]
+        )
+        summary["coins"][coin] = {
+            "trade_count": int(coin_profits.size),
+            "pnl_percent": float(coin_profits.sum() * 100),
+        }
+    return summary
+
+
+def parse_thresholds(value: str, coin_list):
+    """Thresholds from a JSON file {coin: threshold} or a single value"""
+    if os.path.exists(value):
+        with open(value, "r") as file:
+            data = json.load(file)
+        return np.array([float(data[coin]) for coin in coin_list])
+    return np.full(len(coin_list), float(value))
+
+
+def main():
+    """
+    Backtest the bot over the kline files for the coins of the parameter file
+    """
+    with open(PARAMETER_FILE, "r") as file:
+        parameters = json.load(file)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data-dir")
+    source.add_argument("--store-dir")
+    parser.add_argument("--models-dir", required=True)
+    parser.add_argument("--thresholds", required=True)
+    parser.add_argument("--coins", nargs="+", default=parameters["coin_list"])
+    parser.add_argument("--take-profit", type=float, default=parameters["take_profit"])
+    parser.add_argument("--stop-loss", type=float, default=parameters["stop_loss"])
+    parser.add_argument(
+        "--max-trade-duration-seconds",
+        type=int,
+        default=parameters["max_trade_duration_seconds"],
+    )
+    parser.add_argument(
+        "--max-open-positions", type=int, default=parameters["max_open_positions"]
+    )
+    parser.add_argument(
+        "--order-mode", choices=["market", "bracket"], default=parameters["order_mode"]
+    )
+    parser.add_argument("--fee", type=float, default=0.001)
+    args = parser.parse_args()
+
+    minutes, prices, _ = align(read_klines(args.coins, args.data_dir, args.store_dir))
+    estimations = estimate_all(
+        prices, args.coins, args.models_dir, parameters["indexes"]
+    )
+    trades = simulate(
+        prices,
+        estimations,
+        parse_thresholds(args.thresholds, args.coins),
+        (args.take_profit, args.stop_loss, args.max_trade_duration_seconds),
+        args.fee,
+        args.max_open_positions,
+        args.order_mode == "bracket",
+    )
+    print(json.dumps(report(args.coins, minutes, trades), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from backtest import (
+    align,
+    estimate,
+    exit_offsets,
+    load_klines,
+    replay,
+    report,
+    simulate,
+)
+from pricehistory import HISTORY_LENGTH, PriceHistory
+
+# Take profit, stop loss and max trade duration of the tests: a trade is
+# closed after 4 minutes at most
+EXIT_RULE = (1.01, 0.98, 180)
+
+
+def write_klines(path, rows, header=False):
+    """Write klines in the layout of the Binance public data dumps"""
+    with open(path, "w") as file:
+        if header:
+            file.write("open_time,open,high,low,close,volume,close_time\n")
+        for open_time, close, volume in rows:
+            file.write(f"{open_time},{close},{close},{close},{close},{volume},0\n")
+
+
+class TestCases(unittest.TestCase):
+    def test_load_klines(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            # The dumps published since 2025 are in microseconds, with a header
+            write_klines(
+                os.path.join(data_dir, "BTCUSDT-1m-2025-01.csv"),
+                [(1735689660000000, 3.0, 30.0), (1735689600000000, 2.0, 20.0)],
+                header=True,
+            )
+            write_klines(
+                os.path.join(data_dir, "BTCUSDT-1m-2024-12.csv"),
+                [(1735689540000, 1.0, 10.0)],
+            )
+            open_time, close, volume = load_klines(data_dir, "BTC")
+            self.assertEqual(
+                open_time.tolist(), [1735689540000, 1735689600000, 1735689660000]
+            )
+            self.assertEqual(close.tolist(), [1.0, 2.0, 3.0])
+            self.assertEqual(volume.tolist(), [10.0, 20.0, 30.0])
+            # Read again from the cache
+            self.assertTrue(os.path.exists(os.path.join(data_dir, "BTCUSDT.npz")))
+            cached = load_klines(data_dir, "BTC")
+            self.assertEqual(cached[0].tolist(), open_time.tolist())
+
+    def test_align(self):
+        klines = {
+            "BTC": (
+                np.array([0, 60000, 180000]),
+                np.array([1.0, 2.0, 4.0]),
+                np.array([10.0, 20.0, 40.0]),
+            ),
+            "ETH": (
+                np.array([60000, 120000, 180000, 240000]),
+                np.array([5.0, 6.0, 7.0, 8.0]),
+                np.array([50.0, 60.0, 70.0, 80.0]),
+            ),
+        }
+        minutes, prices, volumes = align(klines)
+        # Only the period covered by every coin
+        self.assertEqual(minutes.tolist(), [60000, 120000, 180000])
+        # The missing minute of BTC repeats its previous close, with no volume
+        self.assertEqual(prices[:, 0].tolist(), [2.0, 2.0, 4.0])
+        self.assertEqual(volumes[:, 0].tolist(), [20.0, 0.0, 40.0])
+        self.assertEqual(prices[:, 1].tolist(), [5.0, 6.0, 7.0])
+        self.assertEqual(volumes[:, 1].tolist(), [50.0, 60.0, 70.0])
+
+    def test_estimate_features(self):
+        # The features of each minute are those of the bot's history
+        indexes = [0, 1, 60, 1440]
+        prices = np.random.default_rng(0).uniform(100, 200, HISTORY_LENGTH + 2)
+        model = mock.Mock(predict=lambda features: features[:, 0])
+        estimations = estimate(prices, model, indexes)
+        self.assertTrue(np.all(np.isnan(estimations[: HISTORY_LENGTH - 1])))
+        history = PriceHistory(HISTORY_LENGTH, indexes)
+        for minute in range(HISTORY_LENGTH - 1, prices.size):
+            history.reset(prices[: minute + 1])
+            self.assertAlmostEqual(estimations[minute], history.features()[0])
+
+    def test_exit_offsets(self):
+        prices = np.ones((10, 1))
+        prices[2, 0] = 1.02
+        offsets = exit_offsets(
+            prices, np.array([0, 5, 7]), np.array([0, 0, 0]), *EXIT_RULE
+        )
+        # Take profit, then the time limit, then still open at the end
+        self.assertEqual(offsets.tolist(), [2, 4, 0])
+
+    def test_replay(self):
+        prices = np.ones((10, 1))
+        prices[2, 0] = 1.02
+        estimations = np.ones((10, 1))
+        thresholds = np.array([0.5])
+        signal = np.zeros(10, dtype=np.int64)
+        trades = replay(prices, estimations, thresholds, signal, EXIT_RULE)
+        # No new trade on the exit minute of the previous one
+        self.assertEqual(
+            [(entry, exit_minute) for _, entry, exit_minute, _, _ in trades],
+            [(0, 2), (3, 7)],
+        )
+        self.assertAlmostEqual(trades[0][3], 1.02)
+        self.assertAlmostEqual(trades[1][3], 1.0)
+        # The whole capital is invested in each trade
+        self.assertAlmostEqual(trades[1][4], 1.02)
+
+    def test_replay_bracket(self):
+        prices = np.ones((10, 1))
+        prices[2:, 0] = 1.03
+        estimations = np.ones((10, 1))
+        thresholds = np.array([0.5])
+        signal = np.zeros(10, dtype=np.int64)
+        trades = replay(
+            prices, estimations, thresholds, signal, EXIT_RULE, bracket=True
+        )
+        # The bracket is filled at its take profit before the tick, which
+        # opens a new trade, only closed on its time limit
+        self.assertEqual(
+            [(entry, exit_minute) for _, entry, exit_minute, _, _ in trades],
+            [(0, 2), (2, 6)],
+        )
+        self.assertAlmostEqual(trades[0][3], 1.01)
+        self.assertAlmostEqual(trades[1][3], 1.0)
+
+    def test_simulate_positions(self):
+        prices = np.ones((10, 3))
+        prices[1, 1] = 1.02
+        estimations = np.full((10, 3), np.nan)
+        estimations[0] = [0.7, 0.9, 0.8]
+        estimations[2] = [0.9, 0.9, 0.9]
+        trades = simulate(
+            prices, estimations, np.full(3, 0.5), EXIT_RULE, max_positions=2
+        )
+        # The two best coins share the capital, the slot freed by the take
+        # profit of the first one is used on the next signal, for a coin
+        # which is not held
+        self.assertEqual(
+            [trade[:3] for trade in trades], [(1, 0, 1), (2, 0, 4), (0, 2, 6)]
+        )
+        self.assertEqual([trade[4] for trade in trades], [0.5, 0.5, 0.51])
+        summary = report(["BTC", "ETH", "SOL"], np.arange(10) * 60000, trades)
+        self.assertAlmostEqual(summary["pnl_percent"], 1.0)
+        self.assertAlmostEqual(summary["coins"]["ETH"]["pnl_percent"], 1.0)
+
+    def test_report_without_trades(self):
+        summary = report(["BTC", "ETH"], np.array([0, 60000]), [])
+        self.assertEqual(summary["trade_count"], 0)
+        self.assertEqual(summary["pnl_percent"], 0.0)
+        self.assertEqual(summary["win_rate"], 0.0)
+        self.assertEqual(summary["max_duration_minutes"], 0)
+        self.assertEqual(
+            summary["coins"]["BTC"], {"trade_count": 0, "pnl_percent": 0.0}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,441 @@
+"""
+This script measures the ticks of the bot as the number of coins grows. It
+runs BinanceBot against a local HTTP stub of the Binance REST endpoints, with
+a configurable latency and the used weight headers of the API (answering
+429 above --weight-limit, if set), and against in-memory stand-ins of
+BigQuery, Cloud Storage and Secret Manager, so that nothing leaves the
+machine.
+
+Each coin count runs in its own process, for its memory to be measured
+alone: a cold tick fetching the full histories, then the measured ticks. The
+throughput, tick latency percentiles, resident memory and the percentiles of
+each call of the bot are appended to a JSON lines file, with the commit they
+were measured on, and compared with the last result of the same setup:
+
+    python benchmark.py --coins 3 30 300 --ticks 50 --latency-ms 20
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "iac", "functions", "make_predictions")
+)
+# pylint: disable=wrong-import-position
+import binancebot
+from binanceclient import BinanceClient
+from weightbudget import endpoint
+
+PREDICTIONS_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "iac", "functions", "make_predictions"
+)
+
+
+def price(symbol: str, minute: int) -> float:
+    """Synthetic close price of a symbol at a minute"""
+    phase = sum(symbol.encode("utf-8")) % 100
+    return 100.0 * (1 + 0.02 * np.sin(minute / 50 + phase))
+
+
+def kline(symbol: str, open_time: int):
+    """Synthetic kline in the format of the API"""
+    close = format(price(symbol, open_time // 60000), ".8f")
+    return [
+        open_time,
+        close,
+        close,
+        close,
+        close,
+        "10.0",
+        open_time + 59999,
+        "1000.0",
+        100,
+        "5.0",
+        "500.0",
+        "0",
+    ]
+
+
+class BinanceStub(BaseHTTPRequestHandler):
+    """
+    Handler of the Binance endpoints used by the bot. The server holds the
+    latency, the weight limit and the weight used in the current minute.
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer the public and account endpoints"""
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/api/v3/exchangeInfo":
+            self.answer(
+                url.path,
+                {
+                    # Without a weight limit, the budget of the bot is not
+                    # what is measured
+                    "rateLimits": [
+                        {
+                            "rateLimitType": "REQUEST_WEIGHT",
+                            "interval": "MINUTE",
+                            "intervalNum": 1,
+                            "limit": self.server.weight_limit or 10**6,
+                        }
+                    ],
+                    "symbols": [
+                        {
+                            "symbol": query["symbol"],
+                            "filters": [
+                                {
+                                    "filterType": "PRICE_FILTER",
+                                    "tickSize": "0.01000000",
+                                },
+                                {
+                                    "filterType": "LOT_SIZE",
+                                    "minQty": "0.00001",
+                                    "maxQty": "9000.0",
+                                    "stepSize": "0.00001",
+                                }
+                            ],
+                        }
+                    ]
+                },
+            )
+        elif url.path == "/api/v3/klines":
+            limit = int(query.get("limit", 500))
+            now = int(time.time() // 60) * 60000
+            if "startTime" in query:
+                first = max(int(query["startTime"]), now - (limit - 1) * 60000)
+                last = min(now, first + (limit - 1) * 60000)
+            else:
+                last = min(now, int(query.get("endTime", now)) // 60000 * 60000)
+                first = last - (limit - 1) * 60000
+            self.answer(
+                url.path,
+                [
+                    kline(query["symbol"], open_time)
+                    for open_time in range(first, last + 1, 60000)
+                ],
+            )
+        elif url.path == "/api/v3/ticker/price":
+            minute = int(time.time() // 60)
+            self.answer(
+                url.path,
+                [
+                    {"symbol": symbol, "price": format(price(symbol, minute), ".8f")}
+                    for symbol in json.loads(query["symbols"])
+                ],
+            )
+        elif url.path == "/api/v3/time":
+            self.answer(url.path, {"serverTime": round(time.time() * 1000)})
+        elif url.path == "/api/v3/account":
+            self.answer(url.path, {"balances": [{"asset": "USDT", "free": "1000.0"}]})
+        else:
+            self.answer(url.path, {"code": -1, "msg": "Unknown endpoint"}, 404)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Accept the orders"""
+        url = urlparse(self.path)
+        self.answer(url.path, {"status": "FILLED"})
+
+    def answer(self, path: str, body, status: int = 200):
+        """Send a JSON body after the latency, with the used weight headers"""
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            minute = int(time.time() // 60)
+            if minute != server.minute:
+                server.minute, server.used_weight = minute, 0
+            server.used_weight += endpoint(self.command, path)[0]
+            used_weight = server.used_weight
+            server.peak_weight = max(server.peak_weight, used_weight)
+        if server.weight_limit and used_weight > server.weight_limit:
+            status, body = 429, {"code": -1003, "msg": "Too many requests"}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-MBX-USED-WEIGHT-1M", str(used_weight))
+        if status == 429:
+            self.send_header("Retry-After", str(60 - int(time.time()) % 60))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Keep the requests out of the output"""
+
+
+def start_stub(latency: float, weight_limit: int):
+    """Serve the Binance stub on a free local port, in a thread"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BinanceStub)
+    server.daemon_threads = True
+    server.latency = latency
+    server.weight_limit = weight_limit
+    server.lock = threading.Lock()
+    server.minute, server.used_weight, server.peak_weight = 0, 0, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeBigQuery:
+    """
+    In-memory stand-in of the BigQuery client: no open trade, thresholds no
+    estimation reaches, and the same probability for every remote estimation
+    """
+
+    def __init__(self, coin_list, latency: float):
+        self.coin_list = coin_list
+        self.latency = latency
+
+    def query(self, query: str, job_config=None):
+        """Run a query, answered from the text of the query"""
+        time.sleep(self.latency)
+        rows = []
+        if "ML.PREDICT" in query:
+            rows = [
+                {"coin": parameter.name[len("features_") :].upper(), "prob": 0.5}
+                for parameter in job_config.query_parameters
+            ]
+        elif "models.thresholds" in query:
+            rows = [{"coin": coin, "threshold": 0.99} for coin in self.coin_list]
+        return types.SimpleNamespace(result=lambda: rows)
+
+
+class FakeBucket:
+    """In-memory stand-in of a Cloud Storage bucket"""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def get_blob(self, name: str):
+        """Blob of the provided name, or None"""
+        if name not in self.blobs:
+            return None
+        generation, data = self.blobs[name]
+        return types.SimpleNamespace(
+            generation=generation, download_as_bytes=lambda: data
+        )
+
+    def blob(self, name: str):
+        """Writable blob of the provided name"""
+
+        def upload_from_string(data, content_type=None):
+            generation = self.blobs.get(name, (0, None))[0] + 1
+            self.blobs[name] = (generation, data)
+
+        return types.SimpleNamespace(upload_from_string=upload_from_string)
+
+
+def fake_secret(request):
+    """Secret Manager answer with a dummy secret"""
+    return types.SimpleNamespace(payload=types.SimpleNamespace(data=b"benchmark"))
+
+
+def percentiles(values):
+    """50th, 95th and 99th percentiles and maximum of a list of durations"""
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(np.max(values)),
+    }
+
+
+def resident_memory_mb() -> float:
+    """Current resident memory of the process"""
+    with open("/proc/self/statm", "r") as file:
+        pages = int(file.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def run(coin_count: int, ticks: int, url: str, bigquery_latency: float, models: bool):
+    """
+    Build a bot for the coin count against the stub and the stand-ins, run a
+    cold tick then the measured ticks, and return the measures
+    """
+    with open(os.path.join(PREDICTIONS_DIR, "parameters.json"), "r") as file:
+        parameters = json.load(file)
+    coin_list = [f"C{index:03d}" for index in range(coin_count)]
+    bucket = FakeBucket()
+    if models:
+        model_file = os.path.join(PREDICTIONS_DIR, "test_data", "bt_btc.json")
+        with open(model_file, "rb") as file:
+            model = file.read()
+        for coin in coin_list:
+            path = f"models/bt_{coin.lower()}"
+            bucket.blob(f"{path}/model.bst").upload_from_string(model)
+            # The features of the test model, under the names of the coin
+            names = [f"value_{coin.lower()}_{index}" for index in parameters["indexes"]]
+            bucket.blob(f"{path}/assets/model_metadata.json").upload_from_string(
+                json.dumps({"feature_names": names})
+            )
+    with tempfile.TemporaryDirectory() as directory:
+        parameters.update(
+            coin_list=coin_list,
+            kline_store=os.path.join(directory, "klines"),
+            ledger=os.path.join(directory, "ledger.sqlite3"),
+            trace_file=None,
+        )
+        parameter_file = os.path.join(directory, "parameters.json")
+        with open(parameter_file, "w") as file:
+            json.dump(parameters, file)
+        storage_client = types.SimpleNamespace(bucket=lambda name: bucket)
+        secret_client = types.SimpleNamespace(access_secret_version=fake_secret)
+        with mock.patch.object(
+            binancebot.bigquery,
+            "Client",
+            return_value=FakeBigQuery(coin_list, bigquery_latency),
+        ), mock.patch.object(
+            binancebot.storage, "Client", return_value=storage_client
+        ), mock.patch.object(
+            binancebot.secretmanager,
+            "SecretManagerServiceClient",
+            return_value=secret_client,
+        ), contextlib.redirect_stdout(
+            io.StringIO()
+        ) as output:
+            bot = binancebot.BinanceBot(
+                parameter_file,
+                BinanceClient(
+                    pool_size=len(coin_list) + 6, base_url=url, timeout=30
+                ),
+            )
+            start = time.perf_counter()
+            bot.tick()
+            cold_tick = time.perf_counter() - start
+            durations = []
+            for _ in range(ticks):
+                output.seek(0)
+                output.truncate()
+                start = time.perf_counter()
+                bot.tick()
+                durations.append(time.perf_counter() - start)
+        estimated = sum(coin in bot.estimations for coin in coin_list)
+        return {
+            "coins": coin_count,
+            "ticks": ticks,
+            "estimated_coins": estimated,
+            "ticks_per_second": ticks / sum(durations),
+            "cold_tick_seconds": cold_tick,
+            "tick_seconds": percentiles(durations),
+            "rss_mb": resident_memory_mb(),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "calls": {
+                name: summary["p50"] for name, summary in bot.timeline.summary().items()
+            },
+        }
+
+
+def commit() -> str:
+    """Commit of the working tree, marked when it has uncommitted changes"""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+        changed = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            check=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return revision + ("-dirty" if changed else "")
+
+
+def previous_result(path: str, result):
+    """Last result of the file measured with the same setup, if any"""
+    if not os.path.exists(path):
+        return None
+    setup = ("coins", "ticks", "latency_ms", "bigquery_latency_ms", "local_models")
+    previous = None
+    with open(path, "r") as file:
+        for line in file:
+            row = json.loads(line)
+            if all(row.get(key) == result[key] for key in setup):
+                previous = row
+    return previous
+
+
+def main():
+    """Benchmark the ticks for each coin count and save the results"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--coins", nargs="+", type=int, default=[3, 30, 300])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--bigquery-latency-ms", type=float, default=200)
+    parser.add_argument("--weight-limit", type=int, default=0)
+    parser.add_argument("--local-models", action="store_true")
+    parser.add_argument("--output", default="benchmark_results.jsonl")
+    args = parser.parse_args()
+
+    server = start_stub(args.latency_ms / 1000, args.weight_limit)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    revision = commit()
+    context = multiprocessing.get_context("spawn")
+    for coin_count in args.coins:
+        with server.lock:
+            server.minute, server.used_weight, server.peak_weight = 0, 0, 0
+        with context.Pool(1) as pool:
+            result = pool.apply(
+                run,
+                (
+                    coin_count,
+                    args.ticks,
+                    url,
+                    args.bigquery_latency_ms / 1000,
+                    args.local_models,
+                ),
+            )
+        result = {
+            "commit": revision,
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "latency_ms": args.latency_ms,
+            "bigquery_latency_ms": args.bigquery_latency_ms,
+            "local_models": args.local_models,
+            **result,
+            "peak_weight_1m": server.peak_weight,
+        }
+        previous = previous_result(args.output, result)
+        print(
+            f"{coin_count} coins: {result['ticks_per_second']:.2f} ticks/s,"
+            f" p50 {result['tick_seconds']['p50'] * 1000:.0f} ms,"
+            f" p99 {result['tick_seconds']['p99'] * 1000:.0f} ms,"
+            f" cold tick {result['cold_tick_seconds']:.2f} s,"
+            f" RSS {result['rss_mb']:.0f} MB"
+        )
+        if previous is not None:
+            print(
+                f"    previous ({previous['commit']}):"
+                f" {previous['ticks_per_second']:.2f} ticks/s,"
+                f" p50 {previous['tick_seconds']['p50'] * 1000:.0f} ms,"
+                f" RSS {previous['rss_mb']:.0f} MB"
+            )
+        with open(args.output, "a") as file:
+            file.write(json.dumps(result) + "\n")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+This script captures the fixture of the parity test of treemodel.py with
+BigQuery ML: the model of a coin as exported to the bot bucket by its
+update_model procedure, and the probabilities ML.PREDICT gives for the last
+rows of its features table. The files are written in the test_data directory
+of the bot, in the layout of EXPORT MODEL, the predictions in ml_predict.json:
+
+    python capture_model_fixture.py --coin BTC --rows 50
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from google.cloud import bigquery
+from google.cloud import storage
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "iac", "functions", "make_predictions")
+)
+# pylint: disable=wrong-import-position
+from backtest import PARAMETER_FILE
+
+TEST_DATA_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "iac", "functions", "make_predictions", "test_data"
+)
+
+
+def main():
+    """Download the exported model of a coin and score rows with ML.PREDICT"""
+    with open(PARAMETER_FILE, "r") as file:
+        parameters = json.load(file)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--coin", default="BTC")
+    parser.add_argument("--rows", type=int, default=50)
+    args = parser.parse_args()
+
+    project = parameters["project"]
+    lc_coin = args.coin.lower()
+    directory = os.path.join(TEST_DATA_DIR, f"export_bt_{lc_coin}")
+    os.makedirs(os.path.join(directory, "assets"), exist_ok=True)
+    bucket = storage.Client(project=project).bucket(parameters["bucket"])
+    # The model of the bucket is the one the procedure trained and exported
+    for name in ("model.bst", "assets/model_metadata.json"):
+        bucket.blob(f"models/bt_{lc_coin}/{name}").download_to_filename(
+            os.path.join(directory, name)
+        )
+    names = [f"value_{lc_coin}_{index}" for index in parameters["indexes"]]
+    query_job = bigquery.Client(project=project).query(
+        f"SELECT {', '.join(names)},"
+        " (SELECT prob FROM UNNEST(predicted_win_in_hour_probs) WHERE label)"
+        " AS prob "
+        "FROM ML.PREDICT("
+        f"MODEL `{project}.models.bt_{lc_coin}`,"
+        f"(SELECT * FROM `{project}.training_views.features_{lc_coin}`"
+        f" ORDER BY minute_start DESC LIMIT {args.rows}))"
+    )
+    rows = [
+        {"features": {name: row[name] for name in names}, "prob": row["prob"]}
+        for row in query_job.result()
+    ]
+    with open(os.path.join(directory, "ml_predict.json"), "w") as file:
+        json.dump(rows, file, indent=1)
+    print(f"{len(rows)} rows of ML.PREDICT written in {directory}")
+
+
+if __name__ == "__main__":
+    main()
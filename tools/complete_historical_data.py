@@ -1,132 +1,204 @@
 """
 This script fills the minute tables for all coin listed in the coin.lst file
-between the current timestamp and the start time provided below
+between the current timestamp and the start time provided below. The gaps of
+all the tables are found with a single query, or in local kline files.
+
+The windows of all coins and gaps are fetched concurrently, at a pace adapted
+to the request weight reported by Binance, and the progress is written in a
+checkpoint file so that an interrupted run resumes where it stopped. The klines
+are staged in newline delimited JSON files, loaded in the tables with a few
+load jobs per coin.
 """
 
+import argparse
+import concurrent.futures
+import glob
 import json
 import time
-import requests
 import os
+import sys
 
+import numpy as np
 from google.cloud import bigquery
+from requests.adapters import HTTPAdapter
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "iac", "functions", "make_predictions")
+)
+# pylint: disable=wrong-import-position
+from backtest import load_klines as load_kline_files
+from binanceclient import BinanceClient
+from klinestaging import KlineStaging
+from klinestore import KlineStore
+from weightbudget import weight_limit
 
 bq_client = bigquery.Client()
+binance_client = BinanceClient()
 START_TIME = round(time.time()) * 1000 - 2 * 365 * 24 * 60 * 60 * 1000
 PROJECT = os.getenv('TF_VAR_project')
+WINDOW_MINUTES = 1000
+CHECKPOINT_FILE = "backfill_checkpoint.jsonl"
+# Requests of a window sent before giving up when Binance keeps rate limiting
+RATE_LIMIT_ATTEMPTS = 5
 
 
-def insert_data(coin, data):
+def set_weight_limit():
     """
-    Insert the provided data lines in bigquery
+    Use the request weight allowed per minute by Binance in the weight budget
+    of the client
     """
-    insertion = [
-        "(TIMESTAMP_MILLIS("
-        + str(element[0])
-        + "),"
-        + ", ".join(map(str, element[:-1]))
-        + ")"
-        for element in data
-    ]
-    bq_client.query(
-        f"INSERT INTO `{PROJECT}.binance_data.minute_{coin.lower()}`"
-        "(minute_timestamp, "
-        "open_time, "
-        "open, "
-        "high, "
-        "low, "
-        "close, "
-        "volume, "
-        "close_time, "
-        "quote_asset_volume, "
-        "number_of_trades, "
-        "taker_buy_base_asset_volume, "
-        "taker_buy_quote_asset_volume) "
-        "VALUES " + ",".join(insertion) + ";"
-    )
+    response = binance_client.get("/api/v3/exchangeInfo?symbol=BTCUSDT")
+    limit = weight_limit(response.json()["rateLimits"])
+    if limit is not None:
+        binance_client.budget.set_limit(limit)
 
 
-def get_klines(symbol: str = None, end_time: int = None, start_time: int = None):
+def get_klines(
+    symbol: str = None,
+    end_time: int = None,
+    start_time: int = None,
+):
     """
-    Request the 500 last minutes from the public Binance API and return them
+    Request up to WINDOW_MINUTES minutes from the public Binance API and
+    return them, retrying when the request was rate limited, once the weight
+    budget of the client is no longer paused for the Retry-After of the
+    response. Raises an HTTPError for an error status, as when the request is
+    still rate limited after RATE_LIMIT_ATTEMPTS attempts, so that the window
+    is not marked as filled and is fetched again on resume.
     """
-    print(f"{start_time} {end_time}", end="\r")
-
     end_time_str = "" if end_time is None else f"&endTime={end_time}"
     startime_str = "" if start_time is None else f"&startTime={start_time}"
 
     if symbol is None:
         url = (
-            "https://api.binance.com/api/v3/klines?symbol=BTCUSDT&interval=1m"
+            f"/api/v3/klines?symbol=BTCUSDT&interval=1m&limit={WINDOW_MINUTES}"
             f"{end_time_str}{startime_str}"
         )
     else:
         url = (
-            "https://api.binance.com/api/v3/klines?interval=1m"
+            f"/api/v3/klines?interval=1m&limit={WINDOW_MINUTES}"
             f"&symbol={symbol}{end_time_str}{startime_str}"
         )
 
-    response = requests.request("GET", url, headers={}, data={})
-    data = {}
-    if response.status_code == 200:
-        data = json.loads(response.content)
-    return data
+    for _ in range(RATE_LIMIT_ATTEMPTS):
+        response = binance_client.get(url)
+        if response.status_code not in (418, 429):
+            break
+    response.raise_for_status()
+    return json.loads(response.content)
 
 
-def get_gaps(coin):
+def get_gaps(coin_list):
     """
-    Runs a query to obtain the gaps in the form of a list of
-    (start_time, end_time)
+    Runs a single query over the minute tables of all the coins to obtain
+    their gaps, in the form of a {coin: [(start_time, end_time), ...]} dict
     """
-    gaplist = []
-
-    # Identify the "current timestamp - data start" gap
+    end_time = round(time.time() // 60) * 60000
     query_job = bq_client.query(
-        f"SELECT MAX(open_time) FROM `{PROJECT}.binance_data.minute_{coin.lower()}`"
+        "WITH minutes AS ("
+        "    SELECT"
+        "        UPPER(_TABLE_SUFFIX) AS coin,"
+        "        open_time,"
+        "        LAG(open_time) OVER("
+        "            PARTITION BY _TABLE_SUFFIX ORDER BY open_time"
+        "        ) AS previous_open_time"
+        f"    FROM `{PROJECT}.binance_data.minute_*`"
+        "    WHERE _TABLE_SUFFIX IN UNNEST(@suffixes)"
+        ")"
+        # Gaps inside the tables
+        " SELECT coin, previous_open_time AS start_time, open_time AS end_time"
+        " FROM minutes"
+        " WHERE open_time - previous_open_time > 60000 AND open_time > @start_time"
+        # Gap between the latest minute and the current timestamp
+        " UNION ALL"
+        " SELECT coin, MAX(open_time), @end_time FROM minutes GROUP BY coin"
+        # Gap between the start date and the first minute
+        " UNION ALL"
+        " SELECT coin, @start_time, MIN(open_time) FROM minutes GROUP BY coin"
+        " HAVING MIN(open_time) > @start_time"
+        " ORDER BY coin, start_time DESC",
+        job_config=bigquery.QueryJobConfig(
+            query_parameters=[
+                bigquery.ArrayQueryParameter(
+                    "suffixes", "STRING", [coin.lower() for coin in coin_list]
+                ),
+                bigquery.ScalarQueryParameter("start_time", "INT64", START_TIME),
+                bigquery.ScalarQueryParameter("end_time", "INT64", end_time),
+            ]
+        ),
     )
+    gaps = {coin: [] for coin in coin_list}
     for row in query_job.result():
-        if row[0] is not None:
-            gaplist = [(row[0], round(time.time() // 60) * 60000)]
+        gaps[row["coin"]].append((row["start_time"], row["end_time"]))
 
-    # Get all the gaps in the table
-    query_job = bq_client.query(
-        "SELECT open_time, previous_open_time FROM ("
-        f"    SELECT "
-        "       open_time, "
-        "       LAG(open_time) OVER(ORDER BY open_time) AS previous_open_time"
-        "     FROM "
-        f"        `{PROJECT}.binance_data.minute_{coin.lower()}` "
-        ") WHERE "
-        f" open_time - previous_open_time > 60000 AND open_time > {START_TIME}"
-        " ORDER BY open_time DESC"
-    )
-    for row in query_job.result():
-        gaplist.append((row["previous_open_time"], row["open_time"]))
+    # In case the tables were empty
+    for coin, gaplist in gaps.items():
+        if not gaplist:
+            gaplist.append((START_TIME, end_time))
+    return gaps
 
-    # Check if the data goes back to the start date
-    query_job = bq_client.query(
-        f"SELECT MIN(open_time) FROM `{PROJECT}.binance_data.minute_{coin.lower()}`"
-    )
-    for row in query_job.result():
-        if row[0] is not None and row[0] > START_TIME:
-            gaplist.append((row[0], START_TIME))
 
-    # In case the tables were empty
-    if not gaplist:
-        gaplist = [(START_TIME, round(time.time() // 60) * 60000)]
+def find_gaps(open_times, start_time, end_time):
+    """
+    Same gaps as get_gaps, for the sorted open times of the klines of a coin
+    """
+    open_times = np.asarray(open_times, dtype=np.int64)
+    if open_times.size == 0:
+        return [(start_time, end_time)]
+    steps = np.flatnonzero(
+        (np.diff(open_times) > 60000) & (open_times[1:] > start_time)
+    )
+    gaplist = [(int(open_times[-1]), end_time)]
+    gaplist += [
+        (int(open_times[step]), int(open_times[step + 1])) for step in steps[::-1]
+    ]
+    if open_times[0] > start_time:
+        gaplist.append((start_time, int(open_times[0])))
     return gaplist
 
 
-def fill_between(coin, start, end):
+def get_local_gaps(coin_list, data_dir):
+    """
+    Gaps of the kline files of the data directory (see backtest.load_klines),
+    found without querying BigQuery
+    """
+    end_time = round(time.time() // 60) * 60000
+    gaps = {}
+    for coin in coin_list:
+        if glob.glob(os.path.join(data_dir, f"{coin}USDT*.csv")):
+            open_times = load_kline_files(data_dir, coin)[0]
+        else:
+            open_times = []
+        gaps[coin] = find_gaps(open_times, START_TIME, end_time)
+    return gaps
+
+
+def plan_windows(coin, start, end):
+    """
+    Split the interval between the start and end timestamps in windows of at
+    most WINDOW_MINUTES minutes
+    """
+    keypoints = list(range(start, end, WINDOW_MINUTES * 60000)) + [end]
+    return [
+        (coin, r_start, r_end - 60000)
+        for r_start, r_end in zip(keypoints, keypoints[1:])
+    ]
+
+
+def fill_window(coin, start, end, staging, store=None):
     """
     Gather the information from the binance API to fill the table of the
-    provided coin between the start and end timestamps.
+    provided coin between the start and end timestamps of a window, and stage
+    it for the next load job of that table. The klines are also written in
+    the local kline store, if provided. Returns whether klines were staged.
     """
-    keypoints = list(range(start, end, 500 * 60000)) + [end]
-    for r_start, r_end in zip(keypoints, keypoints[1:]):
-        r_end -= 60000
-        data = get_klines(coin + "USDT", start_time=r_start, end_time=r_end)
-        if data:
-            insert_data(coin, data)
+    data = get_klines(coin + "USDT", start_time=start, end_time=end)
+    if not data:
+        return False
+    staging[coin].add(data)
+    if store is not None:
+        store.write(coin + "USDT", data)
+    return True
 
 
 def deduplicate(coin) -> None:
@@ -137,22 +209,104 @@ def deduplicate(coin) -> None:
     bq_client.query(f"CALL `{PROJECT}.binance_data.deduplicate_{coin.lower()}`();")
 
 
+def load_checkpoint(checkpoint_file):
+    """
+    Read the windows planned by a previous run and the ones it completed.
+    The first line of the file holds the plan, each following line a window
+    that was filled.
+    """
+    if not os.path.exists(checkpoint_file):
+        return None, set()
+    with open(checkpoint_file, "r") as file:
+        windows = [tuple(window) for window in json.loads(file.readline())["plan"]]
+        done = set()
+        for line in file:
+            try:
+                done.add(tuple(json.loads(line)["done"]))
+            except ValueError:
+                break  # line truncated by an interruption
+    return windows, done
+
+
 def main():
     """
     Fill each coin's table with the minute information provided by the binance
     API between now and the START_TIME defined in this script.
     """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--staging-dir", default="staging")
+    parser.add_argument(
+        "--data-dir",
+        help="find the gaps in local kline files (as read by backtest.py)"
+        " instead of querying the tables",
+    )
+    parser.add_argument(
+        "--store-dir", help="also write the klines in a local kline store"
+    )
+    args = parser.parse_args()
+
+    windows, done = load_checkpoint(args.checkpoint)
+    if windows is None:
+        with open("coin.lst", "r") as file:
+            coin_list = [line.strip() for line in file if line.strip()]
+        if args.data_dir is None:
+            gaps = get_gaps(coin_list)
+        else:
+            gaps = get_local_gaps(coin_list, args.data_dir)
+        windows = []
+        for coin in coin_list:
+            print(f"Found {len(gaps[coin])} gaps for {coin}")
+            for start, end in gaps[coin]:
+                windows += plan_windows(coin, start, end)
+        with open(args.checkpoint, "w") as file:
+            file.write(json.dumps({"plan": windows}) + "\n")
+    else:
+        print(f"Resuming from {args.checkpoint}: {len(done)}/{len(windows)} done")
+
+    # A connection for each worker, instead of the default pool of the client
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=args.workers)
+    binance_client.session.mount("https://", adapter)
+    binance_client.session.mount("http://", adapter)
+    set_weight_limit()
+    os.makedirs(args.staging_dir, exist_ok=True)
+    staging = {
+        coin: KlineStaging(
+            bq_client,
+            f"{PROJECT}.binance_data.minute_{coin.lower()}",
+            os.path.join(args.staging_dir, f"{coin}.ndjson"),
+        )
+        for coin in {window[0] for window in windows}
+    }
+    store = KlineStore(args.store_dir) if args.store_dir else None
+    remaining = [window for window in windows if tuple(window) not in done]
+    with open(args.checkpoint, "a") as checkpoint:
+        with concurrent.futures.ThreadPoolExecutor(args.workers) as executor:
+            futures = {
+                executor.submit(fill_window, *window, staging, store): window
+                for window in remaining
+            }
+            for count, future in enumerate(
+                concurrent.futures.as_completed(futures), 1
+            ):
+                try:
+                    staged = future.result()
+                except Exception:
+                    # The run stops on the first failure, to be resumed
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                # The windows without klines are fetched again on resume
+                if staged:
+                    checkpoint.write(json.dumps({"done": futures[future]}) + "\n")
+                    checkpoint.flush()
+                print(f"{count}/{len(remaining)} windows fetched", end="\r")
 
-    with open("coin.lst", "r") as file:
-        coin = file.readline()
-        while coin:
-            coin = coin[:-1]
-            print(f"\n\nLoading data for {coin}")
-            gaps = get_gaps(coin)
-            print(f"Found {len(gaps)} gaps")
-            for start, end in gaps:
-                fill_between(coin, start, end)
-            coin = file.readline()
+    for coin in sorted(staging):
+        staging[coin].flush()
+        deduplicate(coin)
+    os.remove(args.checkpoint)
 
 
 if __name__ == "__main__":
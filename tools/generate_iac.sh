@@ -49,4 +49,9 @@ for d in ../iac/functions/*/ ; do
 
 done
 
+# Modules of the bot also used by the other functions
+for shared_module in binanceclient.py klinestaging.py klinestore.py weightbudget.py; do
+    cp ../iac/functions/make_predictions/$shared_module ../iac/functions/build/load_data/;
+done
+
 );
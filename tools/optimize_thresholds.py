@@ -0,0 +1,134 @@
+"""
+This script recomputes the purchase thresholds of the coins locally, from
+minute klines and the exported models, instead of the update_threshold
+procedures scanning vw_stats_<coin>. Each threshold is chosen like these
+procedures do, over the estimations of the last days and whether the price
+then rose above the take profit without falling below the stop loss within
+the trade duration. The thresholds are then evaluated with the backtest of
+backtest.py over the same days, with the open positions and the order mode
+of the bot.
+
+The thresholds are written in a JSON file {coin: threshold}, which
+backtest.py --thresholds reads, and, with --upload, in the bot bucket, where
+the bot picks them up when the file changes:
+
+    python optimize_thresholds.py --data-dir klines --models-dir models --upload
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from google.cloud import storage
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "iac", "functions", "make_predictions")
+)
+# pylint: disable=wrong-import-position
+from backtest import (
+    PARAMETER_FILE,
+    align,
+    estimate_all,
+    read_klines,
+    report,
+    simulate,
+)
+from pricehistory import HISTORY_LENGTH
+from strategy import best_threshold
+
+# Name of the file in the bot bucket, read by BinanceBot.update_thresholds
+THRESHOLDS_BLOB = "thresholds.json"
+
+
+def wins(prices, take_profit: float, stop_loss: float, horizon: int):
+    """
+    Whether the maximum of the prices of the horizon following each minute
+    (the minute included) is above the take profit and their minimum above
+    the stop loss, as the labels of the training views. The last minutes,
+    without a whole horizon, are False.
+    """
+    result = np.zeros(prices.size, dtype=bool)
+    if prices.size <= horizon:
+        return result
+    windows = sliding_window_view(prices, horizon + 1)
+    starts = prices[: windows.shape[0]]
+    result[: windows.shape[0]] = (windows.max(axis=1) / starts > take_profit) & (
+        windows.min(axis=1) / starts > stop_loss
+    )
+    return result
+
+
+def main():
+    """
+    Compute the thresholds of the coins of the parameter file over their last
+    days of klines
+    """
+    with open(PARAMETER_FILE, "r") as file:
+        parameters = json.load(file)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data-dir")
+    source.add_argument("--store-dir")
+    parser.add_argument("--models-dir", required=True)
+    parser.add_argument("--coins", nargs="+", default=parameters["coin_list"])
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--output", default="thresholds.json")
+    parser.add_argument("--upload", action="store_true")
+    args = parser.parse_args()
+
+    minutes, prices, _ = align(read_klines(args.coins, args.data_dir, args.store_dir))
+    horizon = parameters["max_trade_duration_seconds"] // 60
+    # The first minutes only fill the history of the first estimations
+    first = max(prices.shape[0] - args.days * 1440 - horizon - HISTORY_LENGTH, 0)
+    minutes, prices = minutes[first:], prices[first:]
+    estimations = estimate_all(
+        prices, args.coins, args.models_dir, parameters["indexes"]
+    )
+    estimations[prices.shape[0] - horizon :] = np.nan
+    thresholds = {}
+    for column, coin in enumerate(args.coins):
+        threshold = best_threshold(
+            estimations[:, column],
+            wins(
+                prices[:, column],
+                parameters["take_profit"],
+                parameters["stop_loss"],
+                horizon,
+            ),
+        )
+        if threshold is None:
+            print(f"No estimation of {coin} above the thresholds, skipped")
+            continue
+        thresholds[coin] = threshold
+    print(json.dumps(thresholds, indent=4))
+    # The coins without a threshold are not traded
+    trades = simulate(
+        prices,
+        estimations,
+        np.array([thresholds.get(coin, np.inf) for coin in args.coins]),
+        (
+            parameters["take_profit"],
+            parameters["stop_loss"],
+            parameters["max_trade_duration_seconds"],
+        ),
+        args.fee,
+        parameters["max_open_positions"],
+        parameters["order_mode"] == "bracket",
+    )
+    print(json.dumps(report(args.coins, minutes, trades), indent=4))
+    with open(args.output, "w") as file:
+        json.dump(thresholds, file, indent=4)
+    if args.upload:
+        storage.Client(project=parameters["project"]).bucket(
+            parameters["bucket"]
+        ).blob(THRESHOLDS_BLOB).upload_from_string(
+            json.dumps(thresholds), content_type="application/json"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+import unittest
+
+import numpy as np
+
+from optimize_thresholds import wins
+
+
+class TestCases(unittest.TestCase):
+    def test_wins(self):
+        prices = np.array([100.0, 100.0, 101.5, 97.0, 100.0, 101.2, 101.0])
+        result = wins(prices, 1.01, 0.98, 2)
+        # The second minute reaches the take profit but also the stop loss,
+        # the third neither, and the last two have no whole horizon
+        self.assertEqual(
+            result.tolist(), [True, False, False, True, True, False, False]
+        )
+        self.assertEqual(wins(prices[:2], 1.01, 0.98, 2).tolist(), [False, False])
+
+
+if __name__ == "__main__":
+    unittest.main()
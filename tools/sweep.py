@@ -0,0 +1,212 @@
+"""
+This script evaluates a grid of take profit, stop loss, trade duration and
+threshold combinations with the backtest of backtest.py, over the same kline
+files and exported models, and writes the combinations ranked by profit in a
+CSV file.
+
+The estimations of the models are computed once. They are saved with the
+aligned prices in .npy files, which the processes of the pool map in memory
+instead of receiving copies. Each task replays the signal of one threshold
+with all the exit rules of one duration:
+
+    python sweep.py --data-dir klines --models-dir models \\
+        --take-profits 1.005 1.01 1.02 --stop-losses 0.97 0.98 0.99 \\
+        --durations 1800 3600 7200 --thresholds 0.5 0.55 0.6 0.65 0.7
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), "..", "iac", "functions", "make_predictions")
+)
+# pylint: disable=wrong-import-position
+from backtest import (
+    PARAMETER_FILE,
+    align,
+    estimate_all,
+    parse_thresholds,
+    read_klines,
+    replay,
+    report,
+)
+from strategy import best_signal
+
+COLUMNS = [
+    "rank",
+    "take_profit",
+    "stop_loss",
+    "max_trade_duration_seconds",
+    "threshold",
+    "trade_count",
+    "pnl_percent",
+    "win_rate",
+    "mean_duration_minutes",
+    "max_duration_minutes",
+]
+
+_shared = {}
+
+
+def _init_worker(work_dir: str, coin_list):
+    """Map the arrays saved by the main process in the worker"""
+    for name in ("minutes", "prices", "estimations"):
+        _shared[name] = np.load(os.path.join(work_dir, f"{name}.npy"), mmap_mode="r")
+    _shared["coin_list"] = coin_list
+
+
+def _evaluate(task):
+    """
+    Replay the signal of a set of thresholds with a list of exit rules and
+    return a result row for each of them
+    """
+    threshold, thresholds, exit_rules, fee, max_positions, bracket = task
+    prices = _shared["prices"]
+    estimations = _shared["estimations"]
+    signal = best_signal(np.nan_to_num(estimations, nan=-np.inf), thresholds)
+    rows = []
+    for exit_rule in exit_rules:
+        trades = replay(
+            prices,
+            estimations,
+            thresholds,
+            signal,
+            exit_rule,
+            fee,
+            max_positions,
+            bracket,
+        )
+        summary = report(_shared["coin_list"], _shared["minutes"], trades)
+        rows.append(
+            {
+                "take_profit": exit_rule[0],
+                "stop_loss": exit_rule[1],
+                "max_trade_duration_seconds": exit_rule[2],
+                "threshold": threshold,
+                **{name: summary[name] for name in COLUMNS[5:]},
+            }
+        )
+    return rows
+
+
+def sweep(
+    work_dir: str,
+    coin_list,
+    grid,
+    fee: float,
+    max_positions: int = 1,
+    bracket: bool = False,
+    processes=None,
+):
+    """
+    Evaluate all the combinations of the grid, a dict with lists of
+    take_profit, stop_loss, max_trade_duration_seconds and thresholds values
+    (a threshold being a value or a JSON file of parse_thresholds), over the
+    arrays of the work directory, with the max_positions and the order mode
+    of the bot. Returns the result rows ranked by profit.
+    """
+    tasks = [
+        (
+            threshold,
+            parse_thresholds(threshold, coin_list),
+            list(itertools.product(grid["take_profit"], grid["stop_loss"], [duration])),
+            fee,
+            max_positions,
+            bracket,
+        )
+        for threshold, duration in itertools.product(
+            grid["thresholds"], grid["max_trade_duration_seconds"]
+        )
+    ]
+    with multiprocessing.Pool(
+        processes, initializer=_init_worker, initargs=(work_dir, coin_list)
+    ) as pool:
+        rows = [row for rows in pool.imap_unordered(_evaluate, tasks) for row in rows]
+    rows.sort(key=lambda row: (-row["pnl_percent"], -row["trade_count"]))
+    for rank, row in enumerate(rows, 1):
+        row["rank"] = rank
+    return rows
+
+
+def main():
+    """
+    Sweep the grid over the kline files for the coins of the parameter file
+    """
+    with open(PARAMETER_FILE, "r") as file:
+        parameters = json.load(file)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--data-dir")
+    source.add_argument("--store-dir")
+    parser.add_argument("--models-dir", required=True)
+    parser.add_argument("--thresholds", nargs="+", required=True)
+    parser.add_argument("--coins", nargs="+", default=parameters["coin_list"])
+    parser.add_argument(
+        "--take-profits", nargs="+", type=float, default=[parameters["take_profit"]]
+    )
+    parser.add_argument(
+        "--stop-losses", nargs="+", type=float, default=[parameters["stop_loss"]]
+    )
+    parser.add_argument(
+        "--durations",
+        nargs="+",
+        type=int,
+        default=[parameters["max_trade_duration_seconds"]],
+    )
+    parser.add_argument(
+        "--max-open-positions", type=int, default=parameters["max_open_positions"]
+    )
+    parser.add_argument(
+        "--order-mode", choices=["market", "bracket"], default=parameters["order_mode"]
+    )
+    parser.add_argument("--fee", type=float, default=0.001)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--output", default="sweep_results.csv")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    minutes, prices, _ = align(read_klines(args.coins, args.data_dir, args.store_dir))
+    estimations = estimate_all(
+        prices, args.coins, args.models_dir, parameters["indexes"]
+    )
+    with tempfile.TemporaryDirectory() as work_dir:
+        for name, array in (
+            ("minutes", minutes),
+            ("prices", prices),
+            ("estimations", estimations),
+        ):
+            np.save(os.path.join(work_dir, f"{name}.npy"), array)
+        del prices, estimations
+        rows = sweep(
+            work_dir,
+            args.coins,
+            {
+                "take_profit": args.take_profits,
+                "stop_loss": args.stop_losses,
+                "max_trade_duration_seconds": args.durations,
+                "thresholds": args.thresholds,
+            },
+            args.fee,
+            args.max_open_positions,
+            args.order_mode == "bracket",
+            args.processes,
+        )
+    with open(args.output, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"{len(rows)} combinations written in {args.output}")
+    for row in rows[: args.top]:
+        print(json.dumps({name: row[name] for name in COLUMNS}))
+
+
+if __name__ == "__main__":
+    main()